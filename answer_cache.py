@@ -0,0 +1,213 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+from embedding_cache import Overloaded
+from query_cache import acurrent_graph_version, current_graph_version, get_query_cache
+from telemetry import current_trace, record_cache, set_attribute, span
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Semantic answer cache settings
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+# Minimum cosine similarity between two questions for one to reuse the other's answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+
+class SemanticAnswerCache:
+    """In-process cache of LLM answers, looked up by question embedding.
+
+    Question vectors are kept normalised in one preallocated matrix, so a
+    lookup is a single matrix-vector product. An answer is reused for a new
+    question whose cosine similarity to a cached one is at least
+    ``threshold``, asked with the same filters against the same graph
+    version. Entries are evicted least recently used first and expire after
+    ``ttl`` seconds; a new graph version drops every entry.
+    """
+
+    def __init__(self, threshold: float = None, max_entries: int = None, ttl: float = None):
+        self.threshold = ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+        self.max_entries = max_entries or ANSWER_CACHE_MAX_ENTRIES
+        self.ttl = ANSWER_CACHE_TTL if ttl is None else ttl
+        self.version = None
+        self.stats = {"hits": 0, "misses": 0}
+        self._vectors = None
+        # numpy is imported on first use, so importing this module stays cheap
+        import numpy as np
+
+        self._occupied = np.zeros(self.max_entries, dtype=bool)
+        # slot -> {"scope", "answer", "question", "created"}, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def scope(filters: dict) -> str:
+        return json.dumps(sorted(filters.items()))
+
+    @staticmethod
+    def _normalise(embedding):
+        import numpy as np
+
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, version: str):
+        if version != self.version:
+            self._entries.clear()
+            self._occupied[:] = False
+            self.version = version
+
+    def _evict(self, slot: int):
+        del self._entries[slot]
+        self._occupied[slot] = False
+
+    def lookup(self, embedding, version: str, **filters):
+        """Return the cached answer for the most similar question above the threshold, or None."""
+        import numpy as np
+
+        vector = self._normalise(embedding)
+        scope = self.scope(filters)
+        answer = None
+        with self._lock:
+            self._check_version(version)
+            if self._entries and self._vectors is not None and self._vectors.shape[1] == vector.shape[0]:
+                scores = self._vectors @ vector
+                scores[~self._occupied] = -np.inf
+                now = time.time()
+                matches = np.flatnonzero(scores >= self.threshold)
+                # Most similar first; skip (and drop) expired entries
+                for slot in matches[np.argsort(-scores[matches])].tolist():
+                    entry = self._entries[slot]
+                    if now - entry["created"] > self.ttl:
+                        self._evict(slot)
+                        continue
+                    if entry["scope"] == scope:
+                        self._entries.move_to_end(slot)
+                        answer = entry["answer"]
+                        set_attribute("answer_cache_similarity", round(float(scores[slot]), 4))
+                        break
+            self.stats["hits" if answer is not None else "misses"] += 1
+        record_cache("answer", answer is not None)
+        return answer
+
+    def store(self, embedding, version: str, question: str, answer: str, **filters):
+        """Cache the answer to a question asked against a graph version."""
+        import numpy as np
+
+        vector = self._normalise(embedding)
+        with self._lock:
+            self._check_version(version)
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._entries.clear()
+                self._occupied[:] = False
+            free = np.flatnonzero(~self._occupied)
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = next(iter(self._entries))
+                self._evict(slot)
+            self._vectors[slot] = vector
+            self._occupied[slot] = True
+            self._entries[slot] = {
+                "scope": self.scope(filters),
+                "question": question,
+                "answer": answer,
+                "created": time.time(),
+            }
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._occupied[:] = False
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Return the process-wide answer cache, or None when it is disabled."""
+    global _answer_cache
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache()
+        return _answer_cache
+
+
+def _remember(cache, embedding, version, question, **filters):
+    def remember(answer: str):
+        # Answers given without context (retrieval failed) are not reused
+        current = current_trace()
+        if current is not None and "retrieval_error" in current.attributes:
+            return
+        cache.store(embedding, version, question, answer, **filters)
+    return remember
+
+
+def _skip_cache(error: Exception):
+    # Without the question embedding or the graph version there is nothing safe
+    # to look up or store; answer the question uncached instead of failing it
+    logger.warning(f"Answer cache skipped: {error}")
+    set_attribute("answer_cache_error", str(error))
+    return None, lambda answer: None
+
+
+def lookup_answer(embedder, question: str, **filters):
+    """Look up a cached answer to a question.
+
+    Returns ``(answer, remember)``: the cached answer or None, and a function
+    that caches a freshly generated answer for this question. If the question
+    cannot be embedded or the graph version read, the cache is skipped.
+    """
+    cache = get_answer_cache()
+    if cache is None:
+        return None, lambda answer: None
+    with span("answer_cache"):
+        try:
+            embedding = get_query_cache().embed_query(embedder, question)
+            version = current_graph_version()
+        except Exception as e:
+            return _skip_cache(e)
+        answer = cache.lookup(embedding, version, **filters)
+    return answer, _remember(cache, embedding, version, question, **filters)
+
+
+async def alookup_answer(embedder, question: str, driver=None, **filters):
+    """Async version of lookup_answer; the graph version is read with ``driver``
+    (default the shared async driver).
+
+    Overloaded (a full embedding queue) is raised rather than skipping the
+    cache, so the request is rejected instead of embedding the question again.
+    """
+    cache = get_answer_cache()
+    if cache is None:
+        return None, lambda answer: None
+    with span("answer_cache"):
+        try:
+            embedding = await get_query_cache().aembed_query(embedder, question)
+            version = await acurrent_graph_version(driver)
+        except Overloaded:
+            raise
+        except Exception as e:
+            return _skip_cache(e)
+        answer = cache.lookup(embedding, version, **filters)
+    return answer, _remember(cache, embedding, version, question, **filters)
@@ -1,23 +1,34 @@
 import streamlit as st
-from neo4j import GraphDatabase
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
 from dotenv import load_dotenv
+from answer_cache import lookup_answer
+from chat_model import CONVERSATION_PROMPT_TEMPLATE, get_llm, stream_with_timings
+from conversation import Conversation
+from database import read_session, warm_up
+from embedding_cache import get_embeddings
+from graph_expansion import expand_routes
+from query_cache import get_query_cache
+from retrieval import format_context, retrieve_records
+from telemetry import METRICS_PORT, record_tokens, set_attribute, span, start_metrics_server, trace
 import os
 import logging
+import time
 
-# Configure logging
+# Configure logging (a no-op on reruns, once the root logger has a handler)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Streamlit re-runs this script on every interaction, so everything expensive
+# below is built once per process in a st.cache_resource function
+
 # Load environment variables
 load_dotenv()
 
 # Initialize session state
 if "messages" not in st.session_state:
     st.session_state.messages = []
+# Bounded history and remembered entities, for follow-up questions
+if "conversation" not in st.session_state:
+    st.session_state.conversation = Conversation()
 
 # Set page config
 st.set_page_config(
@@ -26,99 +37,188 @@ st.set_page_config(
     layout="wide"
 )
 
-# Neo4j connection details
-uri = os.getenv("NEO4J_URI")
-username = os.getenv("NEO4J_USERNAME")
-password = os.getenv("NEO4J_PASSWORD")
+@st.cache_resource
+def connect_to_neo4j():
+    """Create the shared Neo4j driver once per process and check connectivity."""
+    return warm_up()
+
+try:
+    connect_to_neo4j()
+except Exception as e:
+    logger.error(f"Error connecting to Neo4j: {e}")
+    st.error("Could not connect to Neo4j. Check the connection settings in .env.")
+
+@st.cache_resource
+def serve_metrics():
+    """Expose Prometheus metrics on METRICS_PORT once per process, if configured."""
+    return start_metrics_server() if METRICS_PORT else None
+
+serve_metrics()
+
+@st.cache_resource
+def get_rag_components():
+    """Build the embedding client, prompt and RAG chain once per process.
+
+    LangChain is imported here, on the first question, rather than when the
+    page first loads.
+    """
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
 
-# Initialize OpenAI components
-embeddings = OpenAIEmbeddings()
-llm = ChatOpenAI(model="gpt-4-turbo-preview")
+    rag_prompt = ChatPromptTemplate.from_template(CONVERSATION_PROMPT_TEMPLATE)
+    # The context is retrieved before the chain runs so that retrieval and
+    # generation can be timed separately
+    rag_chain = rag_prompt | get_llm() | StrOutputParser()
+    return get_embeddings(), rag_prompt, rag_chain
 
-def get_relevant_context(question: str) -> str:
-    """Retrieve relevant context from Neo4j based on the question."""
+def get_relevant_context(question: str, category: str = None,
+                         min_price: float = None, max_price: float = None,
+                         conversation: Conversation = None) -> str:
+    """Retrieve relevant context from Neo4j based on the question.
+
+    A follow-up reuses the entities retrieved for the previous question.
+    """
     try:
-        # Connect to Neo4j
-        driver = GraphDatabase.driver(uri, auth=(username, password))
-        
-        with driver.session() as session:
-            # Get question embedding
-            question_embedding = embeddings.embed_query(question)
-            
-            # Query Neo4j for relevant context
-            result = session.run("""
-                MATCH (p:Product)
-                WHERE p.description_embedding IS NOT NULL
-                WITH p, 
-                     reduce(s = 0, i in range(0, size(p.description_embedding)-1) | 
-                           s + p.description_embedding[i] * $embedding[i]) as similarity
-                ORDER BY similarity DESC
-                LIMIT 3
-                OPTIONAL MATCH (p)<-[:SUPPLIES]-(s:Supplier)
-                OPTIONAL MATCH (p)-[:STORED_AT]->(w:Warehouse)
-                RETURN p.name as product_name, 
-                       p.description as product_description,
-                       collect(DISTINCT {type: 'SUPPLIES', name: s.name}) as suppliers,
-                       collect(DISTINCT {type: 'STORED_AT', name: w.name, location: w.location}) as warehouses
-            """, embedding=question_embedding)
-            
-            # Format the context
-            context = []
-            for record in result:
-                context.append(f"Product: {record['product_name']}")
-                context.append(f"Description: {record['product_description']}")
-                if record['suppliers']:
-                    for supplier in record['suppliers']:
-                        if supplier['name']:
-                            context.append(f"Supplied by: {supplier['name']}")
-                if record['warehouses']:
-                    for warehouse in record['warehouses']:
-                        if warehouse['name']:
-                            context.append(f"Stored at: {warehouse['name']} in {warehouse['location']}")
-                context.append("---")
-            
-            return "\n".join(context) if context else "No relevant context found."
+        if conversation is not None and conversation.reusable():
+            with span("retrieval"):
+                return conversation.reused_context(question)
+
+        cache = get_query_cache()
+        retrieved = {}
+
+        def retrieve():
+            # Get question embedding (cached per normalised question)
+            embeddings, _, _ = get_rag_components()
+            with span("embed_query"):
+                question_embedding = cache.embed_query(embeddings, question)
+
+            # Borrow a connection from the shared driver's pool
+            with read_session() as session:
+                # Find the closest matches with the configured retrieval backend, plus
+                # keyword matches when the backend does not fuse them into its search
+                records = retrieve_records(
+                    session,
+                    question_embedding,
+                    question,
+                    category=category,
+                    min_price=min_price,
+                    max_price=max_price
+                )
+                # Follow warehouse routes for routing and logistics questions
+                records = records + expand_routes(session, records, question)
+            retrieved["records"] = records
+
+            with span("format_context"):
+                return format_context(records, question)
+
+        # Reuse the context of an identical recent question on unchanged data
+        with span("retrieval"):
+            context = cache.get_context(
+                question,
+                retrieve,
+                category=category,
+                min_price=min_price,
+                max_price=max_price
+            )
+        if conversation is not None:
+            conversation.remember_retrieval(context, retrieved.get("records"))
+        return context
             
     except Exception as e:
         logger.error(f"Error retrieving context: {e}")
+        set_attribute("retrieval_error", str(e))
         return "Error retrieving context."
-    finally:
-        if 'driver' in locals():
-            driver.close()
 
-# Define the prompt template
-template = """You are a helpful supply chain assistant. Use the following context to answer the question.
-If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.
+def ask_question(question: str, conversation: Conversation = None, **filters) -> str:
+    """Ask a question about the supply chain data, as the next turn of a conversation."""
+    conversation = conversation or Conversation()
+    with trace("ask") as current:
+        try:
+            embeddings, _, rag_chain = get_rag_components()
+            # Follow-ups are rewritten into standalone questions for retrieval and caching
+            standalone = conversation.prepare(question)
+            # Reuse the answer to a near-identical question on unchanged data
+            answer, remember = lookup_answer(embeddings, standalone, **filters)
+            if answer is None:
+                context = get_relevant_context(standalone, conversation=conversation, **filters)
+                with span("llm"):
+                    answer = rag_chain.invoke(
+                        {"context": context, "question": question, "history": conversation.history_text()})
+                remember(answer)
+            conversation.add_turn(question, answer)
+            return answer
+        except Exception as e:
+            logger.error(f"Error processing question: {e}")
+            current.error = str(e)
+            return f"Error processing question: {e}"
 
-Current context:
-{context}
+def stream_answer(question: str, timings: dict, conversation: Conversation, **filters):
+    """Stream the answer to a question token by token, recording its latency in timings.
 
-Question: {question}
+    The caller adds the turn to the conversation once the answer is shown.
+    """
+    start = time.perf_counter()
+    with trace("ask") as current:
+        try:
+            embeddings, rag_prompt, rag_chain = get_rag_components()
+            # Follow-ups are rewritten into standalone questions for retrieval and caching
+            standalone = conversation.prepare(question)
+            # Reuse the answer to a near-identical question on unchanged data
+            answer, remember = lookup_answer(embeddings, standalone, **filters)
+            if answer is not None:
+                timings["time_to_first_token"] = timings["total_latency"] = time.perf_counter() - start
+                timings["cached"] = True
+                current.attributes.update(timings)
+                yield answer
+            else:
+                context = get_relevant_context(standalone, conversation=conversation, **filters)
+                inputs = {"context": context, "question": question, "history": conversation.history_text()}
+                record_tokens("prompt", rag_prompt.format(**inputs))
 
-Answer:"""
+                answer = ""
+                with span("llm"):
+                    for chunk in stream_with_timings(rag_chain, inputs, timings, start=start):
+                        answer += chunk
+                        yield chunk
+                record_tokens("completion", answer)
+                remember(answer)
+                current.attributes.update(timings)
+                logger.info(
+                    f"Answered in {timings['total_latency']:.2f}s "
+                    f"(first token after {timings.get('time_to_first_token', timings['total_latency']):.2f}s)"
+                )
+        except Exception as e:
+            logger.error(f"Error processing question: {e}")
+            current.error = str(e)
+            yield f"Error processing question: {e}"
 
-prompt = ChatPromptTemplate.from_template(template)
+    # Keep the breakdown for the sidebar debug panel
+    st.session_state.last_trace = current.to_dict()
 
-# Create the RAG chain
-rag_chain = (
-    {
-        "context": lambda x: get_relevant_context(x["question"]),
-        "question": lambda x: x["question"]
-    }
-    | prompt
-    | llm
-    | StrOutputParser()
-)
+def format_timings(timings: dict) -> str:
+    """Describe the latency of an answer for display under the message."""
+    if "total_latency" not in timings:
+        return ""
+    first_token = timings.get("time_to_first_token", timings["total_latency"])
+    cached = " (cached answer)" if timings.get("cached") else ""
+    return f"First token after {first_token:.2f}s · answered in {timings['total_latency']:.2f}s{cached}"
 
-def ask_question(question: str) -> str:
-    """Ask a question about the supply chain data."""
-    try:
-        # Get response from RAG chain
-        response = rag_chain.invoke({"question": question})
-        return response
-    except Exception as e:
-        logger.error(f"Error processing question: {e}")
-        return f"Error processing question: {e}"
+def render_debug_panel(panel):
+    """Show the per-stage breakdown of the last answer in the given placeholder."""
+    with panel.container():
+        with st.expander("Debug: last question"):
+            last_trace = st.session_state.get("last_trace")
+            if last_trace:
+                st.write(f"Total: {last_trace['total_seconds'] * 1000:.0f} ms")
+                st.table([
+                    {"stage": s["stage"], "ms": round(s["seconds"] * 1000, 1), "error": s["error"] or ""}
+                    for s in last_trace["spans"]
+                ])
+                st.json(last_trace["attributes"])
+                if last_trace["error"]:
+                    st.error(last_trace["error"])
+            else:
+                st.write("Ask a question to see its timings.")
 
 # Streamlit UI
 st.title("📦 Supply Chain RAG Assistant")
@@ -145,10 +245,20 @@ with st.sidebar:
     - Tell me about the supply chain for tablets
     """)
 
+    st.header("Filters")
+    category_filter = st.text_input("Category", help="Only retrieve products in this category")
+    max_price_filter = st.number_input("Max price", min_value=0.0, value=0.0, help="0 means no limit")
+
+    # Per-stage breakdown of the last answer, filled in at the end of the run
+    # so it shows the question just answered rather than the one before
+    debug_panel = st.empty()
+
 # Display chat messages from history
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
+        if message.get("timings"):
+            st.caption(format_timings(message["timings"]))
 
 # Accept user input
 if prompt := st.chat_input("Ask a question about the supply chain..."):
@@ -158,10 +268,31 @@ if prompt := st.chat_input("Ask a question about the supply chain..."):
     with st.chat_message("user"):
         st.markdown(prompt)
     
-    # Get and display assistant response
+    # Stream the assistant response as tokens arrive
     with st.chat_message("assistant"):
-        response = ask_question(prompt)
-        st.markdown(response)
+        placeholder = st.empty()
+        response = ""
+        timings = {}
+        for chunk in stream_answer(
+            prompt,
+            timings,
+            st.session_state.conversation,
+            category=category_filter or None,
+            max_price=max_price_filter or None
+        ):
+            response += chunk
+            placeholder.markdown(response + "▌")
+        placeholder.markdown(response)
+        if timings:
+            st.caption(format_timings(timings))
+
+    # Only once the answer and its timings are on screen, as adding the turn
+    # can summarise older turns with the chat model
+    if "total_latency" in timings:
+        st.session_state.conversation.add_turn(prompt, response)
     
     # Add assistant response to chat history
-    st.session_state.messages.append({"role": "assistant", "content": response}) 
\ No newline at end of file
+    st.session_state.messages.append({"role": "assistant", "content": response, "timings": timings}) 
+
+# After any answer above, so the panel describes the latest question
+render_debug_panel(debug_panel)
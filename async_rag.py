@@ -0,0 +1,201 @@
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from dotenv import load_dotenv
+from neo4j import unit_of_work
+from neo4j.exceptions import Neo4jError
+from answer_cache import alookup_answer
+from chat_model import PROMPT_TEMPLATE, get_llm
+from database import READ_TIMEOUT, async_read_session, close_async_driver
+from embedding_cache import Overloaded, get_embeddings
+from graph_expansion import (EXPANSION_TIMEOUT, expansion_request, fastest_route_records, route_records,
+                             shortest_route_request)
+from query_cache import get_query_cache
+from retrieval import (TOP_K, KEYWORD_QUERY, format_context, get_retriever, keyword_terms, merge_keyword_matches,
+                       neighbour_params)
+from telemetry import RETRIEVAL_PROFILE, record_query_summary, record_tokens, set_attribute, span, trace
+import asyncio
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Maximum number of questions processed at once by one pipeline
+ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "256"))
+# Maximum number of concurrent chat model calls
+ASYNC_MAX_LLM_CALLS = int(os.getenv("ASYNC_MAX_LLM_CALLS", "32"))
+
+
+async def _read_records(tx, query: str, params: dict):
+    result = await tx.run(query, params)
+    records = [record async for record in result]
+    return records, await result.consume()
+
+
+class AsyncRAGPipeline:
+    """Non-blocking RAG pipeline on the async Neo4j driver and LangChain async runnables.
+
+    The question embedding + vector lookup and the keyword/graph lookup run
+    concurrently, so one event loop can serve many questions in flight.
+    """
+
+    def __init__(self, embeddings=None, llm=None, driver=None, max_in_flight: int = None,
+                 max_llm_calls: int = None):
+        self.embeddings = embeddings or get_embeddings()
+        self.driver = driver
+        self.cache = get_query_cache()
+        self.prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+        self.chain = self.prompt | (llm or get_llm()) | StrOutputParser()
+        self._slots = asyncio.Semaphore(max_in_flight or ASYNC_MAX_IN_FLIGHT)
+        self._llm_slots = asyncio.Semaphore(max_llm_calls or ASYNC_MAX_LLM_CALLS)
+
+    async def embed_query(self, question: str) -> list:
+        """Embed a question, reusing cached query embeddings."""
+        return await self.cache.aembed_query(self.embeddings, question)
+
+    async def _run(self, query: str, params: dict, timeout: float = None) -> list:
+        """Run a query as a managed read transaction (see retrieval.run_query)."""
+        if RETRIEVAL_PROFILE:
+            query = "PROFILE " + query
+        work = unit_of_work(timeout=timeout or READ_TIMEOUT or None)(_read_records)
+        with span("neo4j_query"):
+            async with async_read_session(self.driver) as session:
+                records, summary = await session.execute_read(work, query, params)
+                record_query_summary(summary)
+        return records
+
+    async def vector_lookup(self, question: str, mode: str = None, **filters) -> list:
+        """Embed the question and search the retrieval backend (fused with full-text in hybrid mode)."""
+        with span("embed_query"):
+            embedding = await self.embed_query(question)
+        return await get_retriever().asearch(self._run, embedding, question=question, mode=mode, **filters)
+
+    async def keyword_lookup(self, question: str) -> list:
+        """Find products whose name, category, supplier or warehouse mentions a question term."""
+        terms = keyword_terms(question)
+        if not terms:
+            return []
+        return await self._run(KEYWORD_QUERY, {"terms": terms, "top_k": TOP_K, **neighbour_params()})
+
+    async def lookup_routes(self, request) -> list:
+        """Run a route query; routes never fail retrieval, so errors give no rows."""
+        if not request:
+            return []
+        try:
+            return await self._run(*request, timeout=EXPANSION_TIMEOUT)
+        except Neo4jError as e:
+            logger.warning(f"Route expansion stopped: {e}")
+            set_attribute("expansion_error", str(e))
+            return []
+
+    async def expand_routes(self, records: list, question: str, shortest_rows: list = None) -> list:
+        """Follow warehouse routes from the retrieved records (see graph_expansion.expand_routes).
+
+        ``shortest_rows`` is the fastest route, when it has already been looked up.
+        """
+        shortest = None if shortest_rows is not None else shortest_route_request(records, question)
+        expansion = expansion_request(records, question)
+        if not (shortest or expansion):
+            return fastest_route_records(shortest_rows or [])
+        with span("graph_expansion"):
+            # The fastest-route and expansion queries are independent, so run them concurrently
+            fetched_rows, expansion_rows = await asyncio.gather(self.lookup_routes(shortest),
+                                                                self.lookup_routes(expansion))
+        return fastest_route_records(fetched_rows if shortest_rows is None else shortest_rows) + \
+            route_records(expansion_rows)
+
+    async def retrieve(self, question: str, **filters) -> str:
+        """Run the retrieval lookups concurrently and format the merged context.
+
+        In hybrid mode the vector and full-text matches come from one query;
+        otherwise the vector and keyword lookups run side by side. The fastest
+        route between two warehouses named in the question needs no retrieved
+        records, so it runs alongside them. The route expansion from the
+        retrieved records follows.
+        """
+        fused = get_retriever().fuses_keywords
+        named_route = shortest_route_request([], question)
+        vector_records, keyword_records, route_rows = await asyncio.gather(
+            self.vector_lookup(question, **filters),
+            asyncio.sleep(0, []) if fused else self.keyword_lookup(question),
+            self.lookup_routes(named_route),
+        )
+
+        records = vector_records if fused else merge_keyword_matches(vector_records, keyword_records)
+
+        records = records + await self.expand_routes(records, question,
+                                                     shortest_rows=route_rows if named_route else None)
+        with span("format_context"):
+            return format_context(records, question)
+
+    async def get_relevant_context(self, question: str, **filters) -> str:
+        """Retrieve relevant context from Neo4j based on the question."""
+        try:
+            with span("retrieval"):
+                return await self.cache.aget_context(
+                    question, lambda: self.retrieve(question, **filters), driver=self.driver, **filters
+                )
+        except Overloaded:
+            raise
+        except Exception as e:
+            logger.error(f"Error retrieving context: {e}")
+            set_attribute("retrieval_error", str(e))
+            return "Error retrieving context."
+
+    async def ask(self, question: str, **filters) -> str:
+        """Ask a question about the supply chain data."""
+        with trace("ask"):
+            async with self._slots:
+                # Reuse the answer to a near-identical question on unchanged data
+                answer, remember = await alookup_answer(self.embeddings, question, driver=self.driver,
+                                                        **filters)
+                if answer is not None:
+                    return answer
+                context = await self.get_relevant_context(question, **filters)
+                inputs = {"context": context, "question": question}
+                record_tokens("prompt", self.prompt.format(**inputs))
+                async with self._llm_slots:
+                    with span("llm"):
+                        answer = await self.chain.ainvoke(inputs)
+                record_tokens("completion", answer)
+                remember(answer)
+                return answer
+
+    async def astream(self, question: str, **filters):
+        """Ask a question and yield the answer as it is generated."""
+        with trace("ask_stream"):
+            async with self._slots:
+                answer, remember = await alookup_answer(self.embeddings, question, driver=self.driver,
+                                                        **filters)
+                if answer is not None:
+                    yield answer
+                    return
+                context = await self.get_relevant_context(question, **filters)
+                inputs = {"context": context, "question": question}
+                record_tokens("prompt", self.prompt.format(**inputs))
+                answer = ""
+                async with self._llm_slots:
+                    with span("llm"):
+                        async for chunk in self.chain.astream(inputs):
+                            answer += chunk
+                            yield chunk
+                record_tokens("completion", answer)
+                remember(answer)
+
+
+async def main(questions: list):
+    """Answer several questions concurrently on one event loop."""
+    pipeline = AsyncRAGPipeline()
+    try:
+        answers = await asyncio.gather(*(pipeline.ask(question) for question in questions))
+        for question, answer in zip(questions, answers):
+            print(f"\nQuestion: {question}\nAnswer: {answer}")
+    finally:
+        await close_async_driver()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:] or ["What products are available?", "Where are the laptops stored?"]))
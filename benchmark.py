@@ -0,0 +1,373 @@
+from dotenv import load_dotenv
+from embedding_cache import EMBEDDING_MODEL, EmbeddingCache, FakeEmbeddings, embed_texts, reduce_embedding
+from local_index import normalise_rows, quantize
+from retrieval import RERANK_MULTIPLIER
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Load environment variables
+load_dotenv()
+
+CATEGORIES = ["Electronics", "Audio", "Wearables", "Computing", "Home", "Gaming", "Networking", "Imaging"]
+ADJECTIVES = ["compact", "premium", "rugged", "wireless", "smart", "portable", "high-performance",
+              "energy-efficient", "modular", "lightweight", "professional", "waterproof"]
+NOUNS = ["laptop", "smartphone", "headphones", "smart watch", "tablet", "speaker", "router",
+         "camera", "monitor", "keyboard", "console", "drone", "earbuds", "projector"]
+FEATURES = ["16GB RAM", "5G capability", "noise cancelling", "GPS", "30-hour battery life",
+            "4K display", "fast charging", "Bluetooth 5.3", "256GB storage", "heart rate monitoring",
+            "Wi-Fi 6", "optical zoom", "voice assistant", "USB-C"]
+CITIES = ["New York", "Los Angeles", "Amsterdam", "Singapore", "Miami", "Chicago", "Hamburg",
+          "Shanghai", "Dubai", "Sao Paulo", "Sydney", "Toronto", "Mumbai", "Lagos"]
+COUNTRIES = ["USA", "China", "Germany", "South Korea", "Japan", "Taiwan", "Vietnam", "Mexico", "India"]
+
+
+def generate_catalog(products=1000, suppliers=100, warehouses=50, routes=200,
+                     suppliers_per_product=2, warehouses_per_product=2, seed=42) -> dict:
+    """Generate a synthetic catalog with the same schema as load_data.py."""
+    rng = random.Random(seed)
+
+    product_rows = []
+    for i in range(products):
+        noun = rng.choice(NOUNS)
+        features = rng.sample(FEATURES, 3)
+        product_rows.append({
+            "id": f"P{i + 1}",
+            "name": f"{rng.choice(ADJECTIVES).title()} {noun.title()} {i + 1}",
+            "description": f"{rng.choice(ADJECTIVES).capitalize()} {noun} with {features[0]}, "
+                           f"{features[1]} and {features[2]}",
+            "price": round(rng.uniform(20, 2500), 2),
+            "category": rng.choice(CATEGORIES),
+        })
+
+    supplier_rows = [
+        {
+            "id": f"S{i + 1}",
+            "name": f"Supplier {i + 1} {rng.choice(['Inc', 'Ltd', 'Corp', 'Co'])}",
+            "location": rng.choice(COUNTRIES),
+            "specialization": rng.choice(CATEGORIES),
+        }
+        for i in range(suppliers)
+    ]
+
+    warehouse_rows = [
+        {
+            "id": f"W{i + 1}",
+            "name": f"Warehouse {i + 1}",
+            "location": rng.choice(CITIES),
+            "capacity": rng.randrange(1000, 20000, 500),
+        }
+        for i in range(warehouses)
+    ]
+
+    route_rows = []
+    seen_routes = set()
+    while warehouses > 1 and len(route_rows) < min(routes, warehouses * (warehouses - 1)):
+        start, end = rng.sample(range(1, warehouses + 1), 2)
+        if (start, end) in seen_routes:
+            continue
+        seen_routes.add((start, end))
+        distance = rng.randrange(100, 12000, 50)
+        route_rows.append({"from": f"W{start}", "to": f"W{end}", "distance": distance,
+                           "duration": max(1, distance // 60)})
+
+    relationship_rows = []
+    for product in product_rows:
+        fan_out = max(suppliers_per_product, warehouses_per_product)
+        product_suppliers = rng.sample(supplier_rows, min(suppliers_per_product, suppliers))
+        product_warehouses = rng.sample(warehouse_rows, min(warehouses_per_product, warehouses))
+        for j in range(fan_out):
+            relationship_rows.append({
+                "product_id": product["id"],
+                "supplier_id": product_suppliers[j % len(product_suppliers)]["id"],
+                "warehouse_id": product_warehouses[j % len(product_warehouses)]["id"],
+            })
+
+    return {
+        "products": product_rows,
+        "suppliers": supplier_rows,
+        "warehouses": warehouse_rows,
+        "routes": route_rows,
+        "relationships": relationship_rows,
+    }
+
+
+def percentiles(samples: list) -> dict:
+    """Latency percentiles in milliseconds."""
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(np.array(samples) * 1000, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3)}
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def throughput(rows: int, seconds: float) -> dict:
+    return {"rows": rows, "seconds": round(seconds, 4), "rows_per_sec": round(rows / seconds, 1) if seconds else None}
+
+
+class RecordingSession:
+    """Stand-in for a Neo4j write session that records the UNWIND batches instead of sending them.
+
+    Running load_data's loaders against it measures their client-side work
+    (hashing, embedding, batching) without a database.
+    """
+
+    def __init__(self):
+        # (query, rows) per write transaction
+        self.batches = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_write(self, work, *args, **kwargs):
+        # The session doubles as the transaction handed to the work function
+        return work(self, *args, **kwargs)
+
+    def run(self, query, **params):
+        self.batches.append((query, params.get("rows", [])))
+        return self
+
+    def consume(self):
+        return None
+
+
+def ingest_loaders(embeddings) -> list:
+    """(entity, catalog key, loader) for each load_data loader, in load order."""
+    import load_data
+    return [
+        ("Product", "products", lambda rows: load_data.load_products(
+            rows, embeddings=embeddings, cache=EmbeddingCache(":memory:"))),
+        ("Supplier", "suppliers", load_data.load_suppliers),
+        ("Warehouse", "warehouses", load_data.load_warehouses),
+        ("CONNECTED_TO", "routes", load_data.load_transportation_routes),
+        ("SUPPLIES + STORED_AT", "relationships", load_data.create_relationships),
+    ]
+
+
+def run_memory(catalog: dict, embeddings, query_vectors: list, top_k: int, recall_queries: int,
+               dtype: str = "int8", nprobe: int = None) -> dict:
+    """Benchmark without a database.
+
+    Ingest runs the real load_data batching against a RecordingSession.
+    Retrieval times the local vector index (``dtype``, IVF) over the product
+    vectors the loader produced; recall@k compares it with exact float32
+    search over the same vectors.
+    """
+    import load_data
+    from local_index import LocalVectorIndex
+
+    session = RecordingSession()
+    ingest = {}
+    original = load_data.write_session
+    load_data.write_session = lambda: session
+    try:
+        for entity, key, loader in ingest_loaders(embeddings):
+            sent = len(session.batches)
+            with contextlib.redirect_stdout(sys.stderr):
+                _, seconds = timed(loader, catalog[key])
+            rows = len(catalog[key]) * (2 if key == "relationships" else 1)
+            ingest[entity] = dict(throughput(rows, seconds), batches=len(session.batches) - sent)
+    finally:
+        load_data.write_session = original
+
+    products = [row for query, rows in session.batches if query == load_data.PRODUCT_QUERY for row in rows]
+    queries = [reduce_embedding(vector) for vector in query_vectors]
+    with tempfile.TemporaryDirectory() as path:
+        exact = LocalVectorIndex(os.path.join(path, "exact"), dtype="float32", ivf_min_vectors=len(products) + 1)
+        approximate = LocalVectorIndex(os.path.join(path, "approximate"), dtype=dtype, ivf_min_vectors=0,
+                                       nprobe=nprobe)
+        exact.build(products, version="benchmark")
+        approximate.build(products, version="benchmark")
+
+        latencies = [timed(approximate.search, vector, top_k)[1] for vector in queries]
+        recalls = []
+        for vector in queries[:recall_queries]:
+            expected = {product_id for product_id, _ in exact.search(vector, top_k)}
+            found = {product_id for product_id, _ in approximate.search(vector, top_k)}
+            recalls.append(len(expected & found) / len(expected) if expected else 1.0)
+        index = approximate.stats()
+
+    recall = round(sum(recalls) / len(recalls), 4) if recalls else None
+    return {
+        "ingest": ingest,
+        "retrieval": dict(percentiles(latencies), recall_at_k=recall, index=index),
+    }
+
+
+def _top(matrix: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    scores = matrix @ query
+    top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def run_compression(vectors: list, query_vectors: list, top_k: int, dimensions: list,
+                    rerank_multiplier: int = None) -> list:
+    """Memory saved and recall@k lost by reduced-dimension and int8 vectors.
+
+    Recall is measured against exact search over the full float32 vectors,
+    both straight from the compressed vectors and after re-ranking
+    ``rerank_multiplier * top_k`` candidates with the full vectors.
+    """
+    rerank_multiplier = rerank_multiplier or RERANK_MULTIPLIER
+    full = normalise_rows(np.array(vectors, dtype=np.float32))
+    queries = normalise_rows(np.array(query_vectors, dtype=np.float32))
+    full_bytes = full.shape[1] * 4
+    truth = [set(_top(full, query, top_k)) for query in queries]
+
+    results = []
+    for size in dimensions:
+        if size > full.shape[1]:
+            continue
+        reduced = normalise_rows(full[:, :size])
+        reduced_queries = normalise_rows(queries[:, :size])
+        for dtype in ("float32", "int8"):
+            if dtype == "int8":
+                quantized, scales = quantize(reduced)
+                stored = quantized.astype(np.float32) * scales[:, None]
+                bytes_per_vector = size + 4
+            else:
+                stored = reduced
+                bytes_per_vector = size * 4
+            recall, reranked_recall = [], []
+            for query, reduced_query, expected in zip(queries, reduced_queries, truth):
+                recall.append(len(expected & set(_top(stored, reduced_query, top_k))) / top_k)
+                candidates = _top(stored, reduced_query, top_k * rerank_multiplier)
+                best = candidates[_top(full[candidates], query, top_k)]
+                reranked_recall.append(len(expected & set(best)) / top_k)
+            results.append({
+                "dimensions": size,
+                "dtype": dtype,
+                "bytes_per_vector": bytes_per_vector,
+                "memory_saved": round(1 - bytes_per_vector / full_bytes, 4),
+                "recall_at_k": round(float(np.mean(recall)), 4),
+                "recall_at_k_reranked": round(float(np.mean(reranked_recall)), 4),
+            })
+    return results
+
+
+def run_neo4j(catalog: dict, embeddings, query_vectors: list, top_k: int, recall_queries: int,
+              clear: bool) -> dict:
+    import load_data
+    from database import get_driver
+    from retrieval import search_products
+
+    if clear:
+        with get_driver().session() as session:
+            session.run("""
+                MATCH (n) WHERE n:Product OR n:Supplier OR n:Warehouse
+                CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS
+            """).consume()
+
+    load_data.create_schema()
+    ingest = {}
+    for entity, key, loader in ingest_loaders(embeddings):
+        # Keep the loader's progress output off stdout, which carries the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            _, seconds = timed(loader, catalog[key])
+        rows = len(catalog[key]) * (2 if key == "relationships" else 1)
+        ingest[entity] = throughput(rows, seconds)
+    with contextlib.redirect_stdout(sys.stderr):
+        refreshed, seconds = timed(load_data.refresh_context_summaries)
+    ingest["context_summaries"] = throughput(refreshed, seconds)
+
+    # Wait for the vector index to catch up before querying it
+    with get_driver().session() as session:
+        session.run("CALL db.awaitIndexes(300)").consume()
+
+        latencies = []
+        for vector in query_vectors:
+            _, seconds = timed(search_products, session, vector, top_k, mode="index")
+            latencies.append(seconds)
+
+        recalls = []
+        for vector in query_vectors[:recall_queries]:
+            exact = {r["product_id"] for r in search_products(session, vector, top_k, mode="exact")}
+            approximate = {r["product_id"] for r in search_products(session, vector, top_k, mode="index")}
+            recalls.append(len(exact & approximate) / len(exact) if exact else 1.0)
+
+    recall = round(sum(recalls) / len(recalls), 4) if recalls else None
+    return {"ingest": ingest, "retrieval": dict(percentiles(latencies), recall_at_k=recall)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingest and retrieval on a synthetic catalog.")
+    parser.add_argument("--backend", choices=["memory", "neo4j"], default="memory",
+                        help="no database (loader batching and the local index), or the Neo4j database in .env")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--suppliers", type=int, default=100)
+    parser.add_argument("--warehouses", type=int, default=50)
+    parser.add_argument("--routes", type=int, default=200)
+    parser.add_argument("--suppliers-per-product", type=int, default=2)
+    parser.add_argument("--warehouses-per-product", type=int, default=2)
+    parser.add_argument("--queries", type=int, default=200, help="retrieval queries to time")
+    parser.add_argument("--recall-queries", type=int, default=20, help="queries checked against the exact scorer")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dimensions", default="1536,768,512,256",
+                        help="comma-separated vector sizes compared in the compression report")
+    parser.add_argument("--embeddings", choices=["fake", "openai"], default="fake",
+                        help="offline random embeddings, or OpenAI (needed for meaningful compression recall)")
+    parser.add_argument("--local-dtype", choices=["float32", "int8"], default="int8",
+                        help="vector type of the local index timed by the memory backend")
+    parser.add_argument("--nprobe", type=int, help="IVF clusters searched by the memory backend")
+    parser.add_argument("--clear", action="store_true",
+                        help="delete existing Product/Supplier/Warehouse nodes first (neo4j backend)")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    catalog = generate_catalog(args.products, args.suppliers, args.warehouses, args.routes,
+                               args.suppliers_per_product, args.warehouses_per_product, args.seed)
+    # Deterministic offline embeddings, matching the 1536 dimensions of the vector index
+    if args.embeddings == "fake":
+        embeddings = FakeEmbeddings()
+    else:
+        # Full-size vectors of EMBEDDING_MODEL, so the compression study can truncate them
+        from langchain_community.embeddings import OpenAIEmbeddings
+        embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+    query_vectors = embeddings.embed_documents([f"benchmark question {i}" for i in range(args.queries)])
+
+    if args.backend == "memory":
+        results = run_memory(catalog, embeddings, query_vectors, args.top_k, args.recall_queries,
+                             args.local_dtype, args.nprobe)
+    else:
+        results = run_neo4j(catalog, embeddings, query_vectors, args.top_k, args.recall_queries, args.clear)
+
+    # Random fake vectors have no structure in their leading dimensions, so
+    # their recall is a worst case; text-embedding-3 vectors degrade gracefully
+    vectors = embed_texts(embeddings, [row["description"] for row in catalog["products"]],
+                          EmbeddingCache(":memory:"))
+    results["compression"] = run_compression(vectors, query_vectors, args.top_k,
+                                             [int(size) for size in args.dimensions.split(",")])
+
+    report = {
+        "backend": args.backend,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "clear")},
+        **results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,66 @@
+from dotenv import load_dotenv
+import os
+import time
+
+# Load environment variables
+load_dotenv()
+
+# Chat model settings
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # "openai" or "fake"
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4-turbo-preview")
+# Delay between streamed characters of the fake model, in seconds
+FAKE_LLM_SLEEP = float(os.getenv("FAKE_LLM_SLEEP", "0.01"))
+
+# Prompt shared by the chat entry points
+PROMPT_TEMPLATE = """You are a helpful supply chain assistant. Use the following context to answer the question.
+If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.
+
+Current context:
+{context}
+
+Question: {question}
+
+Answer:"""
+
+# Prompt for multi-turn chat, with the bounded conversation history
+CONVERSATION_PROMPT_TEMPLATE = """You are a helpful supply chain assistant. Use the following context and the conversation so far to answer the question.
+If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.
+
+Conversation so far:
+{history}
+
+Current context:
+{context}
+
+Question: {question}
+
+Answer:"""
+
+
+def get_llm():
+    """Return the configured streaming chat model."""
+    if LLM_PROVIDER == "fake":
+        from langchain_community.chat_models.fake import FakeListChatModel
+        return FakeListChatModel(
+            responses=["This is a canned answer from the fake chat model."],
+            sleep=FAKE_LLM_SLEEP,
+        )
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=LLM_MODEL, streaming=True)
+
+
+def stream_with_timings(chain, inputs, timings: dict, start: float = None):
+    """Stream a chain's output, recording latency in ``timings``.
+
+    Sets ``time_to_first_token`` when the first non-empty chunk arrives and
+    ``total_latency`` once the stream is exhausted, both in seconds since
+    ``start`` (a ``time.perf_counter()`` value, defaulting to now). A stream
+    without any text gets its first token at the end.
+    """
+    start = time.perf_counter() if start is None else start
+    for chunk in chain.stream(inputs):
+        if chunk and "time_to_first_token" not in timings:
+            timings["time_to_first_token"] = time.perf_counter() - start
+        yield chunk
+    timings["total_latency"] = time.perf_counter() - start
+    timings.setdefault("time_to_first_token", timings["total_latency"])
@@ -0,0 +1,234 @@
+from dotenv import load_dotenv
+from chat_model import get_llm
+from database import read_session
+from graph_expansion import expand_routes
+from retrieval import format_context, keyword_terms
+from telemetry import count_tokens, set_attribute, span
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Token budget for the conversation history sent with each question
+# (the running summary plus the most recent turns, verbatim)
+CONVERSATION_HISTORY_TOKENS = int(os.getenv("CONVERSATION_HISTORY_TOKENS", "600"))
+# Share of the history budget the summary of older turns may use
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "200"))
+# How follow-ups are rewritten and older turns summarised: "llm" asks the chat
+# model, "entities" appends the names of the entities under discussion and
+# keeps an extractive summary (no extra model calls)
+CONVERSATION_REWRITE = os.getenv("CONVERSATION_REWRITE", "llm")
+# Retrieved records remembered for follow-up questions
+CONVERSATION_MAX_ENTITIES = int(os.getenv("CONVERSATION_MAX_ENTITIES", "10"))
+
+# Words that refer back to something said earlier
+REFERRING_WORDS = {
+    "it", "its", "they", "them", "their", "theirs", "those", "these", "that", "this",
+    "there", "one", "ones", "same", "he", "she", "him", "her", "his",
+}
+# A question with at most this many content terms and a referring word is a follow-up
+FOLLOW_UP_MAX_TERMS = 2
+
+# Record fields not worth remembering between turns
+UNREMEMBERED_FIELDS = {"embedding", "full_embedding"}
+# Labels of remembered records (route records are not kept)
+ENTITY_LABELS = ("Product", "Supplier", "Warehouse")
+
+CONDENSE_PROMPT_TEMPLATE = """Given the conversation below and a follow-up question, rewrite the follow-up as a standalone question that names the products, suppliers or warehouses it refers to.
+Reply with the question only.
+
+Conversation:
+{history}
+
+Follow-up question: {question}
+
+Standalone question:"""
+
+SUMMARY_PROMPT_TEMPLATE = """Progressively summarize the conversation between a user and a supply chain assistant, adding the new exchange to the current summary.
+Keep the names of the products, suppliers and warehouses discussed. Use at most {words} words.
+
+Current summary:
+{summary}
+
+New exchange:
+User: {question}
+Assistant: {answer}
+
+New summary:"""
+
+
+def _first_sentence(text: str) -> str:
+    match = re.match(r"(.+?[.!?])(\s|$)", text.strip(), re.S)
+    return (match.group(1) if match else text.strip()).replace("\n", " ")
+
+
+def _trim_to_tokens(text: str, budget: int) -> str:
+    """Drop the oldest lines, then sentences, of a summary until it fits the budget."""
+    parts = text.splitlines()
+    if len(parts) == 1:
+        parts = re.split(r"(?<=[.!?])\s+", text)
+    while len(parts) > 1 and count_tokens(" ".join(parts)) > budget:
+        parts.pop(0)
+    joiner = "\n" if "\n" in text else " "
+    return joiner.join(parts)
+
+
+def _is_entity(record) -> bool:
+    return "label" not in record.keys() or record["label"] in ENTITY_LABELS
+
+
+def _entity_name(record: dict) -> str:
+    return record["name"] if "label" in record else record["product_name"]
+
+
+class Conversation:
+    """The state of one chat session: recent turns, a summary of older ones and
+    the records retrieved for the last question.
+
+    Turns are kept verbatim while they fit CONVERSATION_HISTORY_TOKENS; beyond
+    that the oldest turn is folded into the running summary, one turn at a
+    time, so the history sent with each question stays bounded however long
+    the conversation gets.
+    """
+
+    def __init__(self, history_tokens: int = None, summary_tokens: int = None, rewrite: str = None):
+        self.history_tokens = history_tokens or CONVERSATION_HISTORY_TOKENS
+        self.summary_tokens = min(summary_tokens or CONVERSATION_SUMMARY_TOKENS, self.history_tokens)
+        self.rewrite = rewrite or CONVERSATION_REWRITE
+        self.turns = []
+        self.summary = ""
+        self.records = None
+        self.context = None
+        self.follow_up = False
+        # Content terms of the current question that the conversation has not mentioned
+        self.new_terms = []
+        self._chains = {}
+
+    def _chain(self, template: str):
+        if template not in self._chains:
+            from langchain_core.output_parsers import StrOutputParser
+            from langchain_core.prompts import ChatPromptTemplate
+            self._chains[template] = ChatPromptTemplate.from_template(template) | get_llm() | StrOutputParser()
+        return self._chains[template]
+
+    def history_text(self) -> str:
+        """The summary of older turns and the recent turns, for the prompt."""
+        lines = [f"Summary of earlier conversation: {self.summary}"] if self.summary else []
+        for question, answer in self.turns:
+            lines += [f"User: {question}", f"Assistant: {answer}"]
+        return "\n".join(lines) or "(none)"
+
+    def entity_names(self) -> list:
+        """Names of the products, suppliers and warehouses retrieved for the last question."""
+        names = []
+        for record in self.records or []:
+            name = _entity_name(record)
+            if name not in names:
+                names.append(name)
+        return names
+
+    def known_terms(self) -> set:
+        """Content terms mentioned so far: earlier questions and answers, the summary and retrieved entities."""
+        text = "\n".join([self.summary, *self.entity_names()] + [f"{q}\n{a}" for q, a in self.turns])
+        return set(keyword_terms(text))
+
+    def is_follow_up(self, question: str) -> bool:
+        """Whether a question refers back to the conversation (e.g. "where is it stored?")."""
+        if not self.turns:
+            return False
+        words = set(re.findall(r"[a-z]+", question.lower()))
+        return bool(words & REFERRING_WORDS) and len(keyword_terms(question)) <= FOLLOW_UP_MAX_TERMS
+
+    def prepare(self, question: str) -> str:
+        """Return the question to retrieve and cache with: follow-ups are rewritten
+        into a standalone question, other questions are returned unchanged."""
+        self.follow_up = self.is_follow_up(question)
+        self.new_terms = []
+        set_attribute("follow_up", self.follow_up)
+        if not self.follow_up:
+            # A new topic: forget the last retrieval, even if the answer turns out to be cached
+            self.records = self.context = None
+            return question
+        with span("condense_question"):
+            standalone = None
+            if self.rewrite == "llm":
+                try:
+                    standalone = self._chain(CONDENSE_PROMPT_TEMPLATE).invoke(
+                        {"history": self.history_text(), "question": question}).strip()
+                except Exception as e:
+                    logger.warning(f"Could not rewrite follow-up question: {e}")
+            if not standalone:
+                names = self.entity_names()
+                standalone = f"{question} ({', '.join(names)})" if names else question
+        known = self.known_terms()
+        self.new_terms = [term for term in keyword_terms(standalone) if term not in known]
+        set_attribute("standalone_question", standalone)
+        set_attribute("new_terms", self.new_terms)
+        return standalone
+
+    def reusable(self) -> bool:
+        """Whether the last question's retrieval can answer the current follow-up.
+
+        Only if the follow-up asks about nothing new: a product, place or
+        keyword the conversation has not mentioned (e.g. "is there a
+        tablet?" after talking about laptops) needs a fresh retrieval.
+        """
+        return self.follow_up and self.context is not None and not self.new_terms
+
+    def remember_retrieval(self, context: str, records: list = None):
+        """Keep the context, and the records when they were freshly retrieved, for follow-ups."""
+        self.context = context
+        if records is None:
+            # The context came from the query cache, so there are no records to re-rank
+            self.records = None
+            return
+        entities = [record for record in records if _is_entity(record)]
+        self.records = [{key: value for key, value in dict(record).items() if key not in UNREMEMBERED_FIELDS}
+                        for record in entities[:CONVERSATION_MAX_ENTITIES]]
+
+    def reused_context(self, question: str) -> str:
+        """Context for a follow-up from the entities retrieved for the last question.
+
+        The remembered records are re-ranked against the new question without
+        querying Neo4j again; only route expansion, for routing questions, runs.
+        """
+        if self.records is None:
+            set_attribute("reused_context", True)
+            return self.context
+        set_attribute("reused_entities", len(self.records))
+        records = self.records
+        # Sessions are lazy, so this only connects if the question asks about routes
+        with read_session() as session:
+            records = records + expand_routes(session, records, question)
+        with span("format_context"):
+            self.context = format_context(records, question)
+        return self.context
+
+    def add_turn(self, question: str, answer: str):
+        """Append a turn, folding the oldest turns into the summary while over budget."""
+        self.turns.append((question, answer))
+        while len(self.turns) > 1 and count_tokens(self.history_text()) > self.history_tokens:
+            with span("summarize_history"):
+                self._summarize(*self.turns.pop(0))
+
+    def _summarize(self, question: str, answer: str):
+        summary = None
+        if self.rewrite == "llm":
+            try:
+                summary = self._chain(SUMMARY_PROMPT_TEMPLATE).invoke({
+                    "summary": self.summary or "(empty)",
+                    "question": question,
+                    "answer": answer,
+                    "words": self.summary_tokens * 3 // 4,
+                }).strip()
+            except Exception as e:
+                logger.warning(f"Could not summarise the conversation: {e}")
+        if not summary:
+            # Extractive: one line per folded turn, oldest lines dropped first
+            line = f"Asked: {question.strip()} Answer: {_first_sentence(answer)}"
+            summary = f"{self.summary}\n{line}" if self.summary else line
+        self.summary = _trim_to_tokens(summary, self.summary_tokens)
@@ -0,0 +1,188 @@
+from neo4j import READ_ACCESS, AsyncGraphDatabase, Bookmarks, GraphDatabase
+from dotenv import load_dotenv
+import atexit
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Neo4j connection details
+uri = os.getenv("NEO4J_URI")
+username = os.getenv("NEO4J_USERNAME")
+password = os.getenv("NEO4J_PASSWORD")
+
+# Connection pool settings
+MAX_CONNECTION_POOL_SIZE = int(os.getenv("NEO4J_MAX_CONNECTION_POOL_SIZE", "100"))
+CONNECTION_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", "60"))
+CONNECTION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_TIMEOUT", "30"))
+MAX_CONNECTION_LIFETIME = float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))
+# Pooled connections idle for longer than this many seconds are checked with a
+# round trip before use, so a connection dropped by a firewall or load balancer
+# is replaced instead of failing a query (unset = never checked, 0 = always)
+LIVENESS_CHECK_TIMEOUT = os.getenv("NEO4J_LIVENESS_CHECK_TIMEOUT")
+# Database to use (unset = the server's default database, looked up per session)
+DATABASE = os.getenv("NEO4J_DATABASE") or None
+
+# Read transaction settings for retrieval. Reads are routed to followers and
+# read replicas in a cluster; a transient error or a lost server is retried
+# on another member with jittered exponential backoff.
+# Server-side timeout for each read transaction, in seconds
+READ_TIMEOUT = float(os.getenv("NEO4J_READ_TIMEOUT", "10"))
+# How long a failing read keeps being retried, in seconds
+READ_RETRY_TIME = float(os.getenv("NEO4J_READ_RETRY_TIME", "5"))
+# Delay before the first retry, in seconds (doubled for each retry after that)
+READ_RETRY_DELAY = float(os.getenv("NEO4J_READ_RETRY_DELAY", "0.1"))
+# Each delay is randomised by up to this fraction, so retries spread out
+READ_RETRY_JITTER = float(os.getenv("NEO4J_READ_RETRY_JITTER", "0.2"))
+# Bookmarks of the last load; reads wait until the server they are routed to
+# has applied them, so questions asked after a load see its data (empty = off)
+BOOKMARKS_PATH = os.getenv("NEO4J_BOOKMARKS_PATH", ".neo4j_bookmarks")
+
+_driver = None
+_async_driver = None
+_lock = threading.Lock()
+_write_bookmark_manager = None
+_read_bookmark_manager = None
+_async_read_bookmark_manager = None
+_saved_bookmarks = (None, Bookmarks())
+
+
+def _driver_options() -> dict:
+    options = {
+        "auth": (username, password),
+        "max_connection_pool_size": MAX_CONNECTION_POOL_SIZE,
+        "connection_acquisition_timeout": CONNECTION_ACQUISITION_TIMEOUT,
+        "connection_timeout": CONNECTION_TIMEOUT,
+        "max_connection_lifetime": MAX_CONNECTION_LIFETIME,
+    }
+    if LIVENESS_CHECK_TIMEOUT:
+        options["liveness_check_timeout"] = float(LIVENESS_CHECK_TIMEOUT)
+    return options
+
+
+def get_driver():
+    """Return the process-wide Neo4j driver, creating it on first use."""
+    global _driver
+    if _driver is None:
+        with _lock:
+            if _driver is None:
+                _driver = GraphDatabase.driver(uri, **_driver_options())
+    return _driver
+
+
+def get_async_driver():
+    """Return the process-wide async Neo4j driver, creating it on first use.
+
+    The async driver's pool belongs to the event loop it is first used on, so
+    it must only be used from that loop.
+    """
+    global _async_driver
+    if _async_driver is None:
+        with _lock:
+            if _async_driver is None:
+                _async_driver = AsyncGraphDatabase.driver(uri, **_driver_options())
+    return _async_driver
+
+
+def load_bookmarks() -> Bookmarks:
+    """The bookmarks saved by the last load, re-read only when the file changes."""
+    global _saved_bookmarks
+    try:
+        mtime = os.stat(BOOKMARKS_PATH).st_mtime_ns
+    except OSError:
+        return Bookmarks()
+    if _saved_bookmarks[0] != mtime:
+        try:
+            with open(BOOKMARKS_PATH) as f:
+                _saved_bookmarks = (mtime, Bookmarks.from_raw_values(json.load(f)))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable bookmarks file {BOOKMARKS_PATH}: {e}")
+            _saved_bookmarks = (mtime, Bookmarks())
+    return _saved_bookmarks[1]
+
+
+def save_bookmarks():
+    """Save the bookmarks of this process's write sessions for readers in other processes."""
+    if not BOOKMARKS_PATH or _write_bookmark_manager is None:
+        return
+    bookmarks = sorted(_write_bookmark_manager.get_bookmarks())
+    if not bookmarks:
+        return
+    temporary = f"{BOOKMARKS_PATH}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(bookmarks, f)
+    os.replace(temporary, BOOKMARKS_PATH)
+
+
+def _read_session_options(bookmark_manager) -> dict:
+    return {
+        "default_access_mode": READ_ACCESS,
+        "database": DATABASE,
+        "bookmark_manager": bookmark_manager,
+        "max_transaction_retry_time": READ_RETRY_TIME,
+        "initial_retry_delay": READ_RETRY_DELAY,
+        "retry_delay_jitter_factor": READ_RETRY_JITTER,
+    }
+
+
+def read_session(driver=None):
+    """Open a read session: routed to a reader, causally after the last load.
+
+    Use ``execute_read`` on it so that failures are retried.
+    """
+    global _read_bookmark_manager
+    if _read_bookmark_manager is None and BOOKMARKS_PATH:
+        _read_bookmark_manager = GraphDatabase.bookmark_manager(bookmarks_supplier=load_bookmarks)
+    return (driver or get_driver()).session(**_read_session_options(_read_bookmark_manager))
+
+
+def async_read_session(driver=None):
+    """Open a read session on the async driver (see read_session)."""
+    global _async_read_bookmark_manager
+    if _async_read_bookmark_manager is None and BOOKMARKS_PATH:
+        _async_read_bookmark_manager = AsyncGraphDatabase.bookmark_manager(bookmarks_supplier=load_bookmarks)
+    return (driver or get_async_driver()).session(**_read_session_options(_async_read_bookmark_manager))
+
+
+def write_session():
+    """Open a write session whose bookmarks are collected for save_bookmarks."""
+    global _write_bookmark_manager
+    if _write_bookmark_manager is None:
+        with _lock:
+            if _write_bookmark_manager is None:
+                _write_bookmark_manager = GraphDatabase.bookmark_manager()
+    return get_driver().session(database=DATABASE, bookmark_manager=_write_bookmark_manager)
+
+
+def warm_up():
+    """Open a connection and check the server is reachable before serving."""
+    driver = get_driver()
+    driver.verify_connectivity()
+    logger.info("Connected to Neo4j at %s", uri)
+    return driver
+
+
+def close_driver():
+    """Close the shared driver and its connection pool."""
+    global _driver
+    with _lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+
+async def close_async_driver():
+    """Close the shared async driver and its connection pool."""
+    global _async_driver
+    driver, _async_driver = _async_driver, None
+    if driver is not None:
+        await driver.close()
+
+
+# Release pooled connections when the process exits
+atexit.register(close_driver)
@@ -0,0 +1,230 @@
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+from dotenv import load_dotenv
+import hashlib
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Embedding settings
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")  # "openai" or "fake"
+# OpenAI embedding model (text-embedding-ada-002 is OpenAIEmbeddings' default)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".embedding_cache.sqlite3")
+# Dimensions kept in the vector index. Longer embeddings are truncated and
+# renormalised, which is what the `dimensions` parameter of text-embedding-3
+# models does server-side; the full vector is kept for re-ranking. Other
+# OpenAI models cannot be shortened.
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
+
+# Native size of the OpenAI embedding models
+EMBEDDING_MODEL_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+
+class Overloaded(Exception):
+    """Raised when a bounded queue is full; the caller should retry later."""
+
+
+class FakeEmbeddings:
+    """Deterministic offline embeddings: the same text always maps to the same unit vector."""
+
+    def __init__(self, size: int = 1536):
+        self.size = size
+        self.model = f"fake-{size}"
+        self.calls = 0
+
+    def _embed(self, text: str) -> list:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.size)]
+        norm = sum(v * v for v in vector) ** 0.5
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: list) -> list:
+        self.calls += 1
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        self.calls += 1
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: list) -> list:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list:
+        return self.embed_query(text)
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store: sha256(model + text) -> float32 vector in SQLite."""
+
+    def __init__(self, path: str = None):
+        self.path = path or EMBEDDING_CACHE_PATH
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list) -> dict:
+        """Return the cached vectors for the keys that are present."""
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def put_many(self, items: dict):
+        """Store vectors keyed by cache key."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items.items()],
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def reduce_embedding(vector, dimensions: int = None) -> list:
+    """Truncate an embedding to ``dimensions`` (default EMBEDDING_DIMENSIONS) and renormalise it."""
+    dimensions = dimensions or EMBEDDING_DIMENSIONS
+    if len(vector) <= dimensions:
+        return list(vector)
+    reduced = vector[:dimensions]
+    norm = sum(v * v for v in reduced) ** 0.5 or 1.0
+    return [v / norm for v in reduced]
+
+
+def full_embedding_bytes(vector, dimensions: int = None):
+    """The full-precision copy of a reduced embedding as float32 bytes, or None if it is not reduced."""
+    if len(vector) <= (dimensions or EMBEDDING_DIMENSIONS):
+        return None
+    return array("f", vector).tobytes()
+
+
+def supports_truncation(model: str) -> bool:
+    """Whether a model's embeddings keep their meaning when truncated (Matryoshka training)."""
+    return model.startswith("text-embedding-3")
+
+
+def get_embeddings():
+    """Return the configured embedding provider.
+
+    Vectors are always requested at the model's native size: reduce_embedding
+    shortens them for the index (equivalent to the `dimensions` parameter of
+    text-embedding-3) and the full vector is stored for re-ranking. Raises
+    ValueError if EMBEDDING_DIMENSIONS is below the size of a model that
+    cannot be truncated, as that would silently hurt retrieval.
+    """
+    if EMBEDDING_PROVIDER == "fake":
+        return FakeEmbeddings()
+    from langchain_community.embeddings import OpenAIEmbeddings
+    native = EMBEDDING_MODEL_DIMENSIONS.get(EMBEDDING_MODEL)
+    if native is not None and EMBEDDING_DIMENSIONS < native and not supports_truncation(EMBEDDING_MODEL):
+        raise ValueError(f"{EMBEDDING_MODEL} embeddings cannot be reduced to {EMBEDDING_DIMENSIONS} dimensions; "
+                         f"use a text-embedding-3 model or set EMBEDDING_DIMENSIONS={native}")
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL)
+
+
+def model_name(embedder) -> str:
+    """Name used to namespace an embedder's vectors in the cache (with the size it asks for, if any)."""
+    name = getattr(embedder, "model", None) or type(embedder).__name__
+    dimensions = (getattr(embedder, "model_kwargs", None) or {}).get("dimensions")
+    return f"{name}@{dimensions}" if dimensions else name
+
+
+def retryable_errors() -> tuple:
+    """Errors worth retrying with backoff (rate limits and transient API failures).
+
+    openai is imported here rather than at module level, as it is slow to
+    import and only needed once embeddings are requested.
+    """
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+def with_retries(fn, *args, max_retries: int = None, base_delay: float = 1.0, max_delay: float = 60.0):
+    """Call fn, retrying rate-limit and transient errors with exponential backoff and jitter."""
+    max_retries = EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+    errors = retryable_errors()
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args)
+        except errors as e:
+            if attempt == max_retries:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            logger.warning(f"Embedding request failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def embed_texts(embedder, texts: list, cache: EmbeddingCache = None, batch_size: int = None,
+                max_concurrency: int = None) -> list:
+    """Embed texts in batches with bounded concurrency, reusing cached vectors.
+
+    Returns one vector per input text, in order. Only texts missing from the
+    cache are sent to the provider, each distinct text at most once.
+    """
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    max_concurrency = max_concurrency or EMBEDDING_MAX_CONCURRENCY
+    model = model_name(embedder)
+    keys = [EmbeddingCache.key(model, text) for text in texts]
+
+    vectors = cache.get_many(list(set(keys))) if cache else {}
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in vectors:
+            missing[key] = text
+
+    if missing:
+        missing_keys = list(missing)
+        chunks = [missing_keys[i:i + batch_size] for i in range(0, len(missing_keys), batch_size)]
+
+        def embed_chunk(chunk):
+            return with_retries(embedder.embed_documents, [missing[key] for key in chunk])
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            for chunk, chunk_vectors in zip(chunks, executor.map(embed_chunk, chunks)):
+                new = dict(zip(chunk, chunk_vectors))
+                if cache:
+                    cache.put_many(new)
+                vectors.update(new)
+
+    return [vectors[key] for key in keys]
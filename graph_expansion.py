@@ -0,0 +1,239 @@
+from dotenv import load_dotenv
+from neo4j.exceptions import Neo4jError
+from database import read_session
+from retrieval import keyword_terms, run_query
+from telemetry import set_attribute, span
+import logging
+import os
+import re
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Route expansion settings (EXPANSION_MAX_DEPTH=0 disables the stage)
+EXPANSION_MAX_DEPTH = int(os.getenv("EXPANSION_MAX_DEPTH", "2"))
+# Routes followed from each warehouse per hop (shortest duration first), also
+# the number of warehouses the expansion starts from
+EXPANSION_MAX_FANOUT = int(os.getenv("EXPANSION_MAX_FANOUT", "5"))
+EXPANSION_MAX_PATHS = int(os.getenv("EXPANSION_MAX_PATHS", "10"))
+# Server-side transaction timeout for each expansion query, in seconds
+EXPANSION_TIMEOUT = float(os.getenv("EXPANSION_TIMEOUT", "2"))
+# Longest route (in hops) considered when finding the fastest route between warehouses
+ROUTE_MAX_HOPS = int(os.getenv("ROUTE_MAX_HOPS", "4"))
+# Warehouse ids named in a question, e.g. "W1" (too short to be keyword terms)
+WAREHOUSE_CODE_PATTERN = re.compile(os.getenv("WAREHOUSE_CODE_PATTERN", r"\bW\d+\b"), re.IGNORECASE)
+
+# Question terms that make a question about routing or logistics
+ROUTE_TERMS = {
+    "route", "ship", "shipping", "shipment", "transport", "transportation", "deliver",
+    "delivery", "distance", "duration", "travel", "fastest", "shortest", "quickest",
+    "connected", "connection", "logistic", "transfer", "move", "between", "reach", "long",
+}
+
+# Warehouses the matched products are stored at, plus warehouses matched directly
+START_CLAUSE = """
+    CALL {
+        MATCH (p:Product)-[:STORED_AT]->(w:Warehouse)
+        WHERE p.id IN $product_ids
+        RETURN w
+        UNION
+        MATCH (w:Warehouse)
+        WHERE w.id IN $warehouse_ids
+        RETURN w
+    }
+    WITH DISTINCT w
+    LIMIT $max_fanout
+    WITH w AS start, [w] AS nodes, [] AS rels
+"""
+
+# One hop: extend each path by at most $max_fanout of the quickest routes to
+# warehouses not yet on it. Paths with nowhere left to go are kept as they are.
+HOP_CLAUSE = """
+    CALL {
+        WITH nodes
+        WITH nodes, last(nodes) AS here
+        MATCH (here)-[r:CONNECTED_TO]->(next:Warehouse)
+        WHERE NOT next IN nodes
+        WITH r, next
+        ORDER BY r.duration
+        LIMIT $max_fanout
+        RETURN collect([r, next]) AS steps
+    }
+    UNWIND CASE WHEN size(steps) = 0 THEN [null] ELSE steps END AS step
+    WITH start,
+         CASE WHEN step IS NULL THEN nodes ELSE nodes + [step[1]] END AS nodes,
+         CASE WHEN step IS NULL THEN rels ELSE rels + [step[0]] END AS rels
+"""
+
+RESULT_CLAUSE = """
+    WITH DISTINCT start, nodes, rels
+    WHERE size(rels) > 0
+    WITH start, nodes, rels, reduce(total = 0, r IN rels | total + r.duration) AS duration
+    ORDER BY duration
+    LIMIT $max_paths
+    RETURN start.id AS start_id,
+           start.name AS start_name,
+           start.location AS start_location,
+           duration,
+           [i IN range(0, size(rels) - 1) | {
+               from: nodes[i].name,
+               to: nodes[i + 1].name,
+               to_location: nodes[i + 1].location,
+               distance: rels[i].distance,
+               duration: rels[i].duration
+           }] AS legs
+"""
+
+
+def build_expansion_query(depth: int) -> str:
+    """Unroll the bounded traversal into one query of ``depth`` hops."""
+    return START_CLAUSE + HOP_CLAUSE * depth + RESULT_CLAUSE
+
+
+def build_shortest_route_query(max_hops: int) -> str:
+    """Fastest route by total duration among the routes with the fewest hops (at most ``max_hops``).
+
+    allShortestPaths finds those routes with a bidirectional breadth-first
+    search; enumerating every path of up to ``max_hops`` routes grows
+    exponentially on a dense route graph. A route with more hops but a
+    shorter total duration is not considered.
+    """
+    return """
+        MATCH (a:Warehouse {id: $from_id}), (b:Warehouse {id: $to_id})
+        MATCH path = allShortestPaths((a)-[:CONNECTED_TO*..""" + str(int(max_hops)) + """]->(b))
+        WITH path,
+             reduce(total = 0, r IN relationships(path) | total + r.duration) AS duration,
+             reduce(total = 0, r IN relationships(path) | total + r.distance) AS distance
+        ORDER BY duration
+        LIMIT 1
+        RETURN [n IN nodes(path) | n.name] AS stops, duration, distance
+    """
+
+
+def warehouse_codes(question: str) -> list:
+    """Warehouse ids named in the question, upper-cased, in order of appearance."""
+    codes = []
+    for code in WAREHOUSE_CODE_PATTERN.findall(question or ""):
+        if code.upper() not in codes:
+            codes.append(code.upper())
+    return codes
+
+
+def is_route_question(question: str) -> bool:
+    """Whether the question asks about routes, distances or moving goods, or names two warehouses."""
+    if not question:
+        return False
+    return any(term in ROUTE_TERMS for term in keyword_terms(question)) or len(warehouse_codes(question)) >= 2
+
+
+def expansion_seeds(records) -> tuple:
+    """Product and warehouse ids of the retrieved records."""
+    product_ids, warehouse_ids = [], []
+    for record in records:
+        if 'label' in record.keys():
+            label, record_id = record['label'], record['id']
+        else:
+            label, record_id = "Product", record['product_id']
+        if label == "Product":
+            product_ids.append(record_id)
+        elif label == "Warehouse":
+            warehouse_ids.append(record_id)
+    return product_ids, warehouse_ids
+
+
+def expansion_request(records, question: str, depth: int = None):
+    """Return the (query, params) of the route expansion for these records, or None."""
+    depth = EXPANSION_MAX_DEPTH if depth is None else depth
+    product_ids, warehouse_ids = expansion_seeds(records)
+    warehouse_ids += [code for code in warehouse_codes(question) if code not in warehouse_ids]
+    if depth <= 0 or not is_route_question(question) or not (product_ids or warehouse_ids):
+        return None
+    params = {
+        "product_ids": product_ids,
+        "warehouse_ids": warehouse_ids,
+        "max_fanout": EXPANSION_MAX_FANOUT,
+        "max_paths": EXPANSION_MAX_PATHS,
+    }
+    return build_expansion_query(depth), params
+
+
+def shortest_route_request(records, question: str):
+    """Return the (query, params) for the fastest route between two warehouses, or None.
+
+    The endpoints are the first two warehouses named in the question, or else
+    the top two matched warehouses.
+    """
+    codes = warehouse_codes(question)
+    warehouse_ids = codes if len(codes) >= 2 else expansion_seeds(records)[1]
+    if len(warehouse_ids) < 2 or warehouse_ids[0] == warehouse_ids[1] or not is_route_question(question):
+        return None
+    return build_shortest_route_query(ROUTE_MAX_HOPS), {"from_id": warehouse_ids[0], "to_id": warehouse_ids[1]}
+
+
+def route_records(rows) -> list:
+    """Group expansion paths into one route record per start warehouse, legs in path order."""
+    routes = {}
+    for row in rows:
+        route = routes.setdefault(row["start_id"], {
+            "label": "Route",
+            "id": row["start_id"],
+            "name": row["start_name"],
+            "location": row["start_location"],
+            "legs": [],
+        })
+        for leg in row["legs"]:
+            if leg not in route["legs"]:
+                route["legs"].append(leg)
+    return list(routes.values())
+
+
+def fastest_route_records(rows) -> list:
+    return [
+        {
+            "label": "FastestRoute",
+            "id": " -> ".join(row["stops"]),
+            "name": " -> ".join(row["stops"]),
+            "stops": row["stops"],
+            "duration": row["duration"],
+            "distance": row["distance"],
+        }
+        for row in rows
+    ]
+
+
+def expand_routes(session, records, question: str) -> list:
+    """Return route records reachable from the retrieved products and warehouses.
+
+    The fastest route between the top two matched warehouses comes first,
+    followed by routes from each start warehouse. Expansion never fails
+    retrieval: on a timeout or query error it returns what it has.
+    """
+    expanded = []
+    with span("graph_expansion"):
+        try:
+            request = shortest_route_request(records, question)
+            if request:
+                expanded += fastest_route_records(run_query(session, *request, timeout=EXPANSION_TIMEOUT))
+            request = expansion_request(records, question)
+            if request:
+                expanded += route_records(run_query(session, *request, timeout=EXPANSION_TIMEOUT))
+        except Neo4jError as e:
+            logger.warning(f"Route expansion stopped: {e}")
+            set_attribute("expansion_error", str(e))
+    return expanded
+
+
+if __name__ == "__main__":
+    # Print the fastest route between two warehouse ids, e.g. W1 W2
+    if len(sys.argv) != 3:
+        sys.exit("usage: python graph_expansion.py FROM_WAREHOUSE_ID TO_WAREHOUSE_ID")
+    with read_session() as session:
+        rows = run_query(session, build_shortest_route_query(ROUTE_MAX_HOPS),
+                         {"from_id": sys.argv[1], "to_id": sys.argv[2]}, timeout=EXPANSION_TIMEOUT)
+    if not rows:
+        print(f"No route from {sys.argv[1]} to {sys.argv[2]} within {ROUTE_MAX_HOPS} hops")
+    for row in rows:
+        print(f"{' -> '.join(row['stops'])}: duration {row['duration']}, distance {row['distance']}")
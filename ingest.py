@@ -0,0 +1,469 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+from database import close_driver, save_bookmarks, write_session
+from embedding_cache import EMBEDDING_DIMENSIONS, EmbeddingCache, get_embeddings
+from load_data import (BATCH_SIZE, ENTITIES, PRODUCTS, RELATIONSHIPS, ROUTES, SUPPLIERS, WAREHOUSES,
+                       _write_batch, batches, create_schema, embedding_preparer, entity_key, prune_entity,
+                       refresh_context_summaries, stage_rows)
+from query_cache import bump_graph_version
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+
+# Load environment variables
+load_dotenv()
+
+# Parallel ingest settings
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+# Ceiling on the rows read but not yet written, in megabytes (estimated)
+INGEST_MEMORY_LIMIT_MB = float(os.getenv("INGEST_MEMORY_LIMIT_MB", "512"))
+INGEST_CHECKPOINT_PATH = os.getenv("INGEST_CHECKPOINT_PATH", ".ingest_checkpoint.json")
+# Seconds between progress lines of a running stage
+INGEST_PROGRESS_SECONDS = float(os.getenv("INGEST_PROGRESS_SECONDS", "5"))
+
+# Stages in load order, each with the base name of its source file. Every node
+# stage finishes before the first relationship stage starts.
+NODE_STAGES = (("Product", "products"), ("Supplier", "suppliers"), ("Warehouse", "warehouses"))
+RELATIONSHIP_STAGES = (("CONNECTED_TO", "routes"), ("SUPPLIES", "relationships"), ("STORED_AT", "relationships"))
+SOURCE_FORMATS = (".csv", ".jsonl", ".parquet")
+
+# Start and end node keys of each relationship type, used to partition its writes
+ENDPOINTS = {
+    "CONNECTED_TO": ("from", "to"),
+    "SUPPLIES": ("supplier_id", "product_id"),
+    "STORED_AT": ("product_id", "warehouse_id"),
+}
+# Relationships whose start and end nodes have the same label, so either
+# endpoint can lock a node the other endpoint of another row also locks
+SAME_LABEL_ENDPOINTS = {"CONNECTED_TO"}
+
+# CSV columns parsed as numbers
+NUMERIC_FIELDS = {"price", "capacity", "distance", "duration"}
+
+# Estimated memory of one product's embedding: a list of EMBEDDING_DIMENSIONS
+# Python floats, each an 8-byte list slot plus a 24-byte float object
+EMBEDDING_ROW_BYTES = EMBEDDING_DIMENSIONS * 32
+
+
+def _number(value: str):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def read_csv(path: str):
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield {
+                field: (_number(value) if value else None) if field in NUMERIC_FIELDS else value
+                for field, value in row.items()
+            }
+
+
+def read_jsonl(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _parquet(path: str):
+    """pyarrow.parquet, an optional dependency only needed for Parquet sources."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError(f"Reading {path} requires pyarrow, which is not installed (pip install pyarrow)")
+    return pq
+
+
+def read_parquet(path: str, batch_size: int = None):
+    parquet_file = _parquet(path).ParquetFile(path)
+    return (row for record_batch in parquet_file.iter_batches(batch_size=batch_size or BATCH_SIZE)
+            for row in record_batch.to_pylist())
+
+
+def read_records(path: str):
+    """Stream the rows of a CSV, JSONL or Parquet file one at a time."""
+    readers = {".csv": read_csv, ".jsonl": read_jsonl, ".parquet": read_parquet}
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in readers:
+        raise ValueError(f"Unsupported source format: {path}")
+    return readers[extension](path)
+
+
+def find_source(directory: str, name: str):
+    """Return the source file for a stage (e.g. products.csv), or None if there is none."""
+    for extension in SOURCE_FORMATS:
+        path = os.path.join(directory, name + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def row_bytes(row: dict) -> int:
+    """Rough in-memory size of a row."""
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+
+
+def partition(value, partitions: int) -> int:
+    # crc32 rather than hash(), so partitions (and checkpoints) are stable across runs
+    return zlib.crc32(str(value).encode("utf-8")) % partitions
+
+
+def schedule_rounds(rows: list, start_key: str, end_key: str, partitions: int, same_label=False) -> list:
+    """Bucket relationship rows by the partitions of their endpoints, in rounds of buckets
+    that lock disjoint sets of nodes.
+
+    With different start and end labels, round r holds buckets (i, i + r):
+    no two share a start or an end partition. With the same label, a bucket
+    locks the partitions of both endpoints, so it is the unordered pair
+    {i, j}, and round r holds the pairs with i + j = r (mod partitions):
+    every partition is in at most one of them.
+    """
+    rounds = [{} for _ in range(partitions)]
+    for row in rows:
+        start, end = partition(row[start_key], partitions), partition(row[end_key], partitions)
+        if same_label:
+            cell, round_number = (min(start, end), max(start, end)), (start + end) % partitions
+        else:
+            cell, round_number = (start, end), (end - start) % partitions
+        rounds[round_number].setdefault(cell, []).append(row)
+    return [list(buckets.values()) for buckets in rounds]
+
+
+class Checkpoint:
+    """Chunks written so far by each stage, saved after every chunk so a failed run can resume.
+
+    A stage's progress is only reused while its source file, batch size and
+    worker count are unchanged, since those decide how rows are chunked.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or INGEST_CHECKPOINT_PATH
+        self._lock = threading.Lock()
+        self.stages = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.stages = json.load(f)
+
+    def begin(self, stage: str, signature: str) -> set:
+        """Return the chunks of a stage already written by a previous run with this signature."""
+        with self._lock:
+            state = self.stages.get(stage)
+            if state is None or state["signature"] != signature:
+                state = self.stages[stage] = {"signature": signature, "done": False, "chunks": []}
+            return set(state["chunks"])
+
+    def is_done(self, stage: str, signature: str) -> bool:
+        state = self.stages.get(stage)
+        return state is not None and state["signature"] == signature and state["done"]
+
+    def chunk_done(self, stage: str, index: int):
+        with self._lock:
+            self.stages[stage]["chunks"].append(index)
+            self._save()
+
+    def stage_done(self, stage: str):
+        with self._lock:
+            self.stages[stage].update(done=True, chunks=[])
+            self._save()
+
+    def _save(self):
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.stages, f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def clear(self):
+        self.stages = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Progress:
+    """Rows read and written by a stage, reported every INGEST_PROGRESS_SECONDS."""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.start = self.last_report = time.perf_counter()
+        self.read = 0
+        self.written = 0
+        self._lock = threading.Lock()
+
+    def add(self, read: int = 0, written: int = 0):
+        with self._lock:
+            self.read += read
+            self.written += written
+            now = time.perf_counter()
+            if now - self.last_report >= INGEST_PROGRESS_SECONDS:
+                self.last_report = now
+                print(f"  {self.stage}: {self.read} rows read, {self.written} written "
+                      f"({self.read / (now - self.start):.0f} rows/sec)")
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.start
+        rate = self.read / elapsed if elapsed > 0 else 0.0
+        skipped = f", {self.read - self.written} unchanged or already written" if self.read != self.written else ""
+        print(f"  {self.stage}: {self.written} rows written{skipped} in {elapsed:.2f}s ({rate:.0f} rows/sec)")
+
+
+class IngestPipeline:
+    """Streams entity files into Neo4j with a pool of workers, each with its own session.
+
+    Rows are read lazily and written in chunks of ``batch_size``; reading
+    pauses while the estimated size of unwritten chunks exceeds the memory
+    ceiling. Relationship rows are bucketed by the partitions of their start
+    and end nodes, and each round writes buckets that lock disjoint node
+    partitions (see schedule_rounds), so concurrent transactions do not lock
+    the same nodes.
+    """
+
+    def __init__(self, workers: int = None, batch_size: int = None, memory_limit_mb: float = None,
+                 incremental=False, prune=False, checkpoint: Checkpoint = None, embeddings=None):
+        self.workers = workers or INGEST_WORKERS
+        self.batch_size = batch_size or BATCH_SIZE
+        self.memory_limit = (memory_limit_mb or INGEST_MEMORY_LIMIT_MB) * 1024 * 1024
+        self.incremental = incremental
+        self.prune = prune
+        self.checkpoint = checkpoint or Checkpoint()
+        self.embeddings = embeddings
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = write_session()
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def _close_sessions(self):
+        with self._sessions_lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+        self._local = threading.local()
+
+    def _write(self, entity: str, rows: list, prepare=None) -> int:
+        written = 0
+        for batch in batches(rows, self.batch_size):
+            batch = stage_rows(entity, batch, self.incremental, prepare=prepare)
+            if batch:
+                self._session().execute_write(_write_batch, ENTITIES[entity]["write"], batch)
+                written += len(batch)
+        return written
+
+    def _signature(self, path: str) -> str:
+        stat = os.stat(path)
+        return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}:{self.batch_size}:{self.workers}"
+
+    def load_nodes(self, executor, entity: str, path: str, prepare=None) -> int:
+        """Write one node file in parallel chunks."""
+        spec = ENTITIES[entity]
+        done = self.checkpoint.begin(entity, self._signature(path))
+        progress = Progress(entity)
+        source_keys = set()
+        # future -> (chunk index, estimated bytes)
+        pending = {}
+        in_flight = 0
+
+        def collect(futures):
+            nonlocal in_flight
+            errors = []
+            for future in futures:
+                index, size = pending.pop(future)
+                in_flight -= size
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                    continue
+                progress.add(written=future.result())
+                self.checkpoint.chunk_done(entity, index)
+            if errors:
+                # Record the chunks still being written before failing, so a rerun skips them
+                if pending:
+                    collect(wait(pending).done)
+                raise errors[0]
+
+        for index, chunk in enumerate(batches(read_records(path), self.batch_size)):
+            if self.prune:
+                source_keys.update(entity_key(row, spec["key"]) for row in chunk)
+            progress.add(read=len(chunk))
+            if index in done:
+                continue
+            size = sum(row_bytes(row) for row in chunk)
+            if entity == "Product":
+                size += len(chunk) * EMBEDDING_ROW_BYTES
+            # Stop reading while the unwritten chunks are over the memory ceiling
+            while pending and in_flight + size > self.memory_limit:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            pending[executor.submit(self._write, entity, chunk, prepare)] = (index, size)
+            in_flight += size
+        while pending:
+            collect(wait(pending, return_when=FIRST_COMPLETED).done)
+
+        progress.finish()
+        self.checkpoint.stage_done(entity)
+        changed = progress.written
+        if self.prune:
+            changed += prune_entity(entity, source_keys, self.batch_size)
+        return changed
+
+    def load_relationships(self, executor, entity: str, path: str) -> int:
+        """Write one relationship file in windows of partitioned rounds."""
+        spec = ENTITIES[entity]
+        start_key, end_key = ENDPOINTS[entity]
+        partitions = self.workers
+        window_rows = self.batch_size * partitions * partitions
+        done = self.checkpoint.begin(entity, self._signature(path))
+        progress = Progress(entity)
+        source_keys = set()
+
+        def flush(window):
+            # The buckets of a round touch disjoint node partitions, so they are written concurrently
+            for buckets in schedule_rounds(window, start_key, end_key, partitions, entity in SAME_LABEL_ENDPOINTS):
+                futures = [executor.submit(self._write, entity, bucket) for bucket in buckets]
+                for future in futures:
+                    progress.add(written=future.result())
+
+        window, size = [], 0
+        for number, row in enumerate(read_records(path)):
+            index = number // window_rows
+            if number and number % window_rows == 0:
+                # The previous window is complete
+                if window:
+                    flush(window)
+                if index - 1 not in done:
+                    self.checkpoint.chunk_done(entity, index - 1)
+                window, size = [], 0
+            if self.prune:
+                source_keys.add(entity_key(row, spec["key"]))
+            progress.add(read=1)
+            if index in done:
+                continue
+            window.append(row)
+            size += row_bytes(row)
+            # Over the memory ceiling: write what the window holds so far
+            if size > self.memory_limit:
+                flush(window)
+                window, size = [], 0
+        if window:
+            flush(window)
+
+        progress.finish()
+        self.checkpoint.stage_done(entity)
+        changed = progress.written
+        if self.prune:
+            changed += prune_entity(entity, source_keys, self.batch_size)
+        return changed
+
+    def run(self, sources: dict, rebuild_summaries=False) -> int:
+        """Load every stage with a source file (``{entity: path}``) and return the rows changed."""
+        print("Creating constraints and indexes...")
+        create_schema()
+        cache = EmbeddingCache()
+        changed = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest") as executor:
+                for entity, _ in NODE_STAGES + RELATIONSHIP_STAGES:
+                    path = sources.get(entity)
+                    if path is None:
+                        continue
+                    if self.checkpoint.is_done(entity, self._signature(path)):
+                        print(f"  {entity}: already loaded, skipping (checkpoint)")
+                        continue
+                    print(f"Loading {entity} from {path}...")
+                    if entity in ENDPOINTS:
+                        changed += self.load_relationships(executor, entity, path)
+                    else:
+                        prepare = None
+                        if entity == "Product":
+                            prepare = embedding_preparer(self.embeddings or get_embeddings(), cache)
+                        changed += self.load_nodes(executor, entity, path, prepare)
+        except Exception:
+            print(f"Ingest failed; rerun to resume from {self.checkpoint.path}")
+            raise
+        finally:
+            self._close_sessions()
+            cache.close()
+
+        print("Refreshing context summaries...")
+        changed += refresh_context_summaries(rebuild=rebuild_summaries)
+
+        # Invalidate cached retrieval results in running apps
+        if changed:
+            with write_session() as session:
+                bump_graph_version(session)
+        # Reads in the apps wait for these writes (see database.read_session)
+        save_bookmarks()
+        self.checkpoint.clear()
+        print("Data loading completed!")
+        return changed
+
+
+def find_sources(directory: str) -> dict:
+    """Map each stage to its source file in a directory."""
+    sources = {}
+    for entity, name in NODE_STAGES + RELATIONSHIP_STAGES:
+        path = find_source(directory, name)
+        if path:
+            # Fail before anything is written, not when the stage reaches the file
+            if path.endswith(".parquet"):
+                _parquet(path)
+            sources[entity] = path
+    return sources
+
+
+def export_sample(directory: str):
+    """Write the sample data of load_data.py as JSONL source files."""
+    os.makedirs(directory, exist_ok=True)
+    for name, rows in (("products", PRODUCTS), ("suppliers", SUPPLIERS), ("warehouses", WAREHOUSES),
+                       ("routes", ROUTES), ("relationships", RELATIONSHIPS)):
+        with open(os.path.join(directory, name + ".jsonl"), "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream supply chain data files into Neo4j in parallel.")
+    parser.add_argument("directory", help="directory with products, suppliers, warehouses, routes and "
+                                          "relationships files (.csv, .jsonl or .parquet)")
+    parser.add_argument("--workers", type=int, help="parallel writers (default INGEST_WORKERS)")
+    parser.add_argument("--batch-size", type=int, help="rows per transaction (default INGEST_BATCH_SIZE)")
+    parser.add_argument("--memory-limit-mb", type=float, help="ceiling on unwritten rows in memory")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only write and re-embed rows whose content hash changed")
+    parser.add_argument("--prune", action="store_true",
+                        help="delete entities that are no longer in the source data")
+    parser.add_argument("--rebuild-summaries", action="store_true",
+                        help="re-render the context summary of every product, not just changed ones")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint of a failed run")
+    parser.add_argument("--export-sample", action="store_true",
+                        help="write the built-in sample data to the directory and exit")
+    args = parser.parse_args()
+
+    if args.export_sample:
+        export_sample(args.directory)
+        sys.exit(0)
+    try:
+        sources = find_sources(args.directory)
+    except ValueError as e:
+        sys.exit(str(e))
+    if not sources:
+        sys.exit(f"No source files found in {args.directory}")
+
+    checkpoint = Checkpoint()
+    if args.restart:
+        checkpoint.clear()
+    pipeline = IngestPipeline(args.workers, args.batch_size, args.memory_limit_mb, args.incremental,
+                              args.prune, checkpoint)
+    try:
+        pipeline.run(sources, rebuild_summaries=args.rebuild_summaries)
+    finally:
+        close_driver()
@@ -1,206 +1,613 @@
-from neo4j import GraphDatabase
-from langchain_community.embeddings import OpenAIEmbeddings
-from langchain_core.documents import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Neo4jVector
-import os
 from dotenv import load_dotenv
+from database import close_driver, save_bookmarks, write_session
+from embedding_cache import (EMBEDDING_DIMENSIONS, EmbeddingCache, embed_texts, full_embedding_bytes,
+                             get_embeddings, reduce_embedding)
+from query_cache import bump_graph_version
+from retrieval import NEIGHBOUR_SUBQUERIES, neighbour_params, render_product_summary
+import argparse
+import hashlib
+import json
+import os
+import time
 
 # Load environment variables
 load_dotenv()
 
-# Neo4j connection details
-URI = os.getenv("NEO4J_URI")
-AUTH = (os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD"))
+# Number of rows sent to Neo4j per UNWIND transaction
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
 
-# Initialize Neo4j driver
-driver = GraphDatabase.driver(URI, auth=AUTH)
+# Sample product data
+PRODUCTS = [
+    {
+        "id": "P1",
+        "name": "Laptop",
+        "description": "High-performance laptop with 16GB RAM and 512GB SSD, perfect for business and creative work",
+        "price": 999.99,
+        "category": "Electronics"
+    },
+    {
+        "id": "P2",
+        "name": "Smartphone",
+        "description": "Latest smartphone with 5G capability, 128GB storage, and advanced camera system",
+        "price": 699.99,
+        "category": "Electronics"
+    },
+    {
+        "id": "P3",
+        "name": "Wireless Headphones",
+        "description": "Premium noise-cancelling wireless headphones with 30-hour battery life",
+        "price": 249.99,
+        "category": "Audio"
+    },
+    {
+        "id": "P4",
+        "name": "Smart Watch",
+        "description": "Fitness tracker and smartwatch with heart rate monitoring and GPS",
+        "price": 199.99,
+        "category": "Wearables"
+    },
+    {
+        "id": "P5",
+        "name": "Tablet",
+        "description": "10-inch tablet with 256GB storage, perfect for entertainment and productivity",
+        "price": 449.99,
+        "category": "Electronics"
+    }
+]
 
-def load_products():
-    """Load product data into Neo4j and create vector embeddings."""
-    # Sample product data
-    products = [
-        {
-            "id": "P1",
-            "name": "Laptop",
-            "description": "High-performance laptop with 16GB RAM and 512GB SSD, perfect for business and creative work",
-            "price": 999.99,
-            "category": "Electronics"
-        },
-        {
-            "id": "P2",
-            "name": "Smartphone",
-            "description": "Latest smartphone with 5G capability, 128GB storage, and advanced camera system",
-            "price": 699.99,
-            "category": "Electronics"
-        },
-        {
-            "id": "P3",
-            "name": "Wireless Headphones",
-            "description": "Premium noise-cancelling wireless headphones with 30-hour battery life",
-            "price": 249.99,
-            "category": "Audio"
-        },
-        {
-            "id": "P4",
-            "name": "Smart Watch",
-            "description": "Fitness tracker and smartwatch with heart rate monitoring and GPS",
-            "price": 199.99,
-            "category": "Wearables"
-        },
-        {
-            "id": "P5",
-            "name": "Tablet",
-            "description": "10-inch tablet with 256GB storage, perfect for entertainment and productivity",
-            "price": 449.99,
-            "category": "Electronics"
-        }
+SUPPLIERS = [
+    {"id": "S1", "name": "Tech Supplier Inc", "location": "USA", "specialization": "Electronics"},
+    {"id": "S2", "name": "Global Electronics", "location": "China", "specialization": "Components"},
+    {"id": "S3", "name": "Audio Solutions Ltd", "location": "Germany", "specialization": "Audio Equipment"},
+    {"id": "S4", "name": "Wearable Tech Co", "location": "South Korea", "specialization": "Wearables"},
+    {"id": "S5", "name": "Smart Devices Corp", "location": "Japan", "specialization": "Smart Devices"}
+]
+
+WAREHOUSES = [
+    {"id": "W1", "name": "Main Warehouse", "location": "New York", "capacity": 10000},
+    {"id": "W2", "name": "West Coast Hub", "location": "Los Angeles", "capacity": 8000},
+    {"id": "W3", "name": "European Distribution", "location": "Amsterdam", "capacity": 7500},
+    {"id": "W4", "name": "Asia Pacific Center", "location": "Singapore", "capacity": 9000},
+    {"id": "W5", "name": "Southern Hub", "location": "Miami", "capacity": 6000}
+]
+
+ROUTES = [
+    {"from": "W1", "to": "W2", "distance": 2800, "duration": 48},
+    {"from": "W2", "to": "W1", "distance": 2800, "duration": 48}
+]
+
+RELATIONSHIPS = [
+    {"product_id": "P1", "supplier_id": "S1", "warehouse_id": "W1"},
+    {"product_id": "P2", "supplier_id": "S2", "warehouse_id": "W2"},
+    {"product_id": "P3", "supplier_id": "S3", "warehouse_id": "W3"},
+    {"product_id": "P4", "supplier_id": "S4", "warehouse_id": "W4"},
+    {"product_id": "P5", "supplier_id": "S5", "warehouse_id": "W5"},
+    # Additional relationships for redundancy
+    {"product_id": "P1", "supplier_id": "S2", "warehouse_id": "W5"},
+    {"product_id": "P2", "supplier_id": "S1", "warehouse_id": "W3"},
+    {"product_id": "P3", "supplier_id": "S5", "warehouse_id": "W1"},
+    {"product_id": "P4", "supplier_id": "S3", "warehouse_id": "W2"},
+    {"product_id": "P5", "supplier_id": "S4", "warehouse_id": "W4"}
+]
+
+PRODUCT_QUERY = """
+    UNWIND $rows AS row
+    MERGE (p:Product {id: row.id})
+    SET p.name = row.name,
+        p.description = row.description,
+        p.price = row.price,
+        p.category = row.category,
+        p.description_embedding = row.embedding,
+        p.description_embedding_full = row.embedding_full,
+        p.content_hash = row.content_hash,
+        p.context_stale = true,
+        p.updated_at = timestamp()
+"""
+
+SUPPLIER_QUERY = """
+    UNWIND $rows AS row
+    MERGE (s:Supplier {id: row.id})
+    SET s.name = row.name,
+        s.location = row.location,
+        s.specialization = row.specialization,
+        s.content_hash = row.content_hash
+    WITH s
+    MATCH (s)-[:SUPPLIES]->(p:Product)
+    SET p.context_stale = true
+"""
+
+WAREHOUSE_QUERY = """
+    UNWIND $rows AS row
+    MERGE (w:Warehouse {id: row.id})
+    SET w.name = row.name,
+        w.location = row.location,
+        w.capacity = row.capacity,
+        w.content_hash = row.content_hash
+    WITH w
+    MATCH (p:Product)-[:STORED_AT]->(w)
+    SET p.context_stale = true
+"""
+
+ROUTE_QUERY = """
+    UNWIND $rows AS row
+    MATCH (w1:Warehouse {id: row.from})
+    MATCH (w2:Warehouse {id: row.to})
+    MERGE (w1)-[r:CONNECTED_TO]->(w2)
+    SET r.distance = row.distance,
+        r.duration = row.duration,
+        r.content_hash = row.content_hash
+"""
+
+SUPPLIES_QUERY = """
+    UNWIND $rows AS row
+    MATCH (s:Supplier {id: row.supplier_id})
+    MATCH (p:Product {id: row.product_id})
+    MERGE (s)-[r:SUPPLIES]->(p)
+    SET r.content_hash = row.content_hash,
+        p.context_stale = true
+"""
+
+STORED_AT_QUERY = """
+    UNWIND $rows AS row
+    MATCH (p:Product {id: row.product_id})
+    MATCH (w:Warehouse {id: row.warehouse_id})
+    MERGE (p)-[r:STORED_AT]->(w)
+    SET r.content_hash = row.content_hash,
+        p.context_stale = true
+"""
+
+# Products whose context summary must be re-rendered, with their live neighbours.
+# Summaries are written back by id, so a product without one could never be
+# cleared and would be selected again forever.
+STALE_SUMMARIES_QUERY = """
+    MATCH (p:Product)
+    WHERE p.context_stale = true AND p.id IS NOT NULL
+    WITH p
+    LIMIT $batch_size
+""" + NEIGHBOUR_SUBQUERIES + """
+    RETURN p.id AS id, p.name AS name, p.description AS description, suppliers, warehouses
+"""
+
+CONTEXT_SUMMARY_QUERY = """
+    UNWIND $rows AS row
+    MATCH (p:Product {id: row.id})
+    SET p.context_summary = row.summary
+    REMOVE p.context_stale
+"""
+
+# How each entity type is written, identified, hashed and pruned. "key" lists
+# the fields that identify a row, "fields" the ones covered by its content hash.
+ENTITIES = {
+    "Product": {
+        "write": PRODUCT_QUERY,
+        "key": ("id",),
+        "fields": ("id", "name", "description", "price", "category"),
+        "lookup": """
+            UNWIND $rows AS row
+            MATCH (n:Product {id: row.id})
+            RETURN row.key AS key, n.content_hash AS hash
+        """,
+        "existing": "MATCH (n:Product) RETURN n.id AS id",
+        "delete": "UNWIND $rows AS row MATCH (n:Product {id: row.id}) DETACH DELETE n",
+    },
+    "Supplier": {
+        "write": SUPPLIER_QUERY,
+        "key": ("id",),
+        "fields": ("id", "name", "location", "specialization"),
+        "lookup": """
+            UNWIND $rows AS row
+            MATCH (n:Supplier {id: row.id})
+            RETURN row.key AS key, n.content_hash AS hash
+        """,
+        "existing": "MATCH (n:Supplier) RETURN n.id AS id",
+        "delete": """
+            UNWIND $rows AS row
+            MATCH (n:Supplier {id: row.id})
+            OPTIONAL MATCH (n)-[:SUPPLIES]->(p:Product)
+            SET p.context_stale = true
+            WITH DISTINCT n
+            DETACH DELETE n
+        """,
+    },
+    "Warehouse": {
+        "write": WAREHOUSE_QUERY,
+        "key": ("id",),
+        "fields": ("id", "name", "location", "capacity"),
+        "lookup": """
+            UNWIND $rows AS row
+            MATCH (n:Warehouse {id: row.id})
+            RETURN row.key AS key, n.content_hash AS hash
+        """,
+        "existing": "MATCH (n:Warehouse) RETURN n.id AS id",
+        "delete": """
+            UNWIND $rows AS row
+            MATCH (n:Warehouse {id: row.id})
+            OPTIONAL MATCH (p:Product)-[:STORED_AT]->(n)
+            SET p.context_stale = true
+            WITH DISTINCT n
+            DETACH DELETE n
+        """,
+    },
+    "CONNECTED_TO": {
+        "write": ROUTE_QUERY,
+        "key": ("from", "to"),
+        "fields": ("from", "to", "distance", "duration"),
+        "lookup": """
+            UNWIND $rows AS row
+            MATCH (:Warehouse {id: row.from})-[r:CONNECTED_TO]->(:Warehouse {id: row.to})
+            RETURN row.key AS key, r.content_hash AS hash
+        """,
+        "existing": """
+            MATCH (w1:Warehouse)-[:CONNECTED_TO]->(w2:Warehouse)
+            RETURN w1.id AS from, w2.id AS to
+        """,
+        "delete": """
+            UNWIND $rows AS row
+            MATCH (:Warehouse {id: row.from})-[r:CONNECTED_TO]->(:Warehouse {id: row.to})
+            DELETE r
+        """,
+    },
+    "SUPPLIES": {
+        "write": SUPPLIES_QUERY,
+        "key": ("supplier_id", "product_id"),
+        "fields": ("supplier_id", "product_id"),
+        "lookup": """
+            UNWIND $rows AS row
+            MATCH (:Supplier {id: row.supplier_id})-[r:SUPPLIES]->(:Product {id: row.product_id})
+            RETURN row.key AS key, r.content_hash AS hash
+        """,
+        "existing": """
+            MATCH (s:Supplier)-[:SUPPLIES]->(p:Product)
+            RETURN s.id AS supplier_id, p.id AS product_id
+        """,
+        "delete": """
+            UNWIND $rows AS row
+            MATCH (:Supplier {id: row.supplier_id})-[r:SUPPLIES]->(p:Product {id: row.product_id})
+            SET p.context_stale = true
+            DELETE r
+        """,
+    },
+    "STORED_AT": {
+        "write": STORED_AT_QUERY,
+        "key": ("product_id", "warehouse_id"),
+        "fields": ("product_id", "warehouse_id"),
+        "lookup": """
+            UNWIND $rows AS row
+            MATCH (:Product {id: row.product_id})-[r:STORED_AT]->(:Warehouse {id: row.warehouse_id})
+            RETURN row.key AS key, r.content_hash AS hash
+        """,
+        "existing": """
+            MATCH (p:Product)-[:STORED_AT]->(w:Warehouse)
+            RETURN p.id AS product_id, w.id AS warehouse_id
+        """,
+        "delete": """
+            UNWIND $rows AS row
+            MATCH (p:Product {id: row.product_id})-[r:STORED_AT]->(:Warehouse {id: row.warehouse_id})
+            SET p.context_stale = true
+            DELETE r
+        """,
+    },
+}
+
+
+def content_hash(row: dict, fields) -> str:
+    """Hash the fields of a row that are written to the graph."""
+    payload = json.dumps([row.get(field) for field in fields], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def entity_key(row: dict, fields) -> str:
+    """Identify a row by its key fields."""
+    return "\x1f".join(str(row[field]) for field in fields)
+
+
+def batches(rows, batch_size=None):
+    """Yield successive lists of at most batch_size rows."""
+    batch_size = batch_size or BATCH_SIZE
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _write_batch(tx, query, rows):
+    tx.run(query, rows=rows).consume()
+
+
+def write_batches(entity: str, query: str, rows, batch_size=None, prepare=None) -> int:
+    """Write rows in UNWIND batches, one managed write transaction per batch.
+
+    ``prepare`` may transform or drop rows of each batch before it is sent
+    (e.g. to add embeddings or skip unchanged rows). Prints the throughput for
+    the entity type and returns the number of rows written.
+    """
+    start = time.perf_counter()
+    read = 0
+    written = 0
+    with write_session() as session:
+        for batch in batches(rows, batch_size):
+            read += len(batch)
+            if prepare:
+                batch = prepare(batch)
+            if batch:
+                session.execute_write(_write_batch, query, batch)
+                written += len(batch)
+
+    elapsed = time.perf_counter() - start
+    rate = read / elapsed if elapsed > 0 else 0.0
+    skipped = f", {read - written} unchanged" if read != written else ""
+    print(f"  {entity}: {written} rows written{skipped} in {elapsed:.2f}s ({rate:.0f} rows/sec)")
+    return written
+
+
+def _read_records(tx, query: str, params: dict = None) -> list:
+    return list(tx.run(query, params))
+
+
+def unchanged_keys(entity: str, rows: list) -> set:
+    """Return the keys of rows whose stored content hash matches the incoming one."""
+    # Read on a reader, but after this load's own writes (the session shares their bookmarks)
+    with write_session() as session:
+        records = session.execute_read(_read_records, ENTITIES[entity]["lookup"], {"rows": rows})
+    hashes = {row["key"]: row["content_hash"] for row in rows}
+    return {record["key"] for record in records if record["hash"] == hashes[record["key"]]}
+
+
+def prune_entity(entity: str, source_keys: set, batch_size=None) -> int:
+    """Delete entities of a type that are no longer present in the source."""
+    spec = ENTITIES[entity]
+    with write_session() as session:
+        records = session.execute_read(_read_records, spec["existing"])
+        stale = [record.data() for record in records if entity_key(record, spec["key"]) not in source_keys]
+        for batch in batches(stale, batch_size):
+            session.execute_write(_write_batch, spec["delete"], batch)
+    if stale:
+        print(f"  {entity}: {len(stale)} stale rows deleted")
+    return len(stale)
+
+
+def stage_rows(entity: str, batch: list, incremental=False, source_keys: set = None, prepare=None) -> list:
+    """Key and hash a batch of rows, then drop unchanged rows (``incremental``) and apply ``prepare``.
+
+    The keys of all rows are added to ``source_keys`` when it is given, for pruning.
+    """
+    spec = ENTITIES[entity]
+    batch = [
+        dict(row, key=entity_key(row, spec["key"]), content_hash=content_hash(row, spec["fields"]))
+        for row in batch
     ]
-    
-    # Create vector index for product descriptions
-    with driver.session() as session:
-        session.run("""
+    if source_keys is not None:
+        source_keys.update(row["key"] for row in batch)
+    if incremental:
+        unchanged = unchanged_keys(entity, batch)
+        batch = [row for row in batch if row["key"] not in unchanged]
+    if prepare and batch:
+        batch = prepare(batch)
+    return batch
+
+
+def load_entity(entity: str, rows, batch_size=None, incremental=False, prune=False, prepare=None) -> int:
+    """Write rows of one entity type and return the number of rows changed.
+
+    Every row gets a content hash. With ``incremental`` only rows whose hash
+    differs from the stored one are written (and passed to ``prepare``); with
+    ``prune`` entities missing from ``rows`` are deleted afterwards.
+    """
+    spec = ENTITIES[entity]
+    source_keys = set() if prune else None
+
+    def stage(batch):
+        return stage_rows(entity, batch, incremental, source_keys, prepare)
+
+    changed = write_batches(entity, spec["write"], rows, batch_size, prepare=stage)
+    if prune:
+        changed += prune_entity(entity, source_keys, batch_size)
+    return changed
+
+
+def create_schema():
+    """Create uniqueness constraints, the vector index and the full-text indexes before loading."""
+    with write_session() as session:
+        # Uniqueness constraints back every MERGE on id with an index
+        for label in ("Product", "Supplier", "Warehouse"):
+            session.run(f"""
+                CREATE CONSTRAINT {label.lower()}_id IF NOT EXISTS
+                FOR (n:{label}) REQUIRE n.id IS UNIQUE
+            """)
+
+        # An index built for another EMBEDDING_DIMENSIONS cannot be queried, so replace it
+        existing = session.run("""
+            SHOW INDEXES YIELD name, options
+            WHERE name = 'product_description_embeddings'
+            RETURN options.indexConfig['vector.dimensions'] AS dimensions
+        """).single()
+        if existing and existing["dimensions"] != EMBEDDING_DIMENSIONS:
+            print(f"  Recreating the vector index for {EMBEDDING_DIMENSIONS} dimensions "
+                  f"(was {existing['dimensions']}); run a full load to re-embed products")
+            session.run("DROP INDEX product_description_embeddings")
+
+        # Create vector index for product descriptions
+        session.run(f"""
             CREATE VECTOR INDEX product_description_embeddings IF NOT EXISTS
             FOR (p:Product) ON (p.description_embedding)
-            OPTIONS {indexConfig: {
-                `vector.dimensions`: 1536,
+            OPTIONS {{indexConfig: {{
+                `vector.dimensions`: {EMBEDDING_DIMENSIONS},
                 `vector.similarity_function`: 'cosine'
-            }}
+            }}}}
         """)
-    
-    # Initialize embeddings
-    embeddings = OpenAIEmbeddings()
-    
-    # Process each product
-    for product in products:
-        # Create document for embedding
-        doc = Document(
-            page_content=product["description"],
-            metadata={"id": product["id"]}
-        )
-        
-        # Generate embedding
-        embedding = embeddings.embed_documents([doc.page_content])[0]
-        
-        # Create product node with embedding
-        with driver.session() as session:
-            session.run("""
-                MERGE (p:Product {id: $id})
-                SET p.name = $name,
-                    p.description = $description,
-                    p.price = $price,
-                    p.category = $category,
-                    p.description_embedding = $embedding
-            """, {
-                "id": product["id"],
-                "name": product["name"],
-                "description": product["description"],
-                "price": product["price"],
-                "category": product["category"],
-                "embedding": embedding
-            })
-
-def load_suppliers():
+
+        # Lets the summary refresh find stale products without a label scan
+        session.run("""
+            CREATE INDEX product_context_stale IF NOT EXISTS
+            FOR (p:Product) ON (p.context_stale)
+        """)
+
+        # Lets the local vector index (local_index.py) pull only changed products
+        session.run("""
+            CREATE INDEX product_updated_at IF NOT EXISTS
+            FOR (p:Product) ON (p.updated_at)
+        """)
+
+        # Full-text indexes for exact-term matches on names and descriptions
+        for label, index_name, properties in (
+            ("Product", "product_fulltext", ("name", "description", "category")),
+            ("Supplier", "supplier_fulltext", ("name", "location", "specialization")),
+            ("Warehouse", "warehouse_fulltext", ("name", "location")),
+        ):
+            fields = ", ".join(f"n.{prop}" for prop in properties)
+            session.run(f"""
+                CREATE FULLTEXT INDEX {index_name} IF NOT EXISTS
+                FOR (n:{label}) ON EACH [{fields}]
+                OPTIONS {{indexConfig: {{`fulltext.analyzer`: 'english'}}}}
+            """)
+
+
+def embedding_preparer(embeddings, cache):
+    """Return a batch ``prepare`` step that adds description embeddings to product rows."""
+    def add_embeddings(batch):
+        # Embed the batch concurrently, only calling the API for unseen text
+        vectors = embed_texts(embeddings, [product["description"] for product in batch], cache)
+        # The index gets the (possibly reduced) vector, re-ranking the full one
+        return [
+            dict(product, embedding=reduce_embedding(vector), embedding_full=full_embedding_bytes(vector))
+            for product, vector in zip(batch, vectors)
+        ]
+    return add_embeddings
+
+
+def load_products(products=None, batch_size=None, incremental=False, prune=False,
+                  embeddings=None, cache=None):
+    """Load product data into Neo4j and create vector embeddings."""
+    products = PRODUCTS if products is None else products
+
+    # Initialize embeddings and the on-disk cache of previously embedded text
+    embeddings = embeddings or get_embeddings()
+    owns_cache = cache is None
+    cache = cache or EmbeddingCache()
+
+    try:
+        # Only new or changed products are embedded in incremental mode
+        return load_entity("Product", products, batch_size, incremental, prune,
+                           prepare=embedding_preparer(embeddings, cache))
+    finally:
+        if owns_cache:
+            cache.close()
+
+
+def load_suppliers(suppliers=None, batch_size=None, incremental=False, prune=False):
     """Load supplier data into Neo4j."""
-    suppliers = [
-        {"id": "S1", "name": "Tech Supplier Inc", "location": "USA", "specialization": "Electronics"},
-        {"id": "S2", "name": "Global Electronics", "location": "China", "specialization": "Components"},
-        {"id": "S3", "name": "Audio Solutions Ltd", "location": "Germany", "specialization": "Audio Equipment"},
-        {"id": "S4", "name": "Wearable Tech Co", "location": "South Korea", "specialization": "Wearables"},
-        {"id": "S5", "name": "Smart Devices Corp", "location": "Japan", "specialization": "Smart Devices"}
-    ]
-    
-    with driver.session() as session:
-        for supplier in suppliers:
-            session.run("""
-                MERGE (s:Supplier {id: $id})
-                SET s.name = $name,
-                    s.location = $location,
-                    s.specialization = $specialization
-            """, supplier)
+    suppliers = SUPPLIERS if suppliers is None else suppliers
+    return load_entity("Supplier", suppliers, batch_size, incremental, prune)
+
 
-def load_warehouses():
+def load_warehouses(warehouses=None, batch_size=None, incremental=False, prune=False):
     """Load warehouse data into Neo4j."""
-    warehouses = [
-        {"id": "W1", "name": "Main Warehouse", "location": "New York", "capacity": 10000},
-        {"id": "W2", "name": "West Coast Hub", "location": "Los Angeles", "capacity": 8000},
-        {"id": "W3", "name": "European Distribution", "location": "Amsterdam", "capacity": 7500},
-        {"id": "W4", "name": "Asia Pacific Center", "location": "Singapore", "capacity": 9000},
-        {"id": "W5", "name": "Southern Hub", "location": "Miami", "capacity": 6000}
-    ]
-    
-    with driver.session() as session:
-        for warehouse in warehouses:
-            session.run("""
-                MERGE (w:Warehouse {id: $id})
-                SET w.name = $name,
-                    w.location = $location,
-                    w.capacity = $capacity
-            """, warehouse)
+    warehouses = WAREHOUSES if warehouses is None else warehouses
+    return load_entity("Warehouse", warehouses, batch_size, incremental, prune)
+
 
-def load_transportation_routes():
+def load_transportation_routes(routes=None, batch_size=None, incremental=False, prune=False):
     """Load transportation routes between warehouses."""
-    routes = [
-        {"from": "W1", "to": "W2", "distance": 2800, "duration": 48},
-        {"from": "W2", "to": "W1", "distance": 2800, "duration": 48}
-    ]
-    
-    with driver.session() as session:
-        for route in routes:
+    routes = ROUTES if routes is None else routes
+    return load_entity("CONNECTED_TO", routes, batch_size, incremental, prune)
+
+
+def _read_stale_summaries(tx, batch_size):
+    return [record.data() for record in tx.run(STALE_SUMMARIES_QUERY, batch_size=batch_size,
+                                                 **neighbour_params(live=True))]
+
+
+def refresh_context_summaries(batch_size=None, rebuild=False) -> int:
+    """Re-render the context summary of every product marked stale by a write.
+
+    Loader writes mark the products whose own fields, SUPPLIES/STORED_AT
+    relationships or neighbouring suppliers and warehouses changed, so an
+    incremental load only re-renders those. ``rebuild`` marks every product
+    first (e.g. after changing RETRIEVAL_NEIGHBOUR_LIMIT).
+    """
+    batch_size = batch_size or BATCH_SIZE
+    start = time.perf_counter()
+    refreshed = 0
+    with write_session() as session:
+        if rebuild:
             session.run("""
-                MATCH (w1:Warehouse {id: $from})
-                MATCH (w2:Warehouse {id: $to})
-                MERGE (w1)-[r:CONNECTED_TO]->(w2)
-                SET r.distance = $distance,
-                    r.duration = $duration
-            """, route)
-
-def create_relationships():
+                MATCH (p:Product)
+                CALL { WITH p SET p.context_stale = true } IN TRANSACTIONS OF 10000 ROWS
+            """).consume()
+        while True:
+            rows = session.execute_read(_read_stale_summaries, batch_size)
+            if not rows:
+                break
+            summaries = [
+                {"id": row["id"], "summary": render_product_summary(row["name"], row["description"],
+                                                                    row["suppliers"], row["warehouses"])}
+                for row in rows
+            ]
+            session.execute_write(_write_batch, CONTEXT_SUMMARY_QUERY, summaries)
+            refreshed += len(summaries)
+
+    elapsed = time.perf_counter() - start
+    print(f"  context summaries: {refreshed} refreshed in {elapsed:.2f}s")
+    return refreshed
+
+
+def create_relationships(relationships=None, batch_size=None, incremental=False, prune=False):
     """Create relationships between products and other entities."""
-    relationships = [
-        {"product_id": "P1", "supplier_id": "S1", "warehouse_id": "W1"},
-        {"product_id": "P2", "supplier_id": "S2", "warehouse_id": "W2"},
-        {"product_id": "P3", "supplier_id": "S3", "warehouse_id": "W3"},
-        {"product_id": "P4", "supplier_id": "S4", "warehouse_id": "W4"},
-        {"product_id": "P5", "supplier_id": "S5", "warehouse_id": "W5"},
-        # Additional relationships for redundancy
-        {"product_id": "P1", "supplier_id": "S2", "warehouse_id": "W5"},
-        {"product_id": "P2", "supplier_id": "S1", "warehouse_id": "W3"},
-        {"product_id": "P3", "supplier_id": "S5", "warehouse_id": "W1"},
-        {"product_id": "P4", "supplier_id": "S3", "warehouse_id": "W2"},
-        {"product_id": "P5", "supplier_id": "S4", "warehouse_id": "W4"}
-    ]
-    
-    with driver.session() as session:
-        for rel in relationships:
-            # Create SUPPLIES relationship between supplier and product
-            session.run("""
-                MATCH (s:Supplier {id: $supplier_id})
-                MATCH (p:Product {id: $product_id})
-                MERGE (s)-[:SUPPLIES]->(p)
-            """, rel)
-            
-            # Create STORED_AT relationship between product and warehouse
-            session.run("""
-                MATCH (p:Product {id: $product_id})
-                MATCH (w:Warehouse {id: $warehouse_id})
-                MERGE (p)-[:STORED_AT]->(w)
-            """, rel)
+    relationships = RELATIONSHIPS if relationships is None else relationships
+
+    # Create SUPPLIES relationships between suppliers and products
+    changed = load_entity("SUPPLIES", relationships, batch_size, incremental, prune)
 
-def load_all_data():
-    """Load all data into Neo4j."""
+    # Create STORED_AT relationships between products and warehouses
+    changed += load_entity("STORED_AT", relationships, batch_size, incremental, prune)
+    return changed
+
+
+def load_all_data(incremental=False, prune=False, rebuild_summaries=False):
+    """Load all data into Neo4j.
+
+    With ``incremental`` only new or changed rows are written and embedded;
+    with ``prune`` entities missing from the source data are deleted. The
+    context summaries of affected products are re-rendered afterwards
+    (of all products with ``rebuild_summaries``).
+    """
+    options = {"incremental": incremental, "prune": prune}
+    print("Creating constraints and indexes...")
+    create_schema()
     print("Loading products...")
-    load_products()
+    changed = load_products(**options)
     print("Loading suppliers...")
-    load_suppliers()
+    changed += load_suppliers(**options)
     print("Loading warehouses...")
-    load_warehouses()
+    changed += load_warehouses(**options)
     print("Loading transportation routes...")
-    load_transportation_routes()
+    changed += load_transportation_routes(**options)
     print("Creating relationships...")
-    create_relationships()
+    changed += create_relationships(**options)
+    print("Refreshing context summaries...")
+    changed += refresh_context_summaries(rebuild=rebuild_summaries)
+
+    # Invalidate cached retrieval results in running apps
+    if changed:
+        with write_session() as session:
+            bump_graph_version(session)
+    # Reads in the apps wait for these writes (see database.read_session)
+    save_bookmarks()
     print("Data loading completed!")
 
 if __name__ == "__main__":
-    load_all_data()
-    driver.close() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load supply chain data into Neo4j.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only write and re-embed rows whose content hash changed")
+    parser.add_argument("--prune", action="store_true",
+                        help="delete entities that are no longer in the source data")
+    parser.add_argument("--rebuild-summaries", action="store_true",
+                        help="re-render the context summary of every product, not just changed ones")
+    args = parser.parse_args()
+
+    load_all_data(incremental=args.incremental, prune=args.prune, rebuild_summaries=args.rebuild_summaries)
+    close_driver()
@@ -0,0 +1,559 @@
+from dotenv import load_dotenv
+from database import read_session
+from embedding_cache import reduce_embedding
+from query_cache import current_graph_version
+from retrieval import MIN_SCORE, NEIGHBOUR_CLAUSE, TOP_K, neighbour_params, run_query
+from telemetry import span
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Local vector index settings
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", ".vector_index")
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float32")  # "float32" or "int8"
+# Use the approximate (IVF) index once the catalog has this many products
+LOCAL_INDEX_IVF_MIN_VECTORS = int(os.getenv("LOCAL_INDEX_IVF_MIN_VECTORS", "100000"))
+# Number of IVF clusters searched per query
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+# Deleted products are only marked on disk; rewrite the index without them
+# once they make up this share of its rows
+LOCAL_INDEX_COMPACT_RATIO = float(os.getenv("LOCAL_INDEX_COMPACT_RATIO", "0.2"))
+
+# Rows scored per block, which bounds the float32 copy made of int8 rows
+SCORE_CHUNK = 65536
+
+EXPORT_QUERY = """
+    MATCH (p:Product)
+    WHERE p.description_embedding IS NOT NULL
+      AND ($since IS NULL OR p.updated_at >= $since)
+    RETURN p.id AS id, p.description_embedding AS embedding, p.category AS category,
+           p.price AS price, p.updated_at AS updated_at
+"""
+
+# Products of the local top-k, in rank order, with the usual neighbour context
+HYDRATE_QUERY = """
+    UNWIND range(0, size($ids) - 1) AS i
+    MATCH (p:Product {id: $ids[i]})
+    WITH p, $scores[i] AS score
+""" + NEIGHBOUR_CLAUSE
+
+
+def _read_data(tx, query: str, params: dict = None) -> list:
+    return [record.data() for record in tx.run(query, params)]
+
+
+def normalise_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize(matrix: np.ndarray) -> tuple:
+    """Symmetric per-row int8 quantization: row ~= int8 row * scale."""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def train_ivf(sample: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means centroids for an inverted-file index, trained on a sample of rows."""
+    rng = np.random.default_rng(seed)
+    sample = normalise_rows(sample.astype(np.float32))
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = sample[assignments == c]
+            # Re-seed empty clusters with a random sample row
+            centroids[c] = members.sum(axis=0) if len(members) else sample[rng.integers(len(sample))]
+        centroids = normalise_rows(centroids)
+    return centroids
+
+
+class _Snapshot:
+    """One immutable version of the index; searches use whichever snapshot was current."""
+
+    def __init__(self, ids, vectors, scales, categories, prices, since, version,
+                 centroids=None, assignments=None, trained=0, deleted=None):
+        self.ids = ids
+        # Rows of deleted products stay in place, marked, until the index is compacted
+        self.deleted = np.zeros(len(ids), dtype=bool) if deleted is None else deleted
+        self.positions = {product_id: row for row, product_id in enumerate(ids) if not self.deleted[row]}
+        self.vectors = vectors
+        self.scales = scales
+        self.categories = categories
+        self.prices = prices
+        self.since = since
+        self.version = version
+        self.centroids = centroids
+        self.assignments = assignments
+        # Catalog size the IVF clusters were trained on
+        self.trained = trained
+        self.lists = None
+        if assignments is not None:
+            # Rows grouped by cluster: rows of cluster c are order[offsets[c]:offsets[c + 1]]
+            order = np.argsort(assignments, kind="stable")
+            counts = np.bincount(assignments, minlength=len(centroids))
+            self.lists = (order, np.concatenate([[0], np.cumsum(counts)]))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def live(self) -> int:
+        return len(self.positions)
+
+
+class LocalVectorIndex:
+    """Product embeddings exported from Neo4j into a memory-mapped matrix.
+
+    Top-k is a vectorised dot product over float32 or int8-quantized rows,
+    or over the rows of the nearest clusters of an inverted-file (IVF) index
+    for large catalogs. The index follows the graph with delta pulls of
+    products whose ``updated_at`` changed, triggered by the loader's graph
+    version marker; a sync patches changed rows in place and appends new ones.
+    """
+
+    def __init__(self, path: str = None, dtype: str = None, ivf_min_vectors: int = None, nprobe: int = None):
+        self.path = path or LOCAL_INDEX_PATH
+        self.dtype = dtype or LOCAL_INDEX_DTYPE
+        if self.dtype not in ("float32", "int8"):
+            raise ValueError(f"Unknown local index dtype: {self.dtype}")
+        self.ivf_min_vectors = LOCAL_INDEX_IVF_MIN_VECTORS if ivf_min_vectors is None else ivf_min_vectors
+        self.nprobe = nprobe or LOCAL_INDEX_NPROBE
+        self._snapshot = None
+        self._sync_lock = threading.Lock()
+
+    # Persistence
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @staticmethod
+    def _row_files(snapshot: _Snapshot) -> dict:
+        """The per-row arrays of a snapshot, each stored as a raw file of rows."""
+        files = {"vectors.bin": snapshot.vectors, "prices.bin": snapshot.prices,
+                 "deleted.bin": snapshot.deleted.astype(np.uint8)}
+        if snapshot.scales is not None:
+            files["scales.bin"] = snapshot.scales
+        if snapshot.assignments is not None:
+            files["assignments.bin"] = snapshot.assignments
+        return files
+
+    def _replace_file(self, name: str, array: np.ndarray):
+        with open(self._file(name + ".tmp"), "wb") as f:
+            f.write(np.ascontiguousarray(array).tobytes())
+        os.replace(self._file(name + ".tmp"), self._file(name))
+
+    def _save_centroids(self, centroids: np.ndarray):
+        with open(self._file("centroids.npy.tmp"), "wb") as f:
+            np.save(f, centroids)
+        os.replace(self._file("centroids.npy.tmp"), self._file("centroids.npy"))
+
+    def _write_rows(self, name: str, count: int, rows, values: np.ndarray, appended: np.ndarray):
+        """Overwrite ``rows`` of a raw file in place and append rows after its first ``count``.
+
+        Rows past ``count`` are left over from an interrupted sync and are overwritten.
+        """
+        sample = appended if len(appended) else values
+        if not len(sample):
+            return
+        row_bytes = sample[0].nbytes
+        with open(self._file(name), "r+b") as f:
+            for row, value in zip(rows, values):
+                f.seek(int(row) * row_bytes)
+                f.write(value.tobytes())
+            if len(appended):
+                f.seek(count * row_bytes)
+                f.truncate()
+                f.write(np.ascontiguousarray(appended).tobytes())
+
+    def _save_meta(self, snapshot: _Snapshot):
+        """Replace meta.json, which makes a save visible: readers only map the rows it counts."""
+        meta = {
+            "dtype": self.dtype,
+            "count": len(snapshot),
+            "dimensions": snapshot.vectors.shape[1],
+            "since": snapshot.since,
+            "version": snapshot.version,
+            "ivf": snapshot.centroids is not None,
+            "trained": snapshot.trained,
+            "ids": snapshot.ids,
+            "categories": snapshot.categories.tolist(),
+        }
+        with open(self._file("meta.json.tmp"), "w") as f:
+            json.dump(meta, f)
+        os.replace(self._file("meta.json.tmp"), self._file("meta.json"))
+
+    def save(self, snapshot: _Snapshot):
+        """Write a whole snapshot to disk; meta.json is replaced last, so readers never see a partial index."""
+        os.makedirs(self.path, exist_ok=True)
+        for name, array in self._row_files(snapshot).items():
+            self._replace_file(name, array)
+        if snapshot.centroids is not None:
+            self._save_centroids(snapshot.centroids)
+        self._save_meta(snapshot)
+
+    def _read_rows(self, name: str, dtype, count: int) -> np.ndarray:
+        array = np.fromfile(self._file(name), dtype=dtype, count=count)
+        if len(array) != count:
+            raise ValueError(f"{name} has {len(array)} of {count} rows")
+        return array
+
+    def load(self) -> bool:
+        """Memory-map a previously saved index. Returns False if there is none (or it does not match)."""
+        try:
+            with open(self._file("meta.json")) as f:
+                meta = json.load(f)
+            if meta["dtype"] != self.dtype:
+                return False
+            count, shape = meta["count"], (meta["count"], meta["dimensions"])
+            if count:
+                vectors = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r", shape=shape)
+            else:
+                vectors = np.zeros(shape, dtype=self.dtype)
+            scales = self._read_rows("scales.bin", np.float32, count) if self.dtype == "int8" else None
+            prices = self._read_rows("prices.bin", np.float64, count)
+            deleted = self._read_rows("deleted.bin", np.uint8, count).astype(bool)
+            centroids = assignments = None
+            if meta["ivf"]:
+                centroids = np.load(self._file("centroids.npy"))
+                assignments = self._read_rows("assignments.bin", np.int32, count)
+        except (OSError, ValueError, KeyError) as e:
+            logger.info(f"No usable local vector index at {self.path}: {e}")
+            return False
+        self._snapshot = _Snapshot(meta["ids"], vectors, scales, np.array(meta["categories"], dtype=object),
+                                   prices, meta["since"], meta["version"],
+                                   centroids, assignments, meta.get("trained", 0), deleted)
+        return True
+
+    # Building and syncing
+
+    def _export(self, since=None) -> list:
+        with read_session() as session:
+            return session.execute_read(_read_data, EXPORT_QUERY, {"since": since})
+
+    def _encode(self, matrix: np.ndarray) -> tuple:
+        matrix = normalise_rows(matrix.astype(np.float32))
+        if self.dtype == "int8":
+            return quantize(matrix)
+        return matrix, None
+
+    def _assign(self, snapshot: _Snapshot, centroids: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        return np.concatenate([
+            np.argmax(self._dequantize(snapshot, rows[i:i + SCORE_CHUNK]) @ centroids.T, axis=1)
+            for i in range(0, len(rows), SCORE_CHUNK)
+        ]).astype(np.int32) if len(rows) else np.zeros(0, dtype=np.int32)
+
+    def _with_ivf(self, snapshot: _Snapshot, assignments: np.ndarray = None, changed_rows=None) -> _Snapshot:
+        """Attach the IVF index: assign only ``changed_rows`` if the clusters still fit, else retrain."""
+        if len(snapshot) < max(self.ivf_min_vectors, 1):
+            snapshot.centroids = snapshot.assignments = None
+            return snapshot
+        centroids, trained = snapshot.centroids, snapshot.trained
+        # Retrain the clusters once the catalog has grown or shrunk a lot since training
+        if centroids is None or assignments is None or not trained / 2 <= len(snapshot) <= trained * 2:
+            nlist = max(1, int(np.sqrt(len(snapshot))))
+            # Train on a sample, so int8 rows are never all dequantized at once
+            sample = np.random.default_rng(0).choice(len(snapshot), min(len(snapshot), nlist * 256), replace=False)
+            centroids = train_ivf(self._dequantize(snapshot, np.sort(sample)), nlist)
+            trained = len(snapshot)
+            assignments = self._assign(snapshot, centroids, np.arange(len(snapshot)))
+        elif len(changed_rows):
+            assignments = assignments.copy()
+            assignments[changed_rows] = self._assign(snapshot, centroids, changed_rows)
+        return _Snapshot(snapshot.ids, snapshot.vectors, snapshot.scales, snapshot.categories, snapshot.prices,
+                         snapshot.since, snapshot.version, centroids, assignments, trained, snapshot.deleted)
+
+    def build(self, rows: list = None, version: str = None) -> int:
+        """Export every product embedding from Neo4j and replace the local index.
+
+        ``rows`` (with id, embedding, category, price and updated_at) and
+        ``version`` index given products instead, e.g. in the benchmark.
+        """
+        start = time.perf_counter()
+        if rows is None:
+            version = current_graph_version()
+            rows = self._export()
+        if rows:
+            vectors, scales = self._encode(np.array([row["embedding"] for row in rows], dtype=np.float32))
+        else:
+            vectors, scales = np.zeros((0, 0), dtype=np.float32), None
+        snapshot = _Snapshot(
+            [row["id"] for row in rows], vectors, scales,
+            np.array([row["category"] for row in rows], dtype=object),
+            np.array([np.nan if row["price"] is None else row["price"] for row in rows], dtype=np.float64),
+            max((row["updated_at"] for row in rows if row.get("updated_at") is not None), default=None),
+            version,
+        )
+        snapshot = self._with_ivf(snapshot)
+        self.save(snapshot)
+        self._snapshot = snapshot
+        # Serve from the memory-mapped files rather than the copy in memory
+        self.load()
+        logger.info(f"Built local vector index of {len(rows)} products in {time.perf_counter() - start:.2f}s")
+        return len(rows)
+
+    def sync(self) -> int:
+        """Apply products changed since the last sync, and drop deleted ones. Returns the rows changed.
+
+        Only the changed rows are written: updated rows are overwritten in
+        place, new ones appended and deleted ones marked, until deletions
+        reach LOCAL_INDEX_COMPACT_RATIO of the rows and the index is compacted.
+        """
+        snapshot = self._snapshot
+        if not len(snapshot):
+            return self.build()
+        version = current_graph_version()
+        rows = self._export(since=snapshot.since)
+        if any(len(row["embedding"]) != snapshot.vectors.shape[1] for row in rows):
+            # EMBEDDING_DIMENSIONS changed: rows of another width cannot be patched into the file
+            logger.info("Embedding dimensions changed; rebuilding the local vector index")
+            return self.build()
+        new_rows = [row for row in rows if row["id"] not in snapshot.positions]
+        updated = [row for row in rows if row["id"] in snapshot.positions]
+        positions = [snapshot.positions[row["id"]] for row in updated]
+
+        # The delta only shows writes; a count mismatch means products were deleted
+        deleted_rows = []
+        with read_session() as session:
+            count = session.execute_read(_read_data, "MATCH (p:Product) WHERE p.description_embedding IS NOT NULL "
+                                                     "RETURN count(p) AS count")[0]["count"]
+            if count != snapshot.live() + len(new_rows):
+                live = {record["id"] for record in session.execute_read(
+                    _read_data, "MATCH (p:Product) WHERE p.description_embedding IS NOT NULL RETURN p.id AS id")}
+                deleted_rows = sorted(row for product_id, row in snapshot.positions.items() if product_id not in live)
+
+        changed = len(rows) + len(deleted_rows)
+        if not changed:
+            # Nothing to apply; the next sync only needs to start from this version
+            snapshot.version = version
+            return 0
+
+        size = len(snapshot)
+        encoded, encoded_scales = self._encode(np.array([row["embedding"] for row in updated + new_rows],
+                                                        dtype=np.float32))
+        price_of = [np.nan if row["price"] is None else row["price"] for row in updated + new_rows]
+        split = len(updated)
+        self._write_rows("vectors.bin", size, positions, encoded[:split], encoded[split:])
+        if encoded_scales is not None:
+            self._write_rows("scales.bin", size, positions, encoded_scales[:split], encoded_scales[split:])
+        self._write_rows("prices.bin", size, positions, np.array(price_of[:split], dtype=np.float64),
+                         np.array(price_of[split:], dtype=np.float64))
+        self._write_rows("deleted.bin", size, deleted_rows, np.ones(len(deleted_rows), dtype=np.uint8),
+                         np.zeros(len(new_rows), dtype=np.uint8))
+
+        # The per-row metadata is small, so it is kept in memory and updated there too
+        ids = snapshot.ids + [row["id"] for row in new_rows]
+        categories = np.concatenate([snapshot.categories, np.array([None] * len(new_rows), dtype=object)])
+        categories[positions + list(range(size, len(ids)))] = [row["category"] for row in updated + new_rows]
+        prices = np.concatenate([snapshot.prices, price_of[split:]])
+        prices[positions] = price_of[:split]
+        scales = snapshot.scales
+        if scales is not None:
+            scales = np.concatenate([scales, encoded_scales[split:]])
+            scales[positions] = encoded_scales[:split]
+        deleted = np.concatenate([snapshot.deleted, np.zeros(len(new_rows), dtype=bool)])
+        deleted[deleted_rows] = True
+        assignments = snapshot.assignments
+        if assignments is not None:
+            assignments = np.concatenate([assignments, np.full(len(new_rows), -1, dtype=np.int32)])
+        changed_rows = np.array(positions + list(range(size, len(ids))), dtype=np.int64)
+
+        since = max([snapshot.since] + [row["updated_at"] for row in rows if row["updated_at"] is not None],
+                    key=lambda value: -1 if value is None else value)
+        vectors = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r",
+                            shape=(len(ids), snapshot.vectors.shape[1]))
+        synced = self._with_ivf(_Snapshot(ids, vectors, scales, categories, prices, since, version,
+                                          snapshot.centroids, None, snapshot.trained, deleted),
+                                assignments, changed_rows)
+        if synced.centroids is not None:
+            if synced.centroids is snapshot.centroids:
+                self._write_rows("assignments.bin", size, changed_rows[changed_rows < size],
+                                 synced.assignments[changed_rows[changed_rows < size]], synced.assignments[size:])
+            else:
+                # Retrained (or newly large enough for IVF): every row has a new cluster
+                self._replace_file("assignments.bin", synced.assignments)
+                self._save_centroids(synced.centroids)
+        self._save_meta(synced)
+        self._snapshot = synced
+        logger.info(f"Synced local vector index: {len(rows)} upserted, {len(deleted_rows)} deleted")
+        if deleted.sum() > LOCAL_INDEX_COMPACT_RATIO * len(ids):
+            self.compact()
+        return changed
+
+    def compact(self):
+        """Rewrite the index without the rows of deleted products."""
+        snapshot = self._snapshot
+        keep = np.flatnonzero(~snapshot.deleted)
+        compacted = _Snapshot(
+            [snapshot.ids[row] for row in keep], np.asarray(snapshot.vectors[keep]),
+            None if snapshot.scales is None else snapshot.scales[keep],
+            snapshot.categories[keep], snapshot.prices[keep], snapshot.since, snapshot.version,
+            snapshot.centroids, None if snapshot.assignments is None else snapshot.assignments[keep],
+            snapshot.trained,
+        )
+        self.save(compacted)
+        self.load()
+        logger.info(f"Compacted local vector index: {len(snapshot) - len(keep)} deleted rows dropped")
+
+    def open(self):
+        """Load the saved index, or build it from Neo4j; then catch up with the graph."""
+        with self._sync_lock:
+            if self._snapshot is None and not self.load():
+                self.build()
+            elif self._snapshot.version != current_graph_version():
+                self.sync()
+        return self
+
+    def maybe_sync(self):
+        """Pull changes if the loader bumped the graph version. Never blocks on a sync in progress."""
+        if self._snapshot is not None and self._snapshot.version == current_graph_version():
+            return
+        if self._sync_lock.acquire(blocking=False):
+            try:
+                if self._snapshot is None:
+                    if not self.load():
+                        self.build()
+                if self._snapshot.version != current_graph_version():
+                    with span("local_index_sync"):
+                        self.sync()
+            finally:
+                self._sync_lock.release()
+
+    # Search
+
+    def _dequantize(self, snapshot: _Snapshot, rows: np.ndarray) -> np.ndarray:
+        block = np.asarray(snapshot.vectors[rows], dtype=np.float32)
+        if snapshot.scales is not None:
+            block *= snapshot.scales[rows][:, None]
+        return block
+
+    def _scores(self, snapshot: _Snapshot, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        if snapshot.scales is None and len(rows) == len(snapshot):
+            return np.asarray(snapshot.vectors @ query)
+        return np.concatenate([
+            self._dequantize(snapshot, rows[i:i + SCORE_CHUNK]) @ query
+            for i in range(0, len(rows), SCORE_CHUNK)
+        ]) if len(rows) else np.zeros(0, dtype=np.float32)
+
+    def _candidate_rows(self, snapshot: _Snapshot, query: np.ndarray):
+        if snapshot.lists is None:
+            return None
+        order, offsets = snapshot.lists
+        probed = np.argsort(-(snapshot.centroids @ query))[:self.nprobe]
+        return np.sort(np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probed]))
+
+    def _top_k(self, snapshot, rows, query, top_k, min_score, category, min_price, max_price) -> list:
+        mask = ~snapshot.deleted[rows]
+        if category is not None:
+            mask &= snapshot.categories[rows] == category
+        if min_price is not None:
+            mask &= snapshot.prices[rows] >= min_price
+        if max_price is not None:
+            mask &= snapshot.prices[rows] <= max_price
+        rows = rows[mask]
+        # Same score scale as the cosine vector index: (1 + cos) / 2
+        scores = (1 + self._scores(snapshot, rows, query)) / 2
+        keep = scores >= min_score
+        rows, scores = rows[keep], scores[keep]
+        if len(rows) > top_k:
+            top = np.argpartition(-scores, top_k)[:top_k]
+            rows, scores = rows[top], scores[top]
+        ranked = np.argsort(-scores)
+        return [(snapshot.ids[row], float(score)) for row, score in zip(rows[ranked], scores[ranked])]
+
+    def search(self, embedding, top_k: int = None, min_score: float = None, category=None,
+               min_price=None, max_price=None) -> list:
+        """Return ``(product_id, score)`` pairs of the top-k products, best first."""
+        top_k = top_k or TOP_K
+        min_score = MIN_SCORE if min_score is None else min_score
+        snapshot = self._snapshot
+        if snapshot is None or not len(snapshot):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        filters = (category, min_price, max_price)
+
+        candidates = self._candidate_rows(snapshot, query)
+        if candidates is not None:
+            results = self._top_k(snapshot, candidates, query, top_k, min_score, *filters)
+            if len(results) == top_k:
+                return results
+            # Too few matches in the probed clusters (e.g. a narrow filter): search everything
+        return self._top_k(snapshot, np.arange(len(snapshot)), query, top_k, min_score, *filters)
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"count": 0}
+        return {
+            "count": snapshot.live(),
+            "deleted": len(snapshot) - snapshot.live(),
+            "dtype": self.dtype,
+            "bytes": int(snapshot.vectors.nbytes + (0 if snapshot.scales is None else snapshot.scales.nbytes)),
+            "ivf_lists": 0 if snapshot.centroids is None else len(snapshot.centroids),
+            "version": snapshot.version,
+        }
+
+
+def hydrate_request(results: list) -> tuple:
+    """The (query, params) that fetches the neighbour context of locally ranked products."""
+    params = {
+        "ids": [product_id for product_id, _ in results],
+        "scores": [score for _, score in results],
+        **neighbour_params(),
+    }
+    return HYDRATE_QUERY, params
+
+
+class LocalRetriever:
+    """Vector search in process; Neo4j is only asked for the winners' neighbour context."""
+
+    # Only answers vector similarity, so keyword matches are still looked up separately
+    fuses_keywords = False
+
+    def __init__(self, index: LocalVectorIndex = None):
+        self.index = index or LocalVectorIndex().open()
+
+    def _search(self, embedding, top_k=None, min_score=None, category=None, min_price=None,
+                max_price=None) -> list:
+        self.index.maybe_sync()
+        with span("local_search"):
+            # The exported vectors have the index's EMBEDDING_DIMENSIONS
+            return self.index.search(reduce_embedding(embedding), top_k, min_score, category, min_price, max_price)
+
+    def search(self, session, embedding, question=None, top_k=None, min_score=None, category=None,
+               min_price=None, max_price=None, mode=None) -> list:
+        results = self._search(embedding, top_k, min_score, category, min_price, max_price)
+        return run_query(session, *hydrate_request(results)) if results else []
+
+    async def asearch(self, run, embedding, question=None, top_k=None, min_score=None, category=None,
+                      min_price=None, max_price=None, mode=None) -> list:
+        results = await asyncio.to_thread(self._search, embedding, top_k, min_score, category,
+                                          min_price, max_price)
+        return await run(*hydrate_request(results)) if results else []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or sync the local vector index.")
+    parser.add_argument("--rebuild", action="store_true", help="export every product embedding again")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    index = LocalVectorIndex()
+    if args.rebuild:
+        index.build()
+    else:
+        index.open()
+    print(json.dumps(index.stats(), indent=2))
@@ -0,0 +1,328 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+from neo4j import unit_of_work
+from database import READ_TIMEOUT, async_read_session, read_session
+from embedding_cache import model_name
+from telemetry import record_cache
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Load environment variables
+load_dotenv()
+
+# Cache settings
+QUERY_CACHE_BACKEND = os.getenv("QUERY_CACHE_BACKEND", "memory")  # "memory", "sqlite" or "none"
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", ".query_cache.sqlite3")
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+# How often to re-read the graph version written by load_data.py, and so how
+# long other processes can keep serving cached results from before a load
+GRAPH_VERSION_POLL_SECONDS = float(os.getenv("GRAPH_VERSION_POLL_SECONDS", "5"))
+
+
+class MemoryStore:
+    """In-process LRU store with a time-to-live per entry."""
+
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        self.max_entries = max_entries or QUERY_CACHE_MAX_ENTRIES
+        self.ttl = QUERY_CACHE_TTL if ttl is None else ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, created = entry
+            if time.time() - created > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteStore:
+    """LRU store with a time-to-live per entry, kept in a local SQLite file.
+
+    Values must be JSON serialisable. The file can be shared by several
+    processes on the same host (e.g. multiple Streamlit workers).
+    """
+
+    def __init__(self, path: str = None, namespace: str = "default", max_entries: int = None,
+                 ttl: float = None):
+        self.path = path or QUERY_CACHE_PATH
+        self.namespace = namespace
+        self.max_entries = max_entries or QUERY_CACHE_MAX_ENTRIES
+        self.ttl = QUERY_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS query_cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM query_cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if now - created > self.ttl:
+                self._conn.execute(
+                    "DELETE FROM query_cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+                )
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE query_cache SET accessed = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+            self._conn.commit()
+            return json.loads(value)
+
+    def set(self, key: str, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), now, now),
+            )
+            # Evict the least recently used entries beyond the size bound
+            self._conn.execute("""
+                DELETE FROM query_cache WHERE namespace = ? AND key IN (
+                    SELECT key FROM query_cache WHERE namespace = ?
+                    ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.namespace, self.namespace, self.max_entries))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM query_cache WHERE namespace = ?", (self.namespace,))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT count(*) FROM query_cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+
+
+def make_store(namespace: str):
+    """Create a store for the configured backend, or None when caching is disabled."""
+    if QUERY_CACHE_BACKEND == "none":
+        return None
+    if QUERY_CACHE_BACKEND == "sqlite":
+        return SQLiteStore(namespace=namespace)
+    if QUERY_CACHE_BACKEND == "memory":
+        return MemoryStore()
+    raise ValueError(f"Unknown query cache backend: {QUERY_CACHE_BACKEND}")
+
+
+def normalize_question(question: str) -> str:
+    """Normalise case, whitespace and trailing punctuation so equivalent questions share a key."""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!. ").lower()
+
+
+# Graph version: a marker node that load_data.py bumps after every write, so
+# cached contexts computed against older data are never served.
+_graph_version = None
+_graph_version_checked = 0.0
+_graph_version_lock = threading.Lock()
+
+
+def bump_graph_version(session) -> str:
+    """Record that the graph changed. Called by the loader after writing."""
+    global _graph_version, _graph_version_checked
+    version = session.run("""
+        MERGE (m:GraphMeta {id: 'graph'})
+        SET m.version = randomUUID(), m.updated_at = datetime()
+        RETURN m.version as version
+    """).single()["version"]
+    with _graph_version_lock:
+        _graph_version = version
+        _graph_version_checked = time.monotonic()
+    return version
+
+
+GRAPH_VERSION_QUERY = "MATCH (m:GraphMeta {id: 'graph'}) RETURN m.version as version"
+
+
+@unit_of_work(timeout=READ_TIMEOUT or None)
+def _read_graph_version(tx):
+    return tx.run(GRAPH_VERSION_QUERY).single()
+
+
+@unit_of_work(timeout=READ_TIMEOUT or None)
+async def _aread_graph_version(tx):
+    result = await tx.run(GRAPH_VERSION_QUERY)
+    return await result.single()
+
+
+def _polled_graph_version() -> str:
+    """The last graph version read, or None when it is due to be re-read."""
+    with _graph_version_lock:
+        if _graph_version is not None and time.monotonic() - _graph_version_checked < GRAPH_VERSION_POLL_SECONDS:
+            return _graph_version
+    return None
+
+
+def _set_graph_version(record) -> str:
+    global _graph_version, _graph_version_checked
+    with _graph_version_lock:
+        _graph_version = record["version"] if record else "initial"
+        _graph_version_checked = time.monotonic()
+        return _graph_version
+
+
+def current_graph_version() -> str:
+    """Return the graph version, re-reading it at most every GRAPH_VERSION_POLL_SECONDS.
+
+    A load in this process takes effect at once (see bump_graph_version); a
+    load by another process is seen within GRAPH_VERSION_POLL_SECONDS, and
+    until then results cached for the previous version are still served.
+    """
+    version = _polled_graph_version()
+    if version is not None:
+        return version
+    # Read with the last load's bookmarks, so a new version is seen as soon as it is loaded
+    with read_session() as session:
+        return _set_graph_version(session.execute_read(_read_graph_version))
+
+
+async def acurrent_graph_version(driver=None) -> str:
+    """Async version of current_graph_version, read with the async driver (or ``driver``)."""
+    version = _polled_graph_version()
+    if version is not None:
+        return version
+    async with async_read_session(driver) as session:
+        return _set_graph_version(await session.execute_read(_aread_graph_version))
+
+
+class QueryCache:
+    """Two-layer cache for the chat path.
+
+    - question text -> query embedding
+    - (question, filters, graph version) -> formatted context
+    """
+
+    def __init__(self, embedding_store=None, context_store=None):
+        self.embedding_store = embedding_store
+        self.context_store = context_store
+        self.stats = {
+            "embedding": {"hits": 0, "misses": 0},
+            "context": {"hits": 0, "misses": 0},
+        }
+        self._lock = threading.Lock()
+
+    def _count(self, layer: str, hit: bool):
+        with self._lock:
+            self.stats[layer]["hits" if hit else "misses"] += 1
+        record_cache(layer, hit)
+
+    def embed_query(self, embedder, question: str) -> list:
+        """Return the embedding for a question, calling the embedder only on a miss."""
+        if self.embedding_store is None:
+            return embedder.embed_query(question)
+        key = f"{model_name(embedder)}\0{normalize_question(question)}"
+        embedding = self.embedding_store.get(key)
+        self._count("embedding", embedding is not None)
+        if embedding is None:
+            embedding = embedder.embed_query(question)
+            self.embedding_store.set(key, embedding)
+        return embedding
+
+    def get_context(self, question: str, compute, **filters) -> str:
+        """Return the cached context for a question and filters, or compute and store it."""
+        if self.context_store is None:
+            return compute()
+        key = json.dumps(
+            [current_graph_version(), normalize_question(question), sorted(filters.items())]
+        )
+        context = self.context_store.get(key)
+        self._count("context", context is not None)
+        if context is None:
+            context = compute()
+            self.context_store.set(key, context)
+        return context
+
+    async def aembed_query(self, embedder, question: str) -> list:
+        """Async version of embed_query, using the embedder's aembed_query."""
+        if self.embedding_store is None:
+            return await embedder.aembed_query(question)
+        key = f"{model_name(embedder)}\0{normalize_question(question)}"
+        embedding = self.embedding_store.get(key)
+        self._count("embedding", embedding is not None)
+        if embedding is None:
+            embedding = await embedder.aembed_query(question)
+            self.embedding_store.set(key, embedding)
+        return embedding
+
+    async def aget_context(self, question: str, compute, driver=None, **filters) -> str:
+        """Async version of get_context; ``compute`` is a coroutine function.
+
+        The graph version is read with ``driver``, or the shared async driver.
+        """
+        if self.context_store is None:
+            return await compute()
+        version = await acurrent_graph_version(driver)
+        key = json.dumps([version, normalize_question(question), sorted(filters.items())])
+        context = self.context_store.get(key)
+        self._count("context", context is not None)
+        if context is None:
+            context = await compute()
+            self.context_store.set(key, context)
+        return context
+
+    def hit_rate(self, layer: str) -> float:
+        counts = self.stats[layer]
+        total = counts["hits"] + counts["misses"]
+        return counts["hits"] / total if total else 0.0
+
+    def clear(self):
+        for store in (self.embedding_store, self.context_store):
+            if store is not None:
+                store.clear()
+
+
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryCache:
+    """Return the process-wide query cache for the configured backend."""
+    global _query_cache
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryCache(make_store("embedding"), make_store("context"))
+        return _query_cache
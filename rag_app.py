@@ -1,105 +1,136 @@
-from neo4j import GraphDatabase
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
 from dotenv import load_dotenv
+from answer_cache import lookup_answer
+from chat_model import CONVERSATION_PROMPT_TEMPLATE, get_llm
+from conversation import Conversation
+from database import read_session, warm_up, close_driver
+from embedding_cache import get_embeddings
+from graph_expansion import expand_routes
+from query_cache import get_query_cache
+from retrieval import format_context, retrieve_records
+from telemetry import set_attribute, span, trace
+from functools import lru_cache
+from operator import itemgetter
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 
-# Neo4j connection details
-uri = os.getenv("NEO4J_URI")
-username = os.getenv("NEO4J_USERNAME")
-password = os.getenv("NEO4J_PASSWORD")
+@lru_cache(maxsize=None)
+def get_embedding_client():
+    """Create the embedding client on first use rather than at import."""
+    return get_embeddings()
 
-# Initialize OpenAI components
-embeddings = OpenAIEmbeddings()
-llm = ChatOpenAI(model="gpt-4-turbo-preview")
+def get_relevant_context(question: str, category: str = None,
+                         min_price: float = None, max_price: float = None,
+                         conversation: Conversation = None) -> str:
+    """Retrieve relevant context from Neo4j based on the question.
 
-def get_relevant_context(question: str) -> str:
-    """Retrieve relevant context from Neo4j based on the question."""
+    A follow-up reuses the entities retrieved for the previous question.
+    """
     try:
-        # Connect to Neo4j
-        driver = GraphDatabase.driver(uri, auth=(username, password))
-        
-        with driver.session() as session:
-            # Get question embedding
-            question_embedding = embeddings.embed_query(question)
-            
-            # Query Neo4j for relevant context
-            result = session.run("""
-                MATCH (p:Product)
-                WHERE p.description_embedding IS NOT NULL
-                WITH p, 
-                     reduce(s = 0, i in range(0, size(p.description_embedding)-1) | 
-                           s + p.description_embedding[i] * $embedding[i]) as similarity
-                ORDER BY similarity DESC
-                LIMIT 3
-                OPTIONAL MATCH (p)<-[:SUPPLIES]-(s:Supplier)
-                OPTIONAL MATCH (p)-[:STORED_AT]->(w:Warehouse)
-                RETURN p.name as product_name, 
-                       p.description as product_description,
-                       collect(DISTINCT {type: 'SUPPLIES', name: s.name}) as suppliers,
-                       collect(DISTINCT {type: 'STORED_AT', name: w.name, location: w.location}) as warehouses
-            """, embedding=question_embedding)
-            
-            # Format the context
-            context = []
-            for record in result:
-                context.append(f"Product: {record['product_name']}")
-                context.append(f"Description: {record['product_description']}")
-                if record['suppliers']:
-                    for supplier in record['suppliers']:
-                        if supplier['name']:
-                            context.append(f"Supplied by: {supplier['name']}")
-                if record['warehouses']:
-                    for warehouse in record['warehouses']:
-                        if warehouse['name']:
-                            context.append(f"Stored at: {warehouse['name']} in {warehouse['location']}")
-                context.append("---")
-            
-            return "\n".join(context) if context else "No relevant context found."
-            
-    except Exception as e:
-        print(f"Error retrieving context: {e}")
-        return "Error retrieving context."
-    finally:
-        driver.close()
+        if conversation is not None and conversation.reusable():
+            with span("retrieval"):
+                return conversation.reused_context(question)
 
-# Define the prompt template
-template = """You are a helpful supply chain assistant. Use the following context to answer the question.
-If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.
+        cache = get_query_cache()
+        retrieved = {}
 
-Context: {context}
+        def retrieve():
+            # Get question embedding (cached per normalised question)
+            with span("embed_query"):
+                question_embedding = cache.embed_query(get_embedding_client(), question)
 
-Question: {question}
+            # Borrow a connection from the shared driver's pool
+            with read_session() as session:
+                # Find the closest matches with the configured retrieval backend, plus
+                # keyword matches when the backend does not fuse them into its search
+                records = retrieve_records(
+                    session,
+                    question_embedding,
+                    question,
+                    category=category,
+                    min_price=min_price,
+                    max_price=max_price
+                )
+                # Follow warehouse routes for routing and logistics questions
+                records = records + expand_routes(session, records, question)
+            retrieved["records"] = records
 
-Answer:"""
+            with span("format_context"):
+                return format_context(records, question)
 
-prompt = ChatPromptTemplate.from_template(template)
+        # Reuse the context of an identical recent question on unchanged data
+        with span("retrieval"):
+            context = cache.get_context(
+                question,
+                retrieve,
+                category=category,
+                min_price=min_price,
+                max_price=max_price
+            )
+        if conversation is not None:
+            conversation.remember_retrieval(context, retrieved.get("records"))
+        return context
+            
+    except Exception as e:
+        logger.error(f"Error retrieving context: {e}")
+        set_attribute("retrieval_error", str(e))
+        return "Error retrieving context."
 
-# Create the RAG chain
-rag_chain = (
-    {"context": lambda x: get_relevant_context(x), "question": RunnablePassthrough()}
-    | prompt
-    | llm
-    | StrOutputParser()
-)
+@lru_cache(maxsize=None)
+def get_rag_chain():
+    """Build the RAG chain once per process, importing LangChain on first use."""
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
 
-def ask_question(question: str) -> str:
-    """Ask a question about the supply chain data."""
-    try:
-        return rag_chain.invoke(question)
-    except Exception as e:
-        return f"Error processing question: {e}"
+    prompt = ChatPromptTemplate.from_template(CONVERSATION_PROMPT_TEMPLATE)
+    # Retrieval uses the standalone form of a follow-up, the prompt the question as asked
+    return (
+        {
+            "context": lambda x: get_relevant_context(x["standalone"], conversation=x["conversation"]),
+            "question": itemgetter("question"),
+            "history": lambda x: x["conversation"].history_text(),
+        }
+        | prompt
+        | get_llm()
+        | StrOutputParser()
+    )
+
+def ask_question(question: str, conversation: Conversation = None) -> str:
+    """Ask a question about the supply chain data, as the next turn of a conversation."""
+    conversation = conversation or Conversation()
+    with trace("ask") as current:
+        try:
+            # Follow-ups are rewritten into standalone questions for retrieval and caching
+            standalone = conversation.prepare(question)
+            # Reuse the answer to a near-identical question on unchanged data
+            answer, remember = lookup_answer(get_embedding_client(), standalone)
+            if answer is None:
+                answer = get_rag_chain().invoke(
+                    {"question": question, "standalone": standalone, "conversation": conversation})
+                remember(answer)
+            conversation.add_turn(question, answer)
+            return answer
+        except Exception as e:
+            logger.error(f"Error processing question: {e}")
+            current.error = str(e)
+            return f"Error processing question: {e}"
 
 if __name__ == "__main__":
-    # Example usage
-    while True:
-        question = input("\nAsk a question about the supply chain (or 'quit' to exit): ")
-        if question.lower() == 'quit':
-            break
-        answer = ask_question(question)
-        print(f"\nAnswer: {answer}") 
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO)
+    # Check the database is reachable before taking questions
+    warm_up()
+    conversation = Conversation()
+    try:
+        # Example usage
+        while True:
+            question = input("\nAsk a question about the supply chain (or 'quit' to exit): ")
+            if question.lower() == 'quit':
+                break
+            answer = ask_question(question, conversation)
+            print(f"\nAnswer: {answer}")
+    finally:
+        close_driver() 
\ No newline at end of file
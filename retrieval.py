@@ -0,0 +1,683 @@
+from dotenv import load_dotenv
+from neo4j import unit_of_work
+from database import READ_TIMEOUT, read_session
+from embedding_cache import EMBEDDING_DIMENSIONS, reduce_embedding
+from telemetry import RETRIEVAL_PROFILE, count_tokens, record_query_summary, set_attribute, span
+import os
+import re
+import sys
+import threading
+
+# Load environment variables
+load_dotenv()
+
+# Vector index created by load_data.load_products
+VECTOR_INDEX_NAME = "product_description_embeddings"
+# Full-text indexes created by load_data.create_schema
+FULLTEXT_INDEX_NAMES = {
+    "Product": "product_fulltext",
+    "Supplier": "supplier_fulltext",
+    "Warehouse": "warehouse_fulltext",
+}
+
+# Retrieval settings
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.0"))
+# "hybrid" fuses the vector and full-text indexes, "index" uses the vector
+# index only, "exact" scores every product (exact recall)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Where vector similarity is computed: "neo4j" (the indexes above) or "local"
+# (an in-process copy of the embeddings, see local_index.py)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "neo4j")
+# How many extra index candidates to pull when filters may discard some
+CANDIDATE_MULTIPLIER = int(os.getenv("RETRIEVAL_CANDIDATE_MULTIPLIER", "10"))
+# Candidates ranked by each index before the rankings are fused
+HYBRID_CANDIDATES = int(os.getenv("RETRIEVAL_HYBRID_CANDIDATES", "20"))
+# Reciprocal rank fusion constant: a hit at rank r contributes 1 / (RRF_K + r)
+RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+# Products listed for each supplier or warehouse hit
+RELATED_LIMIT = 10
+# Suppliers and warehouses returned per product
+NEIGHBOUR_LIMIT = int(os.getenv("RETRIEVAL_NEIGHBOUR_LIMIT", "5"))
+# Maximum size of the context passed to the LLM, in tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+# Use the per-product context summaries materialized by load_data.py when present
+CONTEXT_SUMMARIES = os.getenv("CONTEXT_SUMMARIES", "true").lower() == "true"
+# With reduced-dimension embeddings (EMBEDDING_DIMENSIONS), index and exact
+# searches fetch this many times top_k and re-rank them with the full vectors
+RERANK_MULTIPLIER = int(os.getenv("RETRIEVAL_RERANK_MULTIPLIER", "4"))
+
+FILTER_CLAUSE = """
+    ($category IS NULL OR p.category = $category)
+    AND ($min_price IS NULL OR p.price >= $min_price)
+    AND ($max_price IS NULL OR p.price <= $max_price)
+"""
+
+# At most $neighbour_limit named suppliers and warehouses per product, most
+# relevant first: suppliers specialised in the product's category, then the
+# largest warehouses. Each subquery returns one row, so products without
+# neighbours are kept (with an empty list). Unless $live_neighbours is set,
+# the joins are skipped for products with a materialized context summary.
+NEIGHBOUR_SUBQUERIES = """
+    CALL {
+        WITH p
+        WITH p WHERE $live_neighbours OR p.context_summary IS NULL
+        MATCH (p)<-[:SUPPLIES]-(s:Supplier)
+        WHERE s.name IS NOT NULL
+        WITH DISTINCT s, CASE WHEN s.specialization = p.category THEN 0 ELSE 1 END AS rank
+        ORDER BY rank, s.name
+        LIMIT $neighbour_limit
+        RETURN collect({type: 'SUPPLIES', name: s.name, location: s.location}) AS suppliers
+    }
+    CALL {
+        WITH p
+        WITH p WHERE $live_neighbours OR p.context_summary IS NULL
+        MATCH (p)-[:STORED_AT]->(w:Warehouse)
+        WHERE w.name IS NOT NULL
+        WITH DISTINCT w
+        ORDER BY w.capacity DESC, w.name
+        LIMIT $neighbour_limit
+        RETURN collect({type: 'STORED_AT', name: w.name, location: w.location}) AS warehouses
+    }
+"""
+
+NEIGHBOUR_CLAUSE = NEIGHBOUR_SUBQUERIES + """
+    RETURN p.id as product_id,
+           p.name as product_name,
+           p.description as product_description,
+           score,
+           suppliers,
+           warehouses,
+           CASE WHEN $live_neighbours THEN null ELSE p.context_summary END as context_summary,
+           CASE WHEN $rerank THEN p.description_embedding_full END as full_embedding
+    ORDER BY score DESC
+"""
+
+# Approximate top-k through the HNSW vector index
+INDEX_QUERY = """
+    CALL db.index.vector.queryNodes($index_name, $candidates, $embedding)
+    YIELD node AS p, score
+    WHERE score >= $min_score AND """ + FILTER_CLAUSE + """
+    WITH p, score
+    ORDER BY score DESC
+    LIMIT $top_k
+""" + NEIGHBOUR_CLAUSE
+
+# Exact top-k by scoring every product. The filters run before scoring and the
+# dot product is mapped to [0, 1] the same way the cosine index normalises its
+# scores (OpenAI embeddings are unit length), so thresholds are comparable.
+EXACT_QUERY = """
+    MATCH (p:Product)
+    WHERE p.description_embedding IS NOT NULL AND """ + FILTER_CLAUSE + """
+    WITH p,
+         (1 + reduce(s = 0.0, i in range(0, size(p.description_embedding)-1) |
+               s + p.description_embedding[i] * $embedding[i])) / 2 as score
+    WHERE score >= $min_score
+    ORDER BY score DESC
+    LIMIT $top_k
+""" + NEIGHBOUR_CLAUSE
+
+
+# Products whose name or category mentions a keyword of the question, or that
+# are supplied by / stored at an entity whose name mentions one
+KEYWORD_QUERY = """
+    UNWIND $terms AS term
+    MATCH (p:Product)
+    WHERE toLower(p.name) CONTAINS term
+       OR toLower(p.category) CONTAINS term
+       OR EXISTS { MATCH (p)<-[:SUPPLIES]-(s:Supplier) WHERE toLower(s.name) CONTAINS term }
+       OR EXISTS { MATCH (p)-[:STORED_AT]->(w:Warehouse) WHERE toLower(w.name) CONTAINS term }
+    WITH p, count(DISTINCT term) as score
+    ORDER BY score DESC
+    LIMIT $top_k
+""" + NEIGHBOUR_CLAUSE
+
+# Turn the ordered nodes of one index into reciprocal rank fusion contributions
+RANK_CLAUSE = """
+        WITH collect(node) AS nodes
+        UNWIND range(0, size(nodes) - 1) AS rank
+        RETURN nodes[rank] AS node, 1.0 / ($rrf_k + rank + 1) AS rrf, 0.0 AS vector_rrf
+"""
+
+# The vector branch also reports its own contribution, so rerank() can redo its ranks
+VECTOR_RANK_CLAUSE = """
+        WITH collect(node) AS nodes
+        UNWIND range(0, size(nodes) - 1) AS rank
+        RETURN nodes[rank] AS node, 1.0 / ($rrf_k + rank + 1) AS rrf, 1.0 / ($rrf_k + rank + 1) AS vector_rrf
+"""
+
+HYBRID_VECTOR_BRANCH = """
+        CALL db.index.vector.queryNodes($index_name, $candidates, $embedding)
+        YIELD node AS p, score
+        WHERE score >= $min_score AND """ + FILTER_CLAUSE + """
+        WITH p AS node, score
+        ORDER BY score DESC
+""" + VECTOR_RANK_CLAUSE
+
+HYBRID_PRODUCT_TEXT_BRANCH = """
+        CALL db.index.fulltext.queryNodes($product_text_index, $text_query, {limit: $candidates})
+        YIELD node AS p, score
+        WHERE """ + FILTER_CLAUSE + """
+        WITH p AS node, score
+        ORDER BY score DESC
+""" + RANK_CLAUSE
+
+# Supplier/warehouse hits; with filters, only those linked to a matching product
+HYBRID_ENTITY_TEXT_BRANCH = """
+        CALL db.index.fulltext.queryNodes(${index_param}, $text_query, {{limit: $candidates}})
+        YIELD node, score
+        {entity_filter}
+        WITH node, score
+        ORDER BY score DESC
+""" + RANK_CLAUSE.replace("{", "{{").replace("}", "}}")
+
+HYBRID_ENTITY_FILTER = """
+        WHERE EXISTS {{ MATCH (node){pattern}(p:Product) WHERE """ + FILTER_CLAUSE + """ }}
+"""
+
+# Products, suppliers and warehouses ranked by the sum of their RRF
+# contributions, returned with the neighbours the context needs for each label
+HYBRID_RESULT_CLAUSE = """
+    WITH node, sum(rrf) AS score, sum(vector_rrf) AS vector_rrf
+    ORDER BY score DESC
+    LIMIT $top_k
+    WITH node AS n, score, vector_rrf,
+         [l IN labels(node) WHERE l IN ['Product', 'Supplier', 'Warehouse']][0] AS label
+    WITH n, score, vector_rrf, label,
+         ([(n)-[:SUPPLIES]->(p:Product) WHERE p.name IS NOT NULL AND """ + FILTER_CLAUSE + """ | p.name] +
+          [(p:Product)-[:STORED_AT]->(n) WHERE p.name IS NOT NULL AND """ + FILTER_CLAUSE + """ | p.name]
+         )[..$related_limit] AS products
+    WITH n AS p, score, vector_rrf, label, products
+""" + NEIGHBOUR_SUBQUERIES + """
+    RETURN label,
+           p.id AS id,
+           p.name AS name,
+           p.description AS description,
+           p.location AS location,
+           p.specialization AS specialization,
+           score,
+           suppliers,
+           warehouses,
+           products,
+           CASE WHEN $live_neighbours THEN null ELSE p.context_summary END AS context_summary,
+           vector_rrf,
+           CASE WHEN $rerank AND label = 'Product' THEN p.description_embedding_full END AS full_embedding
+    ORDER BY score DESC
+"""
+
+# Lucene query syntax characters, escaped in full-text search terms
+LUCENE_SPECIAL = re.compile(r'([+\-!(){}\[\]^"~*?:\\/]|&&|\|\|)')
+
+STOP_WORDS = {
+    "about", "available", "does", "from", "have", "much", "product", "products",
+    "provide", "provides", "stored", "supplier", "suppliers", "supplies", "supply", "tell",
+    "that", "there", "what", "where", "which", "with", "warehouse", "warehouses",
+}
+
+
+def keyword_terms(question: str) -> list:
+    """Extract lower-case search terms from a question, singularising simple plurals."""
+    terms = []
+    for word in re.findall(r"[a-z0-9]+", question.lower()):
+        if len(word) < 4 or word in STOP_WORDS:
+            continue
+        if word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        if word not in terms:
+            terms.append(word)
+    return terms
+
+
+def escape_lucene(term: str) -> str:
+    """Escape Lucene query syntax so a term is matched literally."""
+    return LUCENE_SPECIAL.sub(r"\\\1", term)
+
+
+def fulltext_query(question: str) -> str:
+    """Build a full-text query matching any content word of the question.
+
+    Words are lower-cased (so AND/OR/NOT are never read as operators) and
+    escaped; stemming and stop words are left to the english analyzer.
+    """
+    terms = []
+    for word in question.lower().split():
+        word = word.strip(".,;:!?'\"()[]{}")
+        if len(word) < 2 or word in STOP_WORDS:
+            continue
+        term = escape_lucene(word)
+        if term not in terms:
+            terms.append(term)
+    return " OR ".join(terms)
+
+
+def build_hybrid_query(text_query: str, filtered: bool) -> str:
+    """Assemble the hybrid query: one UNION ALL branch per index, fused in Cypher."""
+    branches = [HYBRID_VECTOR_BRANCH]
+    if text_query:
+        branches.append(HYBRID_PRODUCT_TEXT_BRANCH)
+        for index_param, pattern in (("supplier_text_index", "-[:SUPPLIES]->"),
+                                     ("warehouse_text_index", "<-[:STORED_AT]-")):
+            entity_filter = HYBRID_ENTITY_FILTER.format(pattern=pattern) if filtered else ""
+            branches.append(HYBRID_ENTITY_TEXT_BRANCH.format(index_param=index_param,
+                                                             entity_filter=entity_filter))
+    return "CALL {" + "\n        UNION ALL".join(branches) + "}" + HYBRID_RESULT_CLAUSE
+
+
+def neighbour_params(live: bool = None) -> dict:
+    """Parameters of NEIGHBOUR_SUBQUERIES; ``live`` forces the joins even where a summary exists."""
+    return {
+        "neighbour_limit": NEIGHBOUR_LIMIT,
+        "live_neighbours": not CONTEXT_SUMMARIES if live is None else live,
+        "rerank": False,
+    }
+
+
+def build_search(embedding, top_k=None, min_score=None, category=None,
+                 min_price=None, max_price=None, mode=None, question=None):
+    """Return the Cypher query and parameters for a product similarity search."""
+    top_k = top_k or TOP_K
+    mode = mode or RETRIEVAL_MODE
+    filtered = category is not None or min_price is not None or max_price is not None
+    # The index holds EMBEDDING_DIMENSIONS; the full query vector is kept for rerank()
+    rerank = len(embedding) > EMBEDDING_DIMENSIONS
+    params = {
+        "embedding": reduce_embedding(embedding),
+        "top_k": top_k * RERANK_MULTIPLIER if rerank else top_k,
+        "min_score": MIN_SCORE if min_score is None else min_score,
+        "category": category,
+        "min_price": min_price,
+        "max_price": max_price,
+        **neighbour_params(),
+        "rerank": rerank,
+    }
+
+    if mode == "hybrid":
+        text_query = fulltext_query(question or "")
+        query = build_hybrid_query(text_query, filtered)
+        params.update({
+            "index_name": VECTOR_INDEX_NAME,
+            "product_text_index": FULLTEXT_INDEX_NAMES["Product"],
+            "supplier_text_index": FULLTEXT_INDEX_NAMES["Supplier"],
+            "warehouse_text_index": FULLTEXT_INDEX_NAMES["Warehouse"],
+            "text_query": text_query,
+            "candidates": max(top_k, HYBRID_CANDIDATES) * (CANDIDATE_MULTIPLIER if filtered else 1),
+            "rrf_k": RRF_K,
+            "related_limit": RELATED_LIMIT,
+        })
+    elif mode == "exact":
+        query = EXACT_QUERY
+    elif mode == "index":
+        query = INDEX_QUERY
+        params["index_name"] = VECTOR_INDEX_NAME
+        # The index cannot pre-filter, so over-fetch and filter the candidates
+        params["candidates"] = params["top_k"] * CANDIDATE_MULTIPLIER if filtered else params["top_k"]
+    else:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+
+    return query, params
+
+
+def search_products(session, embedding, top_k=None, min_score=None, category=None,
+                    min_price=None, max_price=None, mode=None, question=None) -> list:
+    """Return the top-k products (with suppliers and warehouses) for an embedding.
+
+    In hybrid mode the question text is also matched against the full-text
+    indexes, and supplier and warehouse records can be returned as well.
+    """
+    query, params = build_search(embedding, top_k, min_score, category, min_price, max_price, mode,
+                                 question)
+    records = run_query(session, query, params)
+    return rerank(records, embedding, top_k) if params["rerank"] else records
+
+
+def _full_similarity(row: dict, query):
+    import numpy as np
+
+    full = row.pop("full_embedding", None)
+    if full is None:
+        return None
+    vector = np.frombuffer(full, dtype=np.float32)
+    return float(vector @ query) / (float(np.linalg.norm(vector)) or 1.0)
+
+
+def rerank(records, embedding, top_k=None) -> list:
+    """Re-score candidates found with reduced vectors by their full-precision embeddings.
+
+    Vector search scores use the same (1 + cosine) / 2 scale as the vector
+    index. Hybrid results are ranked by reciprocal rank fusion instead: the
+    vector ranks of the candidates are redone by full-precision similarity
+    and each fused score gets the contribution of its new rank. Returns the
+    best ``top_k`` as dicts, without the full embeddings.
+    """
+    # numpy is imported here so that importing this module stays cheap
+    import numpy as np
+
+    query = np.asarray(embedding, dtype=np.float32)
+    query /= np.linalg.norm(query) or 1.0
+    rows = [dict(record) for record in records]
+    with span("rerank"):
+        if rows and "vector_rrf" in rows[0]:
+            # Vector hits that can be re-scored trade rank slots among themselves
+            scored = []
+            for row in rows:
+                similarity = _full_similarity(row, query)
+                if similarity is not None and row["vector_rrf"]:
+                    scored.append((similarity, row))
+            slots = sorted((row["vector_rrf"] for _, row in scored), reverse=True)
+            for slot, (_, row) in zip(slots, sorted(scored, key=lambda item: item[0], reverse=True)):
+                row["score"] += slot - row["vector_rrf"]
+                row["vector_rrf"] = slot
+        else:
+            for row in rows:
+                similarity = _full_similarity(row, query)
+                if similarity is not None:
+                    row["score"] = (1 + similarity) / 2
+        rows.sort(key=lambda row: row["score"], reverse=True)
+    return rows[:top_k or TOP_K]
+
+
+def _read_records(tx, query: str, params: dict):
+    result = tx.run(query, params)
+    records = list(result)
+    return records, result.consume()
+
+
+def run_query(session, query: str, params: dict, timeout: float = None) -> list:
+    """Run a retrieval query as a managed read transaction, recording its latency and result summary.
+
+    The read goes to a reader in a cluster and is retried on transient errors
+    (see database.read_session). ``timeout`` (seconds, default READ_TIMEOUT)
+    is enforced by the server as a transaction timeout.
+    """
+    if RETRIEVAL_PROFILE:
+        query = "PROFILE " + query
+    work = unit_of_work(timeout=timeout or READ_TIMEOUT or None)(_read_records)
+    with span("neo4j_query"):
+        records, summary = session.execute_read(work, query, params)
+        record_query_summary(summary)
+    return records
+
+
+class Neo4jRetriever:
+    """Retrieves products with a single Cypher query against the Neo4j indexes."""
+
+    def __init__(self, mode: str = None):
+        self.mode = mode or RETRIEVAL_MODE
+        # The hybrid query already fuses full-text matches into its results
+        self.fuses_keywords = self.mode == "hybrid"
+
+    def search(self, session, embedding, question=None, top_k=None, min_score=None, category=None,
+               min_price=None, max_price=None, mode=None) -> list:
+        return search_products(session, embedding, top_k, min_score, category, min_price, max_price,
+                               mode or self.mode, question)
+
+    async def asearch(self, run, embedding, question=None, top_k=None, min_score=None, category=None,
+                      min_price=None, max_price=None, mode=None) -> list:
+        """Like search, with ``run(query, params)`` an async query runner."""
+        query, params = build_search(embedding, top_k, min_score, category, min_price, max_price,
+                                     mode or self.mode, question)
+        records = await run(query, params)
+        return rerank(records, embedding, top_k) if params["rerank"] else records
+
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever():
+    """Return the process-wide retriever for RETRIEVAL_BACKEND.
+
+    Every retriever has ``search(session, embedding, question=None, **filters)``,
+    an async ``asearch(run, embedding, question=None, **filters)`` and a
+    ``fuses_keywords`` flag telling callers whether keyword matches still
+    need a separate lookup.
+    """
+    global _retriever
+    with _retriever_lock:
+        if _retriever is None:
+            if RETRIEVAL_BACKEND == "local":
+                from local_index import LocalRetriever
+                _retriever = LocalRetriever()
+            elif RETRIEVAL_BACKEND == "neo4j":
+                _retriever = Neo4jRetriever()
+            else:
+                raise ValueError(f"Unknown retrieval backend: {RETRIEVAL_BACKEND}")
+        return _retriever
+
+
+def keyword_lookup(session, question: str) -> list:
+    """Find products whose name, category, supplier or warehouse mentions a question term."""
+    terms = keyword_terms(question)
+    if not terms:
+        return []
+    return run_query(session, KEYWORD_QUERY, {"terms": terms, "top_k": TOP_K, **neighbour_params()})
+
+
+def merge_keyword_matches(records, keyword_records) -> list:
+    """Vector matches first, then keyword matches the vector search did not return."""
+    records = list(records)
+    seen = {record["product_id"] for record in records}
+    for record in keyword_records:
+        if record["product_id"] not in seen:
+            records.append(record)
+            seen.add(record["product_id"])
+    return records
+
+
+def retrieve_records(session, embedding, question: str, **filters) -> list:
+    """Search the configured retrieval backend for a question.
+
+    Keyword matches are looked up and merged in unless the retriever already
+    fuses them (the hybrid query).
+    """
+    retriever = get_retriever()
+    records = retriever.search(session, embedding, question=question, **filters)
+    if retriever.fuses_keywords:
+        return records
+    return merge_keyword_matches(records, keyword_lookup(session, question))
+
+
+def render_product_summary(name, description, suppliers, warehouses) -> str:
+    """Render a product and its neighbours as context text (materialized at ingest by load_data.py)."""
+    lines = [f"Product: {name}", f"Description: {description}"]
+    lines += [f"Supplied by: {supplier['name']}" for supplier in suppliers or []]
+    lines += [f"Stored at: {warehouse['name']} in {warehouse['location']}" for warehouse in warehouses or []]
+    return "\n".join(lines)
+
+
+def _context_blocks(records, terms: list) -> list:
+    """Turn records into blocks of header lines plus neighbour facts, without duplicates.
+
+    A fact (a SUPPLIES, STORED_AT or CONNECTED_TO relationship) appears once,
+    under the highest ranked record that mentions it; facts within a block
+    are ordered by how many question terms they mention.
+    """
+    blocks = []
+    seen_records = set()
+    seen_facts = set()
+    for record in records:
+        if 'label' in record.keys():
+            label, record_id, name = record['label'], record['id'], record['name']
+        else:
+            label, record_id, name = "Product", record['product_id'], record['product_name']
+        if (label, record_id) in seen_records:
+            continue
+        seen_records.add((label, record_id))
+
+        facts = []
+
+        def add_fact(key, line, short=None, entity=None):
+            if key in seen_facts:
+                return
+            seen_facts.add(key)
+            relevance = sum(term in line.lower() for term in terms)
+            facts.append({"line": line, "short": short or line, "entity": entity, "relevance": relevance})
+
+        entity = None
+        if label == "Product":
+            # Materialized summary if there is one, otherwise render the live joins
+            summary = record['context_summary'] if 'context_summary' in record.keys() else None
+            if summary is None:
+                description = record['description'] if 'label' in record.keys() else record['product_description']
+                summary = render_product_summary(name, description, record['suppliers'], record['warehouses'])
+            lines = summary.split("\n")
+            header = lines[:2]
+            for line in lines[2:]:
+                if line.startswith("Supplied by: "):
+                    add_fact(("SUPPLIES", line[len("Supplied by: "):], name), line)
+                elif line.startswith("Stored at: "):
+                    warehouse, _, _ = line[len("Stored at: "):].rpartition(" in ")
+                    add_fact(("STORED_AT", name, warehouse), line, f"Stored at: {warehouse}", warehouse)
+                else:
+                    add_fact(("SUMMARY", name, line), line)
+        elif label == "Supplier":
+            header = [f"Supplier: {name} ({record['location']})"]
+            if record['specialization']:
+                header.append(f"Specialization: {record['specialization']}")
+            for product in record['products'] or []:
+                add_fact(("SUPPLIES", name, product), f"Supplies: {product}")
+        elif label == "Warehouse":
+            header = [f"Warehouse: {name} in {record['location']}"]
+            entity = name
+            for product in record['products'] or []:
+                add_fact(("STORED_AT", product, name), f"Stores: {product}")
+        elif label == "FastestRoute":
+            header = [f"Fastest route: {name} (duration {record['duration']}, distance {record['distance']})"]
+        else:
+            header = [f"Routes from {name} ({record['location']}):"]
+            entity = name
+            for leg in record['legs']:
+                add_fact(("CONNECTED_TO", leg['from'], leg['to']),
+                         f"Route: {leg['from']} -> {leg['to']} in {leg['to_location']}, "
+                         f"distance {leg['distance']}, duration {leg['duration']}",
+                         f"Route: {leg['from']} -> {leg['to']}, "
+                         f"distance {leg['distance']}, duration {leg['duration']}", leg['to'])
+
+        facts.sort(key=lambda fact: -fact["relevance"])
+        blocks.append({"header": header, "facts": facts, "entity": entity})
+    return blocks
+
+
+def _line_tokens(line: str) -> int:
+    # One extra token for the newline joining the lines
+    return count_tokens(line) + 1
+
+
+def _truncate_lines(lines: list, budget: int) -> list:
+    """The leading lines that fit the budget, the first one that does not cut to fit with an ellipsis."""
+    kept = []
+    used = 0
+    for line in lines:
+        cost = _line_tokens(line)
+        if used + cost <= budget:
+            kept.append(line)
+            used += cost
+            continue
+        words = line.split()
+        # Longest prefix of words that still fits, by bisection
+        low, high = 0, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if used + _line_tokens(" ".join(words[:middle]) + " …") <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        if low:
+            kept.append(" ".join(words[:low]) + " …")
+        break
+    return kept
+
+
+def format_context(records, question: str = None, token_budget: int = None) -> str:
+    """Assemble the context passed to the LLM within a token budget.
+
+    Every record's header (product name and description, or supplier/warehouse
+    details) is included in rank order while it fits; the remaining budget is
+    filled with neighbour facts, most relevant to the question first.
+    Duplicate records and facts are dropped, and a warehouse's location is
+    only given the first time it is mentioned. If not even the top record's
+    header fits, it is cut to the budget rather than dropped.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    if budget <= 0:
+        budget = float("inf")
+    blocks = _context_blocks(records, keyword_terms(question) if question else [])
+
+    # Headers first, in rank order; a block that does not fit is skipped
+    used = 0
+    selected = []
+    separator = _line_tokens("---")
+    for block in blocks:
+        cost = sum(_line_tokens(line) for line in block["header"]) + separator
+        if used + cost <= budget:
+            used += cost
+            selected.append(block)
+    truncated = False
+    if blocks and not selected:
+        # Keep the best match, cut short, rather than answering with no context at all
+        header = _truncate_lines(blocks[0]["header"], budget - separator)
+        if header:
+            used = sum(_line_tokens(line) for line in header) + separator
+            selected.append(dict(blocks[0], header=header, facts=[]))
+            truncated = True
+
+    # Then facts, by relevance across all blocks, ties broken by rank
+    chosen = set()
+    candidates = [(-fact["relevance"], rank, i, fact)
+                  for rank, block in enumerate(selected) for i, fact in enumerate(block["facts"])]
+    dropped = 0
+    for _, _, _, fact in sorted(candidates, key=lambda c: c[:3]):
+        cost = _line_tokens(fact["line"])
+        if used + cost <= budget:
+            used += cost
+            chosen.add(id(fact))
+        else:
+            dropped += 1
+
+    context = []
+    described = set()
+    for block in selected:
+        context.extend(block["header"])
+        if block["entity"]:
+            described.add(block["entity"])
+        for fact in block["facts"]:
+            if id(fact) not in chosen:
+                continue
+            if fact["entity"] in described:
+                context.append(fact["short"])
+            else:
+                context.append(fact["line"])
+                if fact["entity"]:
+                    described.add(fact["entity"])
+        context.append("---")
+
+    set_attribute("context_tokens", used)
+    set_attribute("context_records_dropped", len(blocks) - len(selected))
+    set_attribute("context_facts_dropped", dropped)
+    set_attribute("context_truncated", truncated)
+    if context:
+        return "\n".join(context)
+    if blocks:
+        return "Relevant context was found but did not fit the context token budget."
+    return "No relevant context found."
+
+
+def measure_recall(session, embedding, top_k=None, **filters) -> float:
+    """Return recall@k of the vector index against the exact scorer."""
+    exact = {r["product_id"] for r in search_products(session, embedding, top_k, mode="exact", **filters)}
+    if not exact:
+        return 1.0
+    approximate = {r["product_id"] for r in search_products(session, embedding, top_k, mode="index", **filters)}
+    return len(exact & approximate) / len(exact)
+
+
+if __name__ == "__main__":
+    # Report index recall for the questions given on the command line
+    from langchain_openai import OpenAIEmbeddings
+
+    questions = sys.argv[1:] or ["What products are available?"]
+    embeddings = OpenAIEmbeddings()
+    with read_session() as session:
+        for question in questions:
+            recall = measure_recall(session, embeddings.embed_query(question))
+            print(f"recall@{TOP_K} = {recall:.2f}  {question}")
@@ -0,0 +1,211 @@
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from typing import Optional
+from dotenv import load_dotenv
+from async_rag import AsyncRAGPipeline, Overloaded
+from database import close_async_driver
+from embedding_cache import get_embeddings, model_name
+from telemetry import metrics
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Server settings
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+# Requests admitted at once; further requests get 503 + Retry-After
+SERVER_MAX_PENDING = int(os.getenv("SERVER_MAX_PENDING", "512"))
+# Query embedding micro-batching
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "64"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+EMBED_QUEUE_MAX_SIZE = int(os.getenv("EMBED_QUEUE_MAX_SIZE", "1024"))
+
+
+class BatchingEmbeddings:
+    """Embeddings wrapper that coalesces concurrent query embeddings.
+
+    Questions arriving within ``max_wait_ms`` of each other are embedded with
+    a single ``aembed_documents`` call of up to ``max_batch_size`` texts.
+    """
+
+    def __init__(self, embeddings, max_batch_size: int = None, max_wait_ms: float = None,
+                 max_queue_size: int = None):
+        self.embeddings = embeddings
+        self.model = model_name(embeddings)
+        self.max_batch_size = max_batch_size or EMBED_BATCH_MAX_SIZE
+        self.max_wait = (EMBED_BATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self._queue = asyncio.Queue(maxsize=max_queue_size or EMBED_QUEUE_MAX_SIZE)
+        self._task = None
+        self.stats = {"requests": 0, "batches": 0}
+
+    def start(self):
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def embed_query(self, text: str) -> list:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> list:
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((text, future))
+        except asyncio.QueueFull:
+            raise Overloaded("Embedding queue is full")
+        self.stats["requests"] += 1
+        return await future
+
+    async def _next_batch(self) -> list:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            self.stats["batches"] += 1
+            try:
+                vectors = await self.embeddings.aembed_documents([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+
+class AdmissionControl:
+    """Bounds the number of requests being served; rejects the rest."""
+
+    def __init__(self, max_pending: int = None):
+        self.max_pending = max_pending or SERVER_MAX_PENDING
+        self.pending = 0
+
+    def acquire(self):
+        if self.pending >= self.max_pending:
+            raise Overloaded("Too many requests in flight")
+        self.pending += 1
+
+    def release(self):
+        self.pending -= 1
+
+
+class AskRequest(BaseModel):
+    question: str
+    category: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+
+    def filters(self) -> dict:
+        return {"category": self.category, "min_price": self.min_price, "max_price": self.max_price}
+
+
+def create_app(embeddings=None, llm=None, driver=None) -> FastAPI:
+    """Build the API app. Embeddings, LLM and driver can be replaced by in-process fakes."""
+    batcher = BatchingEmbeddings(embeddings or get_embeddings())
+    pipeline = AsyncRAGPipeline(embeddings=batcher, llm=llm, driver=driver)
+    admission = AdmissionControl()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        batcher.start()
+        yield
+        await batcher.stop()
+        if driver is None:
+            await close_async_driver()
+
+    app = FastAPI(title="Supply Chain RAG API", lifespan=lifespan)
+    app.state.pipeline = pipeline
+    app.state.batcher = batcher
+    app.state.admission = admission
+
+    @app.exception_handler(Overloaded)
+    async def overloaded(request: Request, exc: Overloaded):
+        return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "1"})
+
+    @app.post("/ask")
+    async def ask(body: AskRequest):
+        admission.acquire()
+        try:
+            answer = await pipeline.ask(body.question, **body.filters())
+        finally:
+            admission.release()
+        return {"answer": answer}
+
+    @app.post("/ask/stream")
+    async def ask_stream(body: AskRequest):
+        # Admit before the response starts so overload can still return 503
+        admission.acquire()
+
+        async def tokens():
+            try:
+                async for chunk in pipeline.astream(body.question, **body.filters()):
+                    yield chunk
+            except Exception as e:
+                logger.error(f"Error processing question: {e}")
+                yield f"Error processing question: {e}"
+            finally:
+                admission.release()
+
+        return StreamingResponse(tokens(), media_type="text/plain")
+
+    @app.post("/retrieve")
+    async def retrieve(body: AskRequest):
+        admission.acquire()
+        try:
+            context = await pipeline.get_relevant_context(body.question, **body.filters())
+        finally:
+            admission.release()
+        return {"context": context}
+
+    @app.get("/metrics")
+    async def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/healthz")
+    async def healthz():
+        return {
+            "status": "ok",
+            "pending": admission.pending,
+            "embedding_queue": batcher.queue_depth,
+            "embedding_requests": batcher.stats["requests"],
+            "embedding_batches": batcher.stats["batches"],
+        }
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(create_app(), host=SERVER_HOST, port=SERVER_PORT)
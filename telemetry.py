@@ -0,0 +1,243 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from dotenv import load_dotenv
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("rag.trace")
+
+# Load environment variables
+load_dotenv()
+
+# Run retrieval queries with PROFILE to collect db hits (adds overhead)
+RETRIEVAL_PROFILE = os.getenv("RETRIEVAL_PROFILE", "false").lower() == "true"
+# Port for the Prometheus metrics endpoint of the Streamlit app (unset = disabled)
+METRICS_PORT = os.getenv("METRICS_PORT")
+TOKENIZER_MODEL = os.getenv("LLM_MODEL", "gpt-4-turbo-preview")
+
+# Latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metrics:
+    """Minimal in-process Prometheus registry of counters and histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.setdefault(key, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        def labels_text(labels, extra=()):
+            pairs = [f'{k}="{v}"' for k, v in labels + tuple(extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{labels_text(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(BUCKETS, histogram["buckets"]):
+                        lines.append(f"{name}_bucket{labels_text(labels, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{labels_text(labels, [('le', '+Inf')])} {histogram['count']}")
+                    lines.append(f"{name}_sum{labels_text(labels)} {histogram['sum']}")
+                    lines.append(f"{name}_count{labels_text(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class Trace:
+    """Timings and attributes collected while answering one question."""
+
+    def __init__(self, name: str, **attributes):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.spans = []
+        self.error = None
+        self.total = None
+        self._start = time.perf_counter()
+
+    def finish(self):
+        self.total = time.perf_counter() - self._start
+
+    def to_dict(self) -> dict:
+        return {
+            "trace": self.name,
+            "total_seconds": self.total,
+            "spans": self.spans,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """Collect spans for one request and log them as a structured record at the end."""
+    current = Trace(name, **attributes)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = str(e)
+        raise
+    finally:
+        current.finish()
+        _current_trace.reset(token)
+        metrics.observe("rag_request_duration_seconds", current.total, trace=name)
+        logger.info(json.dumps(current.to_dict(), default=str))
+
+
+@contextmanager
+def span(stage: str):
+    """Time a pipeline stage, recording it on the current trace and in the metrics."""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = str(e)
+        metrics.increment("rag_errors_total", stage=stage)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe("rag_stage_duration_seconds", seconds, stage=stage)
+        current = _current_trace.get()
+        if current is not None:
+            current.spans.append({"stage": stage, "seconds": seconds, "error": error})
+
+
+def set_attribute(key: str, value):
+    """Attach a value to the current trace, if any."""
+    current = _current_trace.get()
+    if current is not None:
+        current.attributes[key] = value
+
+
+def add_to_attribute(key: str, amount: float):
+    """Accumulate a numeric value on the current trace, if any."""
+    current = _current_trace.get()
+    if current is not None:
+        current.attributes[key] = current.attributes.get(key, 0) + amount
+
+
+def _profile_db_hits(profile) -> int:
+    if not profile:
+        return 0
+    return profile.get("dbHits", 0) + sum(_profile_db_hits(child) for child in profile.get("children", []))
+
+
+def record_query_summary(summary):
+    """Record server timings and (when profiled) db hits from a Neo4j result summary."""
+    available = (summary.result_available_after or 0) / 1000
+    consumed = (summary.result_consumed_after or 0) / 1000
+    metrics.observe("rag_neo4j_server_seconds", available, phase="available")
+    metrics.observe("rag_neo4j_server_seconds", consumed, phase="consumed")
+    add_to_attribute("neo4j_result_available_after_ms", summary.result_available_after or 0)
+    add_to_attribute("neo4j_result_consumed_after_ms", summary.result_consumed_after or 0)
+    if summary.profile:
+        db_hits = _profile_db_hits(summary.profile)
+        metrics.increment("rag_neo4j_db_hits_total", db_hits)
+        add_to_attribute("neo4j_db_hits", db_hits)
+
+
+def record_cache(layer: str, hit: bool):
+    """Count a cache lookup and note it on the current trace."""
+    result = "hit" if hit else "miss"
+    metrics.increment("rag_cache_requests_total", layer=layer, result=result)
+    set_attribute(f"{layer}_cache", result)
+
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        import tiktoken
+        try:
+            try:
+                _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # The BPE files are downloaded on first use; don't fail requests offline
+            logging.getLogger(__name__).warning(f"Tokenizer unavailable, estimating token counts: {e}")
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens the way the chat model's tokenizer does (estimated if it is unavailable)."""
+    encoding = _get_encoding()
+    if not encoding:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def record_tokens(kind: str, text: str):
+    """Count prompt or completion tokens on the current trace and in the metrics."""
+    tokens = count_tokens(text)
+    metrics.increment("rag_tokens_total", tokens, kind=kind)
+    add_to_attribute(f"{kind}_tokens", tokens)
+    return tokens
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = None):
+    """Serve /metrics on a background thread for processes without their own HTTP server."""
+    port = port or int(METRICS_PORT)
+    server = HTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+# Offline settings, applied before any project module reads its environment
+os.environ.update({
+    "EMBEDDING_PROVIDER": "fake",
+    "LLM_PROVIDER": "fake",
+    "FAKE_LLM_SLEEP": "0",
+    # The fake chat model only returns canned text, so it cannot rewrite or summarise
+    "CONVERSATION_REWRITE": "entities",
+    # Nothing listens here: a test that reaches the real driver fails fast
+    "NEO4J_URI": "bolt://127.0.0.1:9",
+    "NEO4J_USERNAME": "neo4j",
+    "NEO4J_PASSWORD": "password",
+    "NEO4J_BOOKMARKS_PATH": "",
+    "NEO4J_READ_RETRY_DELAY": "0.01",
+    "QUERY_CACHE_BACKEND": "memory",
+    "RETRIEVAL_BACKEND": "neo4j",
+    "RETRIEVAL_MODE": "hybrid",
+    "EMBEDDING_DIMENSIONS": "1536",
+})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    """Empty process-wide caches, and no process-wide driver: tests inject fakes."""
+    import answer_cache
+    import database
+    import query_cache
+
+    monkeypatch.setattr(query_cache, "_graph_version", None)
+    monkeypatch.setattr(query_cache, "_query_cache", None)
+    monkeypatch.setattr(answer_cache, "_answer_cache", None)
+
+    def no_real_driver():
+        raise AssertionError("the process-wide driver must not be used")
+
+    monkeypatch.setattr(database, "get_driver", no_real_driver)
+    monkeypatch.setattr(database, "get_async_driver", no_real_driver)
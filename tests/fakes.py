@@ -0,0 +1,135 @@
+"""In-process stand-ins for the Neo4j driver, answering queries with a handler function."""
+from types import SimpleNamespace
+
+
+def summary():
+    return SimpleNamespace(result_available_after=1, result_consumed_after=1, profile=None)
+
+
+def product_row(product_id: str, name: str, score: float = 0.9, **fields) -> dict:
+    """A row shaped like the hybrid retrieval query's result."""
+    return {
+        "label": "Product", "id": product_id, "name": name, "description": f"A {name.lower()}",
+        "location": None, "specialization": None, "score": score, "suppliers": [], "warehouses": [],
+        "products": [], "context_summary": f"Product: {name}\nDescription: A {name.lower()}", **fields,
+    }
+
+
+class FakeRecord(dict):
+    """A row that also answers ``record.data()``, like neo4j.Record."""
+
+    def data(self) -> dict:
+        return dict(self)
+
+
+class FakeResult:
+    def __init__(self, rows: list):
+        self.rows = [FakeRecord(row) for row in rows]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def single(self):
+        return self.rows[0] if self.rows else None
+
+    def consume(self):
+        return summary()
+
+
+class FakeAsyncResult(FakeResult):
+    def __aiter__(self):
+        self._iterator = iter(self.rows)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def single(self):
+        return FakeResult.single(self)
+
+    async def consume(self):
+        return summary()
+
+
+class FakeTransaction:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, query, params=None, **kwargs):
+        return FakeResult(self.driver.answer(query, {**(params or {}), **kwargs}))
+
+
+class FakeAsyncTransaction(FakeTransaction):
+    async def run(self, query, params=None, **kwargs):
+        return FakeAsyncResult(self.driver.answer(query, {**(params or {}), **kwargs}))
+
+
+class FakeSession:
+    def __init__(self, driver, config):
+        self.driver = driver
+        self.config = config
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_read(self, work, *args, **kwargs):
+        self.driver.transactions.append(("read", getattr(work, "timeout", None)))
+        return work(FakeTransaction(self.driver), *args, **kwargs)
+
+    def execute_write(self, work, *args, **kwargs):
+        self.driver.transactions.append(("write", getattr(work, "timeout", None)))
+        return work(FakeTransaction(self.driver), *args, **kwargs)
+
+    def run(self, query, params=None, **kwargs):
+        return FakeTransaction(self.driver).run(query, params, **kwargs)
+
+    def close(self):
+        pass
+
+
+class FakeAsyncSession(FakeSession):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute_read(self, work, *args, **kwargs):
+        self.driver.transactions.append(("read", getattr(work, "timeout", None)))
+        return await work(FakeAsyncTransaction(self.driver), *args, **kwargs)
+
+
+class FakeDriver:
+    """Answers every query with ``handler(query, params)``, recording the queries run."""
+
+    session_class = FakeSession
+
+    def __init__(self, handler=None):
+        self.handler = handler or (lambda query, params: [])
+        self.queries = []
+        self.transactions = []
+        self.sessions = []
+
+    def answer(self, query, params) -> list:
+        self.queries.append((str(query), params))
+        return self.handler(str(query), params)
+
+    def session(self, **config):
+        self.sessions.append(config)
+        return self.session_class(self, config)
+
+    def close(self):
+        pass
+
+
+class FakeAsyncDriver(FakeDriver):
+    session_class = FakeAsyncSession
+
+    async def close(self):
+        pass
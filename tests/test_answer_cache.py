@@ -0,0 +1,124 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from neo4j.exceptions import ServiceUnavailable
+
+import answer_cache
+from answer_cache import SemanticAnswerCache, alookup_answer, lookup_answer
+from embedding_cache import FakeEmbeddings, Overloaded
+from tests.fakes import FakeAsyncDriver
+
+
+class BrokenEmbeddings(FakeEmbeddings):
+    def embed_query(self, text):
+        raise RuntimeError("embedding service unavailable")
+
+
+class OverloadedEmbeddings(FakeEmbeddings):
+    async def aembed_query(self, text):
+        raise Overloaded("Embedding queue is full")
+
+
+def unavailable(query, params):
+    raise ServiceUnavailable("no routing servers available")
+
+
+def test_lookup_skips_the_cache_when_the_question_cannot_be_embedded():
+    answer, remember = lookup_answer(BrokenEmbeddings(), "What laptops are available?")
+
+    assert answer is None
+    remember("an answer")
+    assert len(answer_cache.get_answer_cache()) == 0
+
+
+def test_lookup_skips_the_cache_when_the_graph_version_cannot_be_read(monkeypatch):
+    def no_version():
+        raise ServiceUnavailable("no routing servers available")
+
+    monkeypatch.setattr(answer_cache, "current_graph_version", no_version)
+
+    answer, remember = lookup_answer(FakeEmbeddings(), "What laptops are available?")
+
+    assert answer is None
+    remember("an answer")
+    assert len(answer_cache.get_answer_cache()) == 0
+
+
+def test_async_lookup_skips_the_cache_when_the_graph_version_cannot_be_read():
+    driver = FakeAsyncDriver(unavailable)
+
+    answer, remember = asyncio.run(alookup_answer(FakeEmbeddings(), "What laptops are available?", driver=driver))
+
+    assert answer is None
+    remember("an answer")
+    assert len(answer_cache.get_answer_cache()) == 0
+
+
+def test_async_lookup_lets_overload_through():
+    with pytest.raises(Overloaded):
+        asyncio.run(alookup_answer(OverloadedEmbeddings(), "What laptops are available?",
+                                   driver=FakeAsyncDriver(unavailable)))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(answer_cache, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def test_a_similar_question_above_the_threshold_is_a_hit():
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=4, ttl=60)
+    cache.store([1.0, 0.0, 0.0], "v1", "Which laptops are in stock?", "Two laptops.")
+
+    # Cosine similarity 0.995
+    assert cache.lookup([1.0, 0.1, 0.0], "v1") == "Two laptops."
+    assert cache.stats == {"hits": 1, "misses": 0}
+
+
+def test_a_question_below_the_threshold_or_with_other_filters_is_a_miss():
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=4, ttl=60)
+    cache.store([1.0, 0.0, 0.0], "v1", "Which laptops are in stock?", "Two laptops.", category="Laptops")
+
+    # Cosine similarity 0.707
+    assert cache.lookup([1.0, 1.0, 0.0], "v1", category="Laptops") is None
+    assert cache.lookup([1.0, 0.0, 0.0], "v1", category="Tablets") is None
+    assert cache.stats == {"hits": 0, "misses": 2}
+
+
+def test_the_least_recently_used_answer_is_evicted():
+    cache = SemanticAnswerCache(threshold=0.99, max_entries=2, ttl=60)
+    cache.store([1.0, 0.0, 0.0], "v1", "laptops", "Laptops.")
+    cache.store([0.0, 1.0, 0.0], "v1", "tablets", "Tablets.")
+    # Using the laptops answer makes tablets the least recently used
+    assert cache.lookup([1.0, 0.0, 0.0], "v1") == "Laptops."
+
+    cache.store([0.0, 0.0, 1.0], "v1", "phones", "Phones.")
+
+    assert len(cache) == 2
+    assert cache.lookup([0.0, 1.0, 0.0], "v1") is None
+    assert cache.lookup([1.0, 0.0, 0.0], "v1") == "Laptops."
+    assert cache.lookup([0.0, 0.0, 1.0], "v1") == "Phones."
+
+
+def test_answers_expire_after_the_ttl(clock):
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=4, ttl=60)
+    cache.store([1.0, 0.0, 0.0], "v1", "laptops", "Laptops.")
+
+    clock.value += 59
+    assert cache.lookup([1.0, 0.0, 0.0], "v1") == "Laptops."
+    clock.value += 2
+    assert cache.lookup([1.0, 0.0, 0.0], "v1") is None
+    assert len(cache) == 0
+
+
+def test_a_new_graph_version_drops_every_answer():
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=4, ttl=60)
+    cache.store([1.0, 0.0, 0.0], "v1", "laptops", "Laptops.")
+    cache.store([0.0, 1.0, 0.0], "v1", "tablets", "Tablets.")
+
+    assert cache.lookup([1.0, 0.0, 0.0], "v2") is None
+    assert len(cache) == 0
+    cache.store([1.0, 0.0, 0.0], "v2", "laptops", "Laptops, restocked.")
+    assert cache.lookup([1.0, 0.0, 0.0], "v2") == "Laptops, restocked."
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+import retrieval
+from async_rag import AsyncRAGPipeline
+from embedding_cache import FakeEmbeddings
+from tests.fakes import FakeAsyncDriver, FakeAsyncSession, product_row
+
+
+class SlowAsyncSession(FakeAsyncSession):
+    """Takes a moment per transaction and records how many overlap."""
+
+    async def execute_read(self, work, *args, **kwargs):
+        self.driver.active += 1
+        self.driver.peak = max(self.driver.peak, self.driver.active)
+        try:
+            await asyncio.sleep(0.01)
+            return await super().execute_read(work, *args, **kwargs)
+        finally:
+            self.driver.active -= 1
+
+
+class SlowAsyncDriver(FakeAsyncDriver):
+    session_class = SlowAsyncSession
+
+    def __init__(self, handler):
+        super().__init__(handler)
+        self.active = self.peak = 0
+
+
+def indexed_row(product_id, name):
+    """A product row as the index and keyword queries return it."""
+    return {**product_row(product_id, name), "product_id": product_id}
+
+
+def handler(query, params):
+    if "allShortestPaths" in query:
+        return [{"stops": ["Berlin Hub", "Paris Depot"], "duration": 9, "distance": 1050}]
+    if "CONNECTED_TO" in query:
+        return []
+    if "UNWIND $terms" in query:
+        return [indexed_row("P2", "Tablet")]
+    return [indexed_row("P1", "Laptop")]
+
+
+@pytest.fixture
+def retriever_mode(monkeypatch):
+    def configure(mode):
+        monkeypatch.setattr(retrieval, "_retriever", retrieval.Neo4jRetriever(mode=mode))
+    return configure
+
+
+def retrieve(driver, question):
+    pipeline = AsyncRAGPipeline(embeddings=FakeEmbeddings(), driver=driver)
+    return asyncio.run(pipeline.retrieve(question))
+
+
+def test_hybrid_retrieval_is_one_query(retriever_mode):
+    retriever_mode("hybrid")
+    driver = SlowAsyncDriver(handler)
+
+    context = retrieve(driver, "Which laptops are available?")
+
+    assert "Product: Laptop" in context
+    assert len(driver.queries) == 1
+    assert driver.peak == 1
+
+
+def test_the_route_between_named_warehouses_runs_alongside_the_hybrid_query(retriever_mode):
+    retriever_mode("hybrid")
+    driver = SlowAsyncDriver(handler)
+
+    context = retrieve(driver, "How fast can laptops go from W1 to W2?")
+
+    assert "Fastest route: Berlin Hub -> Paris Depot" in context
+    assert "Product: Laptop" in context
+    # The hybrid query and the fastest route overlap; the expansion from the results follows
+    assert driver.peak == 2
+    assert sum("allShortestPaths" in query for query, _ in driver.queries) == 1
+    assert len(driver.queries) == 3
+
+
+def test_vector_and_keyword_lookups_run_concurrently_outside_hybrid_mode(retriever_mode):
+    retriever_mode("index")
+    driver = SlowAsyncDriver(handler)
+
+    context = retrieve(driver, "Which tablets are available?")
+
+    assert driver.peak == 2
+    assert context.index("Product: Laptop") < context.index("Product: Tablet")
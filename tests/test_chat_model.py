@@ -0,0 +1,42 @@
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableGenerator
+
+from chat_model import stream_with_timings
+
+
+def chain(response: str, sleep: float = None):
+    return FakeListChatModel(responses=[response], sleep=sleep) | StrOutputParser()
+
+
+def test_chunks_are_yielded_in_order_with_their_timings():
+    timings = {}
+
+    chunks = list(stream_with_timings(chain("Laptops ship from Berlin.", sleep=0.001), "question", timings))
+
+    assert "".join(chunks) == "Laptops ship from Berlin."
+    assert len(chunks) > 1
+    assert 0 < timings["time_to_first_token"] <= timings["total_latency"]
+
+
+def test_time_to_first_token_is_measured_from_start():
+    timings = {}
+
+    list(stream_with_timings(chain("ok"), "question", timings, start=0.0))
+
+    # perf_counter values since an arbitrary, earlier start
+    assert timings["time_to_first_token"] > 0
+    assert timings["time_to_first_token"] <= timings["total_latency"]
+
+
+def test_an_empty_stream_still_records_both_timings():
+    # A chat model cannot stream an empty message, so the chain yields nothing itself
+    def nothing(inputs):
+        yield from ()
+
+    timings = {}
+
+    chunks = list(stream_with_timings(RunnableGenerator(nothing), "question", timings))
+
+    assert chunks == []
+    assert timings["time_to_first_token"] == timings["total_latency"]
@@ -0,0 +1,52 @@
+import pytest
+
+from conversation import Conversation
+from tests.fakes import product_row
+
+
+@pytest.fixture
+def conversation():
+    """A conversation that has just answered a question about laptops."""
+    conversation = Conversation(rewrite="entities")
+    question = "What laptops are available?"
+    assert conversation.prepare(question) == question
+    conversation.remember_retrieval("Product: Laptop Pro\nDescription: A laptop pro",
+                                    [product_row("P1", "Laptop Pro")])
+    conversation.add_turn(question, "The Laptop Pro is available from TechCorp Inc.")
+    return conversation
+
+
+@pytest.mark.parametrize("question", [
+    "Is there a tablet?",
+    "Which audio products are there?",
+    "Where is that smartwatch stored?",
+])
+def test_questions_about_new_entities_are_retrieved_afresh(conversation, question):
+    conversation.prepare(question)
+
+    assert conversation.new_terms
+    assert not conversation.reusable()
+
+
+@pytest.mark.parametrize("question", ["Where is it stored?", "Who supplies that laptop?"])
+def test_follow_ups_about_the_same_entities_reuse_the_context(conversation, question):
+    standalone = conversation.prepare(question)
+
+    assert "Laptop Pro" in standalone
+    assert conversation.reusable()
+
+
+def test_a_new_topic_forgets_the_last_retrieval(conversation):
+    conversation.prepare("What smartphones are available?")
+
+    assert not conversation.follow_up
+    assert conversation.records is None and not conversation.reusable()
+
+
+def test_the_rewrite_strategy_comes_from_the_caller_or_the_configuration(monkeypatch):
+    import conversation as conversation_module
+
+    monkeypatch.setattr(conversation_module, "CONVERSATION_REWRITE", "llm")
+
+    assert Conversation().rewrite == "llm"
+    assert Conversation(rewrite="entities").rewrite == "entities"
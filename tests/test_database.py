@@ -0,0 +1,104 @@
+from neo4j import READ_ACCESS, GraphDatabase
+from neo4j.exceptions import CypherSyntaxError, DriverError, Neo4jError, ServiceUnavailable
+import pytest
+
+import database
+import load_data
+import retrieval
+from tests.fakes import FakeDriver, FakeSession
+
+
+class RetryingSession(FakeSession):
+    """Retries a transaction function on retryable errors, as the driver's execute_read does."""
+
+    attempts = 3
+
+    def execute_read(self, work, *args, **kwargs):
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return super().execute_read(work, *args, **kwargs)
+            except (DriverError, Neo4jError) as e:
+                if not e.is_retryable() or attempt == self.attempts:
+                    raise
+
+
+class RetryingDriver(FakeDriver):
+    session_class = RetryingSession
+
+
+def failing_first(error) -> RetryingDriver:
+    """A driver whose first query fails with ``error``; later queries find one product."""
+    def handler(query, params):
+        if len(driver.queries) == 1:
+            raise error
+        return [{"product_id": "P1"}]
+
+    driver = RetryingDriver(handler)
+    return driver
+
+
+def test_read_sessions_are_routed_to_readers_with_retries_configured():
+    driver = FakeDriver()
+
+    with database.read_session(driver):
+        pass
+
+    config = driver.sessions[0]
+    assert config["default_access_mode"] == READ_ACCESS
+    assert config["max_transaction_retry_time"] == database.READ_RETRY_TIME
+    assert config["initial_retry_delay"] == 0.01
+    # Accepted by the pinned driver
+    real_driver = GraphDatabase.driver("neo4j://127.0.0.1:9", auth=("neo4j", "password"))
+    try:
+        real_driver.session(**config).close()
+    finally:
+        real_driver.close()
+
+
+@pytest.mark.parametrize("error", [ServiceUnavailable("leader switched"),
+                                   Neo4jError.hydrate(code="Neo.TransientError.Cluster.NotALeader",
+                                                      message="No longer the leader")])
+def test_reads_are_retried_after_a_failover(monkeypatch, error):
+    driver = failing_first(error)
+    monkeypatch.setattr(retrieval, "record_query_summary", lambda summary: None)
+
+    with database.read_session(driver) as session:
+        records = retrieval.run_query(session, "RETURN 1", {}, timeout=2)
+
+    assert [record["product_id"] for record in records] == ["P1"]
+    # Retried as a read, with the same transaction timeout
+    assert driver.transactions == [("read", 2), ("read", 2)]
+
+
+def test_query_errors_are_not_retried(monkeypatch):
+    driver = failing_first(CypherSyntaxError.hydrate(code="Neo.ClientError.Statement.SyntaxError",
+                                                     message="Invalid input"))
+
+    with pytest.raises(CypherSyntaxError):
+        with database.read_session(driver) as session:
+            retrieval.run_query(session, "RETURN", {}, timeout=2)
+
+    assert driver.transactions == [("read", 2)]
+
+
+def test_loader_lookups_read_after_the_loads_writes(monkeypatch):
+    driver = FakeDriver(lambda query, params: [])
+    monkeypatch.setattr(database, "get_driver", lambda: driver)
+
+    load_data.unchanged_keys("Supplier", [{"key": "S1", "content_hash": "h"}])
+    load_data.prune_entity("Supplier", {"S1"})
+
+    assert [kind for kind, _ in driver.transactions] == ["read", "read"]
+    assert all(config["bookmark_manager"] is database._write_bookmark_manager for config in driver.sessions)
+
+
+def test_liveness_check_timeout_comes_from_the_environment(monkeypatch):
+    monkeypatch.setattr(database, "LIVENESS_CHECK_TIMEOUT", "30")
+    options = database._driver_options()
+    assert options["liveness_check_timeout"] == 30.0
+
+    # Accepted by the pinned driver
+    GraphDatabase.driver("neo4j://127.0.0.1:9", **options).close()
+
+    monkeypatch.setattr(database, "LIVENESS_CHECK_TIMEOUT", None)
+    assert "liveness_check_timeout" not in database._driver_options()
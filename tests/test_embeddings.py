@@ -0,0 +1,162 @@
+from array import array
+
+import numpy as np
+import pytest
+
+import embedding_cache
+import load_data
+import retrieval
+from embedding_cache import EmbeddingCache, FakeEmbeddings, embed_texts, get_embeddings, model_name
+
+
+@pytest.fixture
+def openai_settings(monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_PROVIDER", "openai")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+    def configure(model, dimensions):
+        monkeypatch.setattr(embedding_cache, "EMBEDDING_MODEL", model)
+        monkeypatch.setattr(embedding_cache, "EMBEDDING_DIMENSIONS", dimensions)
+    return configure
+
+
+def test_text_embedding_3_is_asked_for_native_size_vectors(openai_settings):
+    openai_settings("text-embedding-3-small", 512)
+
+    embeddings = get_embeddings()
+
+    # Truncated locally, so the full vector can be stored for re-ranking
+    assert embeddings.model == "text-embedding-3-small"
+    assert embeddings.model_kwargs == {}
+    assert model_name(embeddings) == "text-embedding-3-small"
+
+
+def test_models_without_matryoshka_training_are_not_truncated(openai_settings):
+    openai_settings("text-embedding-ada-002", 512)
+
+    with pytest.raises(ValueError, match="cannot be reduced"):
+        get_embeddings()
+
+
+def test_full_size_models_need_no_truncation(openai_settings):
+    openai_settings("text-embedding-ada-002", 1536)
+
+    assert get_embeddings().model == "text-embedding-ada-002"
+
+
+class NativeSizeEmbeddings:
+    """A 4-dimension embedder whose vectors disagree with their 2-dimension prefixes."""
+
+    model = "native-4"
+    vectors = {
+        "query": [1.0, 0.0, 1.0, 0.0],
+        # Identical to the query in the first two dimensions, orthogonal in full
+        "Prefix twin": [1.0, 0.0, -1.0, 0.0],
+        # Further away in the first two dimensions, closer in full
+        "Full match": [1.0, 1.0, 1.0, 0.0],
+    }
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+
+def test_loaded_products_are_reranked_by_their_full_vectors(monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_DIMENSIONS", 2)
+    monkeypatch.setattr(retrieval, "EMBEDDING_DIMENSIONS", 2)
+    embedder = NativeSizeEmbeddings()
+    rows = load_data.embedding_preparer(embedder, EmbeddingCache(":memory:"))(
+        [{"id": name, "description": name} for name in ("Prefix twin", "Full match")])
+    assert all(len(row["embedding"]) == 2 and row["embedding_full"] for row in rows)
+
+    query_vector = embedder.embed_query("query")
+    _, params = retrieval.build_search(query_vector, top_k=2, mode="exact")
+    assert params["rerank"] and len(params["embedding"]) == 2
+
+    # What the exact query returns: ranked by the reduced vectors
+    records = sorted(({"product_id": row["id"], "score": (1 + float(np.dot(row["embedding"], params["embedding"]))) / 2,
+                       "full_embedding": row["embedding_full"]} for row in rows),
+                     key=lambda record: record["score"], reverse=True)
+    assert [record["product_id"] for record in records] == ["Prefix twin", "Full match"]
+
+    reranked = retrieval.rerank(records, query_vector, top_k=2)
+
+    assert [record["product_id"] for record in reranked] == ["Full match", "Prefix twin"]
+
+
+def hybrid_row(product_id, score, vector_rrf, full):
+    return {"label": "Product", "id": product_id, "score": score, "vector_rrf": vector_rrf,
+            "full_embedding": array("f", full).tobytes()}
+
+
+def test_hybrid_candidates_are_reranked_by_their_full_vectors(monkeypatch):
+    monkeypatch.setattr(retrieval, "EMBEDDING_DIMENSIONS", 2)
+    query, params = retrieval.build_search([1.0, 0.0, 0.0], top_k=2, mode="hybrid", question="laptop")
+    assert params["rerank"] and params["top_k"] == 2 * retrieval.RERANK_MULTIPLIER
+    assert "full_embedding" in query
+
+    # P1 ranked first by the reduced vectors, but P2 is closer in full precision;
+    # P3 was only found by keywords and keeps its score
+    first, second = 1 / 61, 1 / 62
+    records = [hybrid_row("P1", first, first, [0.0, 0.0, 1.0]), hybrid_row("P2", second, second, [1.0, 0.0, 0.0]),
+               hybrid_row("P3", 0.0162, 0.0, [0.0, 1.0, 0.0])]
+
+    reranked = retrieval.rerank(records, [1.0, 0.0, 0.0], top_k=2)
+
+    assert [row["id"] for row in reranked] == ["P2", "P3"]
+    assert reranked[0]["score"] == pytest.approx(first)
+    assert all("full_embedding" not in row for row in reranked)
+
+
+def test_query_embeddings_are_cached_per_model_name():
+    from query_cache import MemoryStore, QueryCache
+
+    class SizedEmbeddings(NativeSizeEmbeddings):
+        def __init__(self, dimensions):
+            self.model_kwargs = {"dimensions": dimensions}
+
+        def embed_query(self, text):
+            return [float(self.model_kwargs["dimensions"])]
+
+    cache = QueryCache(embedding_store=MemoryStore())
+
+    assert cache.embed_query(SizedEmbeddings(256), "query") == [256.0]
+    # Vectors of another size are not served from the first one's entry
+    assert cache.embed_query(SizedEmbeddings(512), "query") == [512.0]
+
+
+def test_a_second_embed_texts_call_is_served_from_the_cache(tmp_path):
+    embedder = FakeEmbeddings(size=8)
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    texts = ["Laptop", "Tablet", "Laptop"]
+
+    first = embed_texts(embedder, texts, cache=cache, batch_size=2, max_concurrency=2)
+    calls = embedder.calls
+    second = embed_texts(embedder, texts, cache=cache, batch_size=2, max_concurrency=2)
+
+    # Each distinct text is embedded once; the second call never reaches the provider
+    assert calls == 1
+    assert embedder.calls == calls
+    assert first[0] == first[2]
+    assert np.allclose(second, first, atol=1e-6)
+
+
+def test_embed_texts_cache_keys_are_namespaced_by_model_name(tmp_path):
+    class SizedEmbeddings(FakeEmbeddings):
+        def __init__(self, dimensions):
+            super().__init__(size=8)
+            self.model_kwargs = {"dimensions": dimensions}
+
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    embedders = [FakeEmbeddings(size=8), FakeEmbeddings(size=4), SizedEmbeddings(4)]
+
+    vectors = [embed_texts(embedder, ["Laptop"], cache=cache)[0] for embedder in embedders]
+
+    assert [model_name(embedder) for embedder in embedders] == ["fake-8", "fake-4", "fake-8@4"]
+    assert [embedder.calls for embedder in embedders] == [1, 1, 1]
+    assert [len(vector) for vector in vectors] == [8, 4, 8]
+    # One entry per model name, none overwritten by another model's vector
+    keys = [EmbeddingCache.key(model_name(embedder), "Laptop") for embedder in embedders]
+    assert len(cache.get_many(keys)) == 3
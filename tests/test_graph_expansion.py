@@ -0,0 +1,73 @@
+import re
+
+from neo4j.exceptions import ClientError
+
+from graph_expansion import (build_shortest_route_query, expand_routes, expansion_request, is_route_question,
+                             shortest_route_request, warehouse_codes)
+from tests.fakes import FakeDriver, product_row
+
+
+def warehouse(warehouse_id: str) -> dict:
+    return {"label": "Warehouse", "id": warehouse_id, "name": f"Warehouse {warehouse_id}"}
+
+
+def test_the_fastest_route_query_is_a_bounded_shortest_path_search():
+    query = build_shortest_route_query(4)
+
+    assert "allShortestPaths((a)-[:CONNECTED_TO*..4]->(b))" in query
+    # No other variable-length pattern that would enumerate every bounded path
+    assert len(re.findall(r"\*\d*\.\.", query)) == 1
+
+
+def test_warehouse_codes_in_a_question_are_route_endpoints():
+    request = shortest_route_request([], "How long from w1 to W3?")
+
+    assert warehouse_codes("Ship W2 stock to w2 or W10") == ["W2", "W10"]
+    assert request == (build_shortest_route_query(4), {"from_id": "W1", "to_id": "W3"})
+
+
+def test_two_warehouse_codes_make_a_route_question_without_route_terms():
+    assert is_route_question("W1 to W2?")
+    assert not is_route_question("What is stored at W1?")
+    assert not is_route_question("What laptops are available?")
+
+
+def test_named_codes_take_precedence_over_matched_warehouses():
+    records = [warehouse("W7"), warehouse("W8")]
+
+    _, params = shortest_route_request(records, "Fastest route from W1 to W2?")
+
+    assert params == {"from_id": "W1", "to_id": "W2"}
+    assert shortest_route_request(records, "Fastest route from W7 to w7?")[1] == {"from_id": "W7", "to_id": "W8"}
+    assert shortest_route_request([warehouse("W7")], "Fastest route from W7 to w7?") is None
+
+
+def test_the_expansion_starts_from_named_warehouses():
+    _, params = expansion_request([product_row("P1", "Laptop")], "Which routes leave W4?")
+
+    assert params["product_ids"] == ["P1"]
+    assert params["warehouse_ids"] == ["W4"]
+
+
+def test_expand_routes_adds_the_fastest_route_between_named_warehouses():
+    def handler(query, params):
+        if "allShortestPaths" in query:
+            return [{"stops": ["Berlin Hub", "Paris Depot"], "duration": 9, "distance": 1050}]
+        return []
+
+    driver = FakeDriver(handler)
+    with driver.session() as session:
+        records = expand_routes(session, [], "Route from W1 to W2?")
+
+    assert records[0]["label"] == "FastestRoute"
+    assert records[0]["name"] == "Berlin Hub -> Paris Depot"
+    assert driver.queries[0][1] == {"from_id": "W1", "to_id": "W2"}
+    assert all(kind == "read" and timeout for kind, timeout in driver.transactions)
+
+
+def test_expansion_errors_never_fail_retrieval():
+    def handler(query, params):
+        raise ClientError("The transaction has been terminated")
+
+    with FakeDriver(handler).session() as session:
+        assert expand_routes(session, [], "Route from W1 to W2?") == []
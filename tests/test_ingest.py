@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor
+import importlib.util
+import json
+import os
+import random
+import threading
+import time
+
+import pytest
+
+import ingest
+from embedding_cache import EMBEDDING_DIMENSIONS
+from tests.fakes import FakeDriver
+
+
+def test_embedding_row_estimate_follows_the_configured_dimensions():
+    assert ingest.EMBEDDING_ROW_BYTES == EMBEDDING_DIMENSIONS * 32
+
+
+@pytest.mark.skipif(importlib.util.find_spec("pyarrow") is not None, reason="pyarrow is installed")
+def test_parquet_sources_without_pyarrow_fail_before_ingesting(tmp_path):
+    (tmp_path / "suppliers.jsonl").write_text("")
+    (tmp_path / "products.parquet").write_bytes(b"")
+
+    with pytest.raises(ValueError, match="requires pyarrow"):
+        ingest.find_sources(str(tmp_path))
+
+
+def relationship_rows(count: int, start_key: str, end_key: str) -> list:
+    rng = random.Random(0)
+    return [{start_key: f"W{rng.randrange(40)}", end_key: f"W{rng.randrange(40)}"} for _ in range(count)]
+
+
+@pytest.mark.parametrize("partitions", [2, 3, 4, 5])
+def test_connected_to_rounds_lock_disjoint_warehouse_partitions(partitions):
+    rows = relationship_rows(500, "from", "to")
+
+    rounds = ingest.schedule_rounds(rows, "from", "to", partitions, same_label=True)
+
+    for buckets in rounds:
+        locked = [{ingest.partition(row[key], partitions) for row in bucket for key in ("from", "to")}
+                  for bucket in buckets]
+        # Both endpoints are warehouses: no partition may appear in two buckets of a round
+        assert sum(len(parts) for parts in locked) == len(set().union(*locked))
+    assert sorted(map(str, (row for buckets in rounds for bucket in buckets for row in bucket))) == \
+        sorted(map(str, rows))
+
+
+def test_rounds_of_different_labels_share_no_start_or_end_partition():
+    rows = relationship_rows(500, "supplier_id", "product_id")
+
+    for buckets in ingest.schedule_rounds(rows, "supplier_id", "product_id", 4):
+        for key in ("supplier_id", "product_id"):
+            parts = [{ingest.partition(row[key], 4) for row in bucket} for bucket in buckets]
+            assert all(len(p) == 1 for p in parts)
+            assert len(set().union(*parts)) == len(parts)
+
+
+@pytest.fixture
+def recording_sessions(monkeypatch):
+    """Every write session of the pipeline records its UNWIND batches on one fake driver."""
+    def configure(handler=None):
+        driver = FakeDriver(handler)
+        monkeypatch.setattr(ingest, "write_session", lambda: driver.session())
+        return driver
+    return configure
+
+
+def write_suppliers(directory, count: int) -> str:
+    path = os.path.join(str(directory), "suppliers.jsonl")
+    with open(path, "w") as f:
+        for i in range(count):
+            f.write(json.dumps({"id": f"S{i}", "name": f"Supplier {i}", "location": "X",
+                                "specialization": "Y"}) + "\n")
+    return path
+
+
+def written_ids(driver) -> list:
+    return [row["id"] for _, params in driver.queries for row in params["rows"]]
+
+
+def test_a_failed_run_resumes_from_the_checkpoint(tmp_path, recording_sessions):
+    path = write_suppliers(tmp_path, 10)
+    checkpoint = ingest.Checkpoint(str(tmp_path / "checkpoint.json"))
+
+    def fail_on_third_chunk(query, params):
+        if params["rows"][0]["id"] == "S4":
+            raise RuntimeError("connection lost")
+        return []
+
+    failing = recording_sessions(fail_on_third_chunk)
+    with ThreadPoolExecutor(max_workers=1) as executor, pytest.raises(RuntimeError):
+        ingest.IngestPipeline(1, 2, checkpoint=checkpoint).load_nodes(executor, "Supplier", path)
+    assert written_ids(failing)[:4] == ["S0", "S1", "S2", "S3"]
+
+    resumed = recording_sessions()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        written = ingest.IngestPipeline(1, 2, checkpoint=ingest.Checkpoint(checkpoint.path)).load_nodes(
+            executor, "Supplier", path)
+
+    # Only the failed chunk, and any the failed run never wrote, are written again
+    finished = set(written_ids(failing)) - {"S4", "S5"}
+    assert {"S4", "S5"} <= set(written_ids(resumed))
+    assert set(written_ids(resumed)) == {f"S{i}" for i in range(10)} - finished
+    assert written == len(written_ids(resumed))
+
+
+def test_reading_pauses_at_the_memory_ceiling(tmp_path, recording_sessions):
+    path = write_suppliers(tmp_path, 12)
+    active, most_active = [0], [0]
+    lock = threading.Lock()
+
+    def slow_write(query, params):
+        with lock:
+            active[0] += 1
+            most_active[0] = max(most_active[0], active[0])
+        time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+        return []
+
+    driver = recording_sessions(slow_write)
+    # Smaller than one chunk: a chunk is only read once the previous one is written
+    pipeline = ingest.IngestPipeline(4, 2, memory_limit_mb=1e-6,
+                                     checkpoint=ingest.Checkpoint(str(tmp_path / "checkpoint.json")))
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert pipeline.load_nodes(executor, "Supplier", path) == 12
+
+    assert most_active[0] == 1
+    assert sorted(written_ids(driver), key=lambda i: int(i[1:])) == [f"S{i}" for i in range(12)]
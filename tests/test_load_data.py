@@ -0,0 +1,152 @@
+import pytest
+
+import load_data
+from tests.fakes import FakeDriver
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    """Loader sessions on a recording driver; ``configure(handler)`` answers their queries."""
+    driver = FakeDriver()
+    monkeypatch.setattr(load_data, "write_session", driver.session)
+
+    def configure(handler):
+        driver.handler = handler
+        return driver
+    return configure
+
+
+def writes(driver) -> list:
+    """The rows of each batched write, in order."""
+    return [params["rows"] for query, params in driver.queries if query.lstrip().startswith("UNWIND $rows")
+            and "RETURN" not in query]
+
+
+def test_rows_are_written_in_unwind_batches_of_managed_transactions(graph, capsys):
+    driver = graph(lambda query, params: [])
+
+    written = load_data.load_suppliers(batch_size=2)
+
+    assert written == len(load_data.SUPPLIERS)
+    assert [[row["id"] for row in rows] for rows in writes(driver)] == [["S1", "S2"], ["S3", "S4"], ["S5"]]
+    assert all(query == load_data.SUPPLIER_QUERY for query, _ in driver.queries)
+    assert [kind for kind, _ in driver.transactions] == ["write"] * 3
+    # One session for the whole entity type
+    assert len(driver.sessions) == 1
+    assert "Supplier: 5 rows written" in capsys.readouterr().out
+
+
+def test_relationships_are_batched_per_type(graph):
+    driver = graph(lambda query, params: [])
+
+    load_data.create_relationships(batch_size=10)
+
+    assert [query for query, _ in driver.queries] == [load_data.SUPPLIES_QUERY, load_data.STORED_AT_QUERY]
+    assert all(len(rows) == len(load_data.RELATIONSHIPS) for rows in writes(driver))
+
+
+def test_uniqueness_constraints_are_created_before_any_index(graph):
+    driver = graph(lambda query, params: [])
+
+    load_data.create_schema()
+
+    queries = [" ".join(query.split()) for query, _ in driver.queries]
+    assert [query.split(" FOR ")[0] for query in queries[:3]] == [
+        "CREATE CONSTRAINT product_id IF NOT EXISTS",
+        "CREATE CONSTRAINT supplier_id IF NOT EXISTS",
+        "CREATE CONSTRAINT warehouse_id IF NOT EXISTS",
+    ]
+    assert all("REQUIRE n.id IS UNIQUE" in query for query in queries[:3])
+    assert not any("CONSTRAINT" in query for query in queries[3:])
+
+
+def stored(rows, entity, changed=()):
+    """A graph holding ``rows``: lookups return their hashes, except for keys in ``changed``."""
+    spec = load_data.ENTITIES[entity]
+    keys = [load_data.entity_key(row, spec["key"]) for row in rows]
+    hashes = {key: "outdated" if key in changed else load_data.content_hash(row, spec["fields"])
+              for key, row in zip(keys, rows)}
+
+    def handler(query, params):
+        if query == spec["lookup"]:
+            return [{"key": row["key"], "hash": hashes[row["key"]]} for row in params["rows"]
+                    if row["key"] in hashes]
+        if query == spec["existing"]:
+            return [{field: row[field] for field in spec["key"]} for row in rows]
+        return []
+    return handler
+
+
+def test_incremental_loads_write_only_new_and_changed_rows(graph, capsys):
+    suppliers = load_data.SUPPLIERS + [{"id": "S6", "name": "New Supplier", "location": "France",
+                                        "specialization": "Cables"}]
+    driver = graph(stored(load_data.SUPPLIERS, "Supplier", changed={"S2"}))
+
+    written = load_data.load_suppliers(suppliers, incremental=True)
+
+    assert written == 2
+    assert [[row["id"] for row in rows] for rows in writes(driver)] == [["S2", "S6"]]
+    # The hashes are read on a reader, after the load's own writes
+    assert [kind for kind, _ in driver.transactions] == ["read", "write"]
+    assert "4 unchanged" in capsys.readouterr().out
+
+
+def test_unchanged_products_are_not_re_embedded(graph, tmp_path):
+    from embedding_cache import EmbeddingCache, FakeEmbeddings
+
+    driver = graph(stored(load_data.PRODUCTS, "Product", changed={"P3"}))
+    embeddings = FakeEmbeddings()
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+
+    load_data.load_products(incremental=True, embeddings=embeddings, cache=cache)
+
+    (rows,) = writes(driver)
+    assert [row["id"] for row in rows] == ["P3"]
+    assert len(rows[0]["embedding"]) == 1536
+    assert embeddings.calls == 1
+    assert len(cache.get_many([EmbeddingCache.key(embeddings.model, product["description"])
+                               for product in load_data.PRODUCTS])) == 1
+
+
+def test_prune_deletes_entities_missing_from_the_source(graph):
+    stale_route = {"from": "W4", "to": "W1", "distance": 100, "duration": 2}
+    driver = graph(stored(load_data.ROUTES + [stale_route], "CONNECTED_TO"))
+
+    changed = load_data.load_transportation_routes(incremental=True, prune=True)
+
+    assert changed == 1
+    delete = load_data.ENTITIES["CONNECTED_TO"]["delete"]
+    deletes = [params["rows"] for query, params in driver.queries if query == delete]
+    assert deletes == [[{"from": "W4", "to": "W1"}]]
+
+
+def test_stale_context_summaries_are_refreshed_in_batches_until_none_are_left(graph):
+    products = {
+        "P1": {"name": "Laptop", "description": "A laptop", "stale": True},
+        "P2": {"name": "Tablet", "description": "A tablet", "stale": True},
+        "P3": {"name": "Phone", "description": "A phone", "stale": True},
+        None: {"name": "Orphan", "description": "Loaded without an id", "stale": True},
+    }
+
+    def handler(query, params):
+        if query == load_data.STALE_SUMMARIES_QUERY:
+            # The query only selects stale products that have an id
+            stale = [product_id for product_id, product in products.items()
+                     if product["stale"] and product_id is not None]
+            return [{"id": product_id, "name": products[product_id]["name"],
+                     "description": products[product_id]["description"],
+                     "suppliers": [{"name": "Tech Supplier Inc"}], "warehouses": []}
+                    for product_id in stale[:params["batch_size"]]]
+        if query == load_data.CONTEXT_SUMMARY_QUERY:
+            for row in params["rows"]:
+                products[row["id"]].update(stale=False, summary=row["summary"])
+        return []
+
+    driver = graph(handler)
+
+    refreshed = load_data.refresh_context_summaries(batch_size=2)
+
+    assert refreshed == 3
+    assert "WHERE p.context_stale = true AND p.id IS NOT NULL" in load_data.STALE_SUMMARIES_QUERY
+    assert products["P1"]["summary"] == "Product: Laptop\nDescription: A laptop\nSupplied by: Tech Supplier Inc"
+    assert [kind for kind, _ in driver.transactions] == ["read", "write", "read", "write", "read"]
@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pytest
+
+import local_index
+from local_index import LocalVectorIndex
+from tests.fakes import FakeDriver
+
+
+def product(product_id: str, direction: int, updated_at: int, category: str = "Electronics") -> dict:
+    embedding = np.zeros(8, dtype=np.float32)
+    embedding[direction] = 1.0
+    return {"id": product_id, "embedding": embedding.tolist(), "category": category, "price": 10.0,
+            "updated_at": updated_at}
+
+
+def query(direction: int) -> np.ndarray:
+    vector = np.zeros(8, dtype=np.float32)
+    vector[direction] = 1.0
+    return vector
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    """The products in the graph; sync exports the ones changed since the index's last sync."""
+    products = {}
+
+    def handler(query, params):
+        if "count(p)" in query:
+            return [{"count": len(products)}]
+        return [{"id": product_id} for product_id in products]
+
+    monkeypatch.setattr(local_index, "current_graph_version", lambda: "v2")
+    monkeypatch.setattr(local_index, "read_session", lambda: FakeDriver(handler).session())
+    monkeypatch.setattr(LocalVectorIndex, "_export", lambda self, since=None: [
+        row for row in products.values() if since is None or row["updated_at"] >= since])
+    return products
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_sync_patches_and_appends_rows_in_place(tmp_path, graph, dtype):
+    rows = [product("P1", 0, 1), product("P2", 1, 1), product("P3", 2, 1), product("P4", 3, 1), product("P5", 4, 1)]
+    graph.update({row["id"]: row for row in rows})
+    index = LocalVectorIndex(str(tmp_path), dtype=dtype, ivf_min_vectors=1000)
+    index.build(rows, version="v1")
+    vectors_file = os.path.join(str(tmp_path), "vectors.bin")
+    inode, size = os.stat(vectors_file).st_ino, os.path.getsize(vectors_file)
+
+    graph["P1"] = product("P1", 5, 2)
+    graph["P6"] = product("P6", 6, 2)
+    del graph["P2"]
+    index.sync()
+    assert index.stats()["count"] == 5
+    assert index.stats()["deleted"] == 1
+
+    # The same file, grown by one row rather than rewritten
+    assert os.stat(vectors_file).st_ino == inode
+    assert os.path.getsize(vectors_file) == size + size // 5
+    assert index.search(query(5), top_k=1)[0][0] == "P1"
+    assert index.search(query(6), top_k=1)[0][0] == "P6"
+    assert "P2" not in [product_id for product_id, _ in index.search(query(1), top_k=6, min_score=0)]
+
+    reloaded = LocalVectorIndex(str(tmp_path), dtype=dtype)
+    assert reloaded.load()
+    assert reloaded.stats()["count"] == 5
+    assert reloaded.search(query(5), top_k=1)[0][0] == "P1"
+
+
+def test_sync_compacts_once_enough_rows_are_deleted(tmp_path, graph, monkeypatch):
+    monkeypatch.setattr(local_index, "LOCAL_INDEX_COMPACT_RATIO", 0.3)
+    rows = [product(f"P{i}", i, 1) for i in range(5)]
+    graph.update({row["id"]: row for row in rows})
+    index = LocalVectorIndex(str(tmp_path), ivf_min_vectors=1000)
+    index.build(rows, version="v1")
+
+    del graph["P0"]
+    index.sync()
+    assert index.stats()["deleted"] == 1
+
+    del graph["P1"]
+    index.sync()
+    assert index.stats() == dict(index.stats(), count=3, deleted=0)
+    assert os.path.getsize(os.path.join(str(tmp_path), "vectors.bin")) == 3 * 8 * 4
+    assert index.search(query(4), top_k=1)[0][0] == "P4"
+
+
+def test_sync_rebuilds_when_the_embedding_dimensions_change(tmp_path, graph):
+    rows = [product(f"P{i}", i, 1) for i in range(3)]
+    graph.update({row["id"]: row for row in rows})
+    index = LocalVectorIndex(str(tmp_path), ivf_min_vectors=1000)
+    index.build(rows, version="v1")
+
+    # Reloaded at a new EMBEDDING_DIMENSIONS: every product comes back 4 wide
+    for product_id, row in graph.items():
+        graph[product_id] = dict(row, embedding=row["embedding"][:4], updated_at=2)
+    index.sync()
+
+    reloaded = LocalVectorIndex(str(tmp_path))
+    assert reloaded.load()
+    assert reloaded._snapshot.vectors.shape == (3, 4)
+    assert reloaded.search(query(2)[:4], top_k=1)[0][0] == "P2"
@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+
+import pytest
+
+import query_cache
+from query_cache import MemoryStore, QueryCache, SQLiteStore, bump_graph_version
+from tests.fakes import FakeDriver
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(query_cache, "time", SimpleNamespace(time=lambda: now.value, monotonic=lambda: now.value))
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(max_entries=2, ttl=60):
+        if request.param == "memory":
+            return MemoryStore(max_entries=max_entries, ttl=ttl)
+        return SQLiteStore(str(tmp_path / "cache.sqlite3"), namespace="test", max_entries=max_entries, ttl=ttl)
+    return make
+
+
+def test_the_least_recently_used_entry_is_evicted(make_store, clock):
+    store = make_store(max_entries=2)
+    store.set("laptops", [1.0])
+    clock.value += 1
+    store.set("tablets", [2.0])
+    clock.value += 1
+    # Reading laptops makes tablets the least recently used
+    assert store.get("laptops") == [1.0]
+    clock.value += 1
+
+    store.set("phones", [3.0])
+
+    assert len(store) == 2
+    assert store.get("tablets") is None
+    assert store.get("laptops") == [1.0]
+    assert store.get("phones") == [3.0]
+
+
+def test_entries_expire_after_the_ttl(make_store, clock):
+    store = make_store(ttl=60)
+    store.set("laptops", "context")
+
+    clock.value += 60
+    assert store.get("laptops") == "context"
+    clock.value += 1
+    assert store.get("laptops") is None
+    assert len(store) == 0
+
+
+def test_sqlite_namespaces_are_separate(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    embeddings, contexts = SQLiteStore(path, namespace="embedding"), SQLiteStore(path, namespace="context")
+    embeddings.set("laptops", [1.0])
+
+    assert contexts.get("laptops") is None
+    contexts.clear()
+    assert embeddings.get("laptops") == [1.0]
+
+
+def graph(versions):
+    """A driver whose GraphMeta node holds versions[0]; bump_graph_version sets a new one."""
+    def handler(query, params):
+        if "MERGE (m:GraphMeta" in query:
+            versions[0] = f"v{int(versions[0][1:]) + 1}"
+        return [{"version": versions[0]}]
+    return FakeDriver(handler)
+
+
+def test_bumping_the_graph_version_invalidates_cached_contexts(monkeypatch, clock):
+    driver = graph(["v1"])
+    monkeypatch.setattr(query_cache, "read_session", driver.session)
+    cache = QueryCache(context_store=MemoryStore())
+    computed = []
+
+    def compute():
+        computed.append(len(computed))
+        return f"context {len(computed)}"
+
+    assert cache.get_context("Which laptops?", compute) == "context 1"
+    assert cache.get_context("which laptops", compute) == "context 1"
+    with driver.session() as session:
+        assert bump_graph_version(session) == "v2"
+
+    # The loading process uses the new version at once, without waiting for the poll
+    assert cache.get_context("Which laptops?", compute) == "context 2"
+    assert cache.stats["context"] == {"hits": 1, "misses": 2}
+
+
+def test_another_processs_load_is_seen_within_the_poll_interval(monkeypatch, clock):
+    versions = ["v1"]
+    driver = graph(versions)
+    monkeypatch.setattr(query_cache, "read_session", driver.session)
+    cache = QueryCache(context_store=MemoryStore())
+    answers = iter(["before the load", "after the load"])
+
+    assert cache.get_context("Which laptops?", lambda: next(answers)) == "before the load"
+    # Another process loads new data
+    versions[0] = "v2"
+
+    clock.value += query_cache.GRAPH_VERSION_POLL_SECONDS - 1
+    assert cache.get_context("Which laptops?", lambda: next(answers)) == "before the load"
+    clock.value += 1
+    assert cache.get_context("Which laptops?", lambda: next(answers)) == "after the load"
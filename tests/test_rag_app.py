@@ -0,0 +1,26 @@
+import logging
+
+import rag_app
+from chat_model import CONVERSATION_PROMPT_TEMPLATE
+from conversation import Conversation
+
+
+def test_retrieval_errors_are_logged(caplog):
+    # The process-wide driver is unavailable in the tests
+    with caplog.at_level(logging.ERROR, logger="rag_app"):
+        context = rag_app.get_relevant_context("Which laptops are available?")
+
+    assert context == "Error retrieving context."
+    assert "Error retrieving context" in caplog.text
+
+
+def test_the_chain_uses_the_shared_conversation_prompt():
+    rag_app.get_rag_chain.cache_clear()
+    conversation = Conversation()
+
+    prompt = rag_app.get_rag_chain().steps[1]
+    answer = rag_app.ask_question("Which laptops are available?", conversation)
+
+    assert prompt.messages[0].prompt.template == CONVERSATION_PROMPT_TEMPLATE
+    assert answer == "This is a canned answer from the fake chat model."
+    assert conversation.turns == [("Which laptops are available?", answer)]
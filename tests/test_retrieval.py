@@ -0,0 +1,102 @@
+import pytest
+
+import query_cache
+import rag_app
+import retrieval
+from tests.fakes import FakeDriver, product_row
+from retrieval import format_context
+
+
+def test_format_context_keeps_top_record_cut_to_a_small_budget():
+    long_description = " ".join(["rugged"] * 200)
+    records = [product_row("p1", "Laptop", context_summary=f"Product: Laptop\nDescription: {long_description}")]
+
+    context = format_context(records, "laptop", token_budget=20)
+
+    assert context.startswith("Product: Laptop")
+    assert context.splitlines()[1].endswith("…")
+    assert "No relevant context found." not in context
+
+
+def test_format_context_says_when_the_budget_leaves_no_room():
+    records = [product_row("p1", "Laptop")]
+
+    context = format_context(records, "laptop", token_budget=1)
+
+    assert context == "Relevant context was found but did not fit the context token budget."
+
+
+def test_format_context_without_records():
+    assert format_context([], "laptop") == "No relevant context found."
+
+
+def indexed_row(product_id, name):
+    return {**product_row(product_id, name), "product_id": product_id}
+
+
+def keyword_handler(query, params):
+    if "GraphMeta" in query:
+        return [{"version": "v1"}]
+    if "UNWIND $terms" in query:
+        return [indexed_row("P1", "Laptop"), indexed_row("P2", "Tablet")]
+    return [indexed_row("P1", "Laptop")]
+
+
+@pytest.mark.parametrize("mode, keyword_queries, products", [("hybrid", 0, ["Laptop"]),
+                                                              ("index", 1, ["Laptop", "Tablet"]),
+                                                              ("exact", 1, ["Laptop", "Tablet"])])
+def test_the_chat_path_adds_keyword_matches_unless_the_search_fuses_them(monkeypatch, mode, keyword_queries,
+                                                                          products):
+    driver = FakeDriver(keyword_handler)
+    monkeypatch.setattr(retrieval, "_retriever", retrieval.Neo4jRetriever(mode=mode))
+    monkeypatch.setattr(rag_app, "read_session", driver.session)
+    monkeypatch.setattr(query_cache, "read_session", driver.session)
+
+    context = rag_app.get_relevant_context("Which tablets are available?")
+
+    assert sum("UNWIND $terms" in query for query, _ in driver.queries) == keyword_queries
+    assert [line[len("Product: "):] for line in context.splitlines() if line.startswith("Product: ")] == products
+
+
+def test_index_search_queries_the_vector_index_with_parameters():
+    embedding = [0.1] * 1536
+
+    query, params = retrieval.build_search(embedding, top_k=3, min_score=0.8, mode="index")
+    filtered_query, filtered_params = retrieval.build_search(embedding, top_k=3, min_score=0.8, category="Laptops",
+                                                             max_price=999.0, mode="index")
+
+    assert "db.index.vector.queryNodes($index_name, $candidates, $embedding)" in query
+    assert params["index_name"] == retrieval.VECTOR_INDEX_NAME
+    assert params["embedding"] == embedding
+    assert (params["top_k"], params["candidates"], params["min_score"]) == (3, 3, 0.8)
+    # Filters are parameters, so the query text never changes with them
+    assert filtered_query == query
+    assert (filtered_params["category"], filtered_params["min_price"], filtered_params["max_price"]) \
+        == ("Laptops", None, 999.0)
+    # Filtered searches over-fetch index candidates, as the index cannot pre-filter
+    assert filtered_params["candidates"] == 3 * retrieval.CANDIDATE_MULTIPLIER
+
+
+def test_exact_search_scores_every_product_with_the_same_parameters():
+    query, params = retrieval.build_search([0.1] * 1536, top_k=3, min_score=0.8, mode="exact")
+
+    assert "db.index.vector" not in query
+    assert "MATCH (p:Product)" in query
+    assert (params["top_k"], params["min_score"]) == (3, 0.8)
+
+
+def test_search_products_runs_one_read_query():
+    driver = FakeDriver(lambda query, params: [indexed_row("P1", "Laptop")])
+
+    with driver.session() as session:
+        records = retrieval.search_products(session, [0.1] * 1536, top_k=3, mode="index", category="Laptops")
+
+    assert [record["product_id"] for record in records] == ["P1"]
+    assert len(driver.queries) == 1
+    assert driver.queries[0][1]["category"] == "Laptops"
+    assert driver.transactions == [("read", retrieval.READ_TIMEOUT or None)]
+
+
+def test_unknown_retrieval_modes_are_rejected():
+    with pytest.raises(ValueError, match="Unknown retrieval mode"):
+        retrieval.build_search([0.1] * 1536, mode="approximate")
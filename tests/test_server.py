@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_core.runnables import RunnableLambda
+
+from async_rag import AsyncRAGPipeline
+from embedding_cache import FakeEmbeddings, Overloaded
+from server import BatchingEmbeddings, create_app
+from tests.fakes import FakeAsyncDriver, product_row
+
+
+def handler(query, params):
+    if "GraphMeta" in query:
+        return [{"version": "v1"}]
+    return [product_row("P1", "Laptop")]
+
+
+def test_ask_runs_on_the_injected_driver_only():
+    driver = FakeAsyncDriver(handler)
+    with TestClient(create_app(embeddings=FakeEmbeddings(), driver=driver)) as client:
+        response = client.post("/ask", json={"question": "What laptops are available?"})
+
+    assert response.status_code == 200
+    assert response.json()["answer"] == "This is a canned answer from the fake chat model."
+    queries = [query for query, _ in driver.queries]
+    assert any("GraphMeta" in query for query in queries)
+    assert any("Product" in query and "GraphMeta" not in query for query in queries)
+    # Every query ran as a read transaction with a timeout
+    assert driver.transactions and all(kind == "read" and timeout for kind, timeout in driver.transactions)
+
+
+def test_retrieve_returns_context_from_the_fake_driver():
+    driver = FakeAsyncDriver(handler)
+    with TestClient(create_app(embeddings=FakeEmbeddings(), driver=driver)) as client:
+        first = client.post("/retrieve", json={"question": "What laptops are available?"})
+        second = client.post("/retrieve", json={"question": "What laptops are available?"})
+
+    assert "Product: Laptop" in first.json()["context"]
+    assert second.json() == first.json()
+    # The second request is served from the context cache, at the same graph version
+    retrievals = [query for query, _ in driver.queries if "GraphMeta" not in query]
+    assert len(retrievals) == 1
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    async def aembed_documents(self, texts):
+        self.batches.append(list(texts))
+        return self.embed_documents(texts)
+
+
+def test_concurrent_query_embeddings_are_coalesced_into_one_call():
+    embeddings = CountingEmbeddings()
+    questions = [f"question {i}" for i in range(5)]
+
+    async def embed_concurrently():
+        batcher = BatchingEmbeddings(embeddings, max_batch_size=8, max_wait_ms=50)
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.aembed_query(question) for question in questions))
+        finally:
+            await batcher.stop()
+
+    vectors = asyncio.run(embed_concurrently())
+
+    assert embeddings.batches == [questions]
+    assert vectors == embeddings.embed_documents(questions)
+
+
+def test_a_full_embedding_queue_is_overloaded():
+    async def embed_without_a_worker():
+        batcher = BatchingEmbeddings(FakeEmbeddings(), max_queue_size=1)
+        first = asyncio.ensure_future(batcher.aembed_query("first"))
+        await asyncio.sleep(0)
+        try:
+            await batcher.aembed_query("second")
+        finally:
+            first.cancel()
+
+    with pytest.raises(Overloaded):
+        asyncio.run(embed_without_a_worker())
+
+
+def test_concurrent_llm_calls_are_capped():
+    calls = {"active": 0, "peak": 0}
+
+    async def answer(prompt):
+        calls["active"] += 1
+        calls["peak"] = max(calls["peak"], calls["active"])
+        await asyncio.sleep(0.01)
+        calls["active"] -= 1
+        return "An answer."
+
+    async def ask_concurrently():
+        pipeline = AsyncRAGPipeline(embeddings=FakeEmbeddings(), llm=RunnableLambda(answer),
+                                    driver=FakeAsyncDriver(handler), max_llm_calls=2)
+        return await asyncio.gather(*(pipeline.ask(f"Which laptop is number {i}?") for i in range(6)))
+
+    answers = asyncio.run(ask_concurrently())
+
+    assert answers == ["An answer."] * 6
+    assert calls["peak"] == 2
+
+
+def test_requests_beyond_the_admission_limit_get_503_with_retry_after():
+    driver = FakeAsyncDriver(handler)
+    app = create_app(embeddings=FakeEmbeddings(), driver=driver)
+    with TestClient(app) as client:
+        app.state.admission.pending = app.state.admission.max_pending
+        rejected = client.post("/ask", json={"question": "What laptops are available?"})
+        app.state.admission.pending = 0
+        accepted = client.post("/ask", json={"question": "What laptops are available?"})
+
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "1"
+    assert accepted.status_code == 200
+
+
+def test_ask_stream_delivers_the_answer_chunks():
+    llm = FakeListChatModel(responses=["Two laptops are stored in Berlin."])
+    with TestClient(create_app(embeddings=FakeEmbeddings(), llm=llm, driver=FakeAsyncDriver(handler))) as client:
+        with client.stream("POST", "/ask/stream", json={"question": "Where are the laptops?"}) as response:
+            chunks = list(response.iter_text())
+        pending = client.app.state.admission.pending
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "".join(chunks) == "Two laptops are stored in Berlin."
+    # The admission slot is released once the stream ends
+    assert pending == 0
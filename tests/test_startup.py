@@ -0,0 +1,67 @@
+import ast
+import os
+import subprocess
+import sys
+
+import pytest
+
+import chat_model
+import database
+import embedding_cache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages that must not be imported before the first question is asked
+HEAVY_MODULES = ("langchain", "langchain_core", "langchain_openai", "numpy", "openai")
+
+
+def app_dependencies() -> list:
+    """The repo modules app.py imports when the page first loads."""
+    with open(os.path.join(ROOT, "app.py")) as f:
+        tree = ast.parse(f.read())
+    modules = {node.module for node in tree.body if isinstance(node, ast.ImportFrom)}
+    return sorted(module for module in modules if os.path.exists(os.path.join(ROOT, f"{module}.py")))
+
+
+@pytest.mark.parametrize("modules", [["retrieval"], ["rag_app"], app_dependencies()],
+                         ids=["retrieval", "rag_app", "app"])
+def test_importing_the_entry_points_pulls_in_no_heavy_modules(modules):
+    # The neo4j driver imports pandas (and numpy) itself when they are installed
+    script = (f"import sys\nimport neo4j\nbefore = set(sys.modules)\nimport {', '.join(modules)}\n"
+              f"print(sorted({{name.split('.')[0] for name in set(sys.modules) - before}}"
+              f" & set({HEAVY_MODULES!r})))")
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, cwd=ROOT,
+                            env={**os.environ, "PYTHONPATH": ROOT})
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+def test_streamlit_reruns_reuse_the_driver_embedder_and_llm(monkeypatch):
+    streamlit = pytest.importorskip("streamlit")
+    from streamlit.testing.v1 import AppTest
+
+    calls = {"driver": 0, "embedder": 0, "llm": 0}
+
+    def counting(name, build):
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            return build(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(database, "warm_up", counting("driver", lambda: object()))
+    monkeypatch.setattr(embedding_cache, "get_embeddings", counting("embedder", embedding_cache.get_embeddings))
+    monkeypatch.setattr(chat_model, "get_llm", counting("llm", chat_model.get_llm))
+    streamlit.cache_resource.clear()
+
+    app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=30)
+    app.run()
+    for question in ["Which products are in stock?", "Where are the laptops stored?"]:
+        app.chat_input[0].set_value(question).run()
+    app.run()
+
+    assert not app.exception
+    assert calls == {"driver": 1, "embedder": 1, "llm": 1}
+    assert len(app.session_state.messages) == 4
+    assert len(app.session_state.conversation.turns) == 2
+    streamlit.cache_resource.clear()
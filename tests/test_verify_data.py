@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import verify_data
+from embedding_cache import EMBEDDING_DIMENSIONS
+
+
+def index(name, state="ONLINE", dimensions=None, populated=100.0):
+    return {"name": name, "type": "VECTOR" if dimensions else "RANGE", "labelsOrTypes": ["Product"],
+            "properties": ["id"], "state": state, "populationPercent": populated, "dimensions": dimensions}
+
+
+HEALTHY_INDEXES = [index("product_context_stale"),
+                   index(verify_data.VECTOR_INDEX_NAME, dimensions=EMBEDDING_DIMENSIONS)]
+
+
+@pytest.fixture
+def fake_read(monkeypatch):
+    """Answer verify_data's read() from a dict of query -> rows, recording the queries."""
+    queries = []
+
+    def configure(results):
+        def read(query, **params):
+            queries.append(query)
+            return results[query]
+        monkeypatch.setattr(verify_data, "read", read)
+        return queries
+    return configure
+
+
+def test_count_store_statistics_counts_each_label_and_type(fake_read):
+    fake_read({
+        "CALL db.labels() YIELD label RETURN label ORDER BY label": [{"label": "Product"}, {"label": "Odd`Label"}],
+        "CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType ORDER BY relationshipType":
+            [{"relationshipType": "SUPPLIES"}],
+        "MATCH (n:`Product`) RETURN count(n) AS count": [{"count": 5}],
+        # Backticks in names are escaped, so a label cannot break out of the query
+        "MATCH (n:`Odd``Label`) RETURN count(n) AS count": [{"count": 1}],
+        "MATCH ()-[r:`SUPPLIES`]->() RETURN count(r) AS count": [{"count": 7}],
+    })
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        statistics = verify_data.count_store_statistics(executor)
+
+    assert statistics == {"nodes": {"Product": 5, "Odd`Label": 1}, "relationships": {"SUPPLIES": 7}}
+
+
+def test_healthy_indexes_have_no_problems():
+    assert verify_data.index_problems(HEALTHY_INDEXES) == []
+
+
+@pytest.mark.parametrize("indexes, problem", [
+    ([index("product_fulltext", state="POPULATING", populated=42.4), *HEALTHY_INDEXES],
+     "index product_fulltext is POPULATING (42% populated)"),
+    ([index("product_context_stale")], f"vector index {verify_data.VECTOR_INDEX_NAME} does not exist"),
+    ([index(verify_data.VECTOR_INDEX_NAME, dimensions=EMBEDDING_DIMENSIONS * 2)],
+     f"vector index {verify_data.VECTOR_INDEX_NAME} has {EMBEDDING_DIMENSIONS * 2} dimensions"),
+])
+def test_index_problems_are_reported(indexes, problem):
+    problems = verify_data.index_problems(indexes)
+
+    assert len(problems) == 1
+    assert problems[0].startswith(problem)
+
+
+def test_verify_data_reports_sampled_quality_problems(fake_read, capsys):
+    fake_read({
+        verify_data.INDEX_QUERY: HEALTHY_INDEXES,
+        verify_data.STALE_SUMMARIES_QUERY: [{"count": 2}],
+        verify_data.SAMPLE_PRODUCTS_QUERY: [{"name": "Laptop", "description": "A laptop"}],
+        "CALL db.labels() YIELD label RETURN label ORDER BY label": [{"label": "Product"}],
+        "CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType ORDER BY relationshipType": [],
+        "MATCH (n:`Product`) RETURN count(n) AS count": [{"count": 10}],
+        verify_data.QUALITY_QUERY: [{"sampled": 10, "missing_embedding": 1, "wrong_dimension": 0, "orphaned": 3,
+                                     "examples": ["P9"]}],
+    })
+
+    problems = verify_data.verify_data(sample_size=100, workers=2)
+
+    assert problems == ["1 sampled products without an embedding", "3 sampled products with no supplier or warehouse"]
+    output = capsys.readouterr().out
+    assert "Missing embeddings: 1 (e.g. P9)" in output
+    assert "Stale context summaries (all products): 2" in output
@@ -1,59 +1,206 @@
-from neo4j import GraphDatabase
+from concurrent.futures import ThreadPoolExecutor
+from neo4j import unit_of_work
 from dotenv import load_dotenv
+from database import close_driver, read_session
+from embedding_cache import EMBEDDING_DIMENSIONS
+import argparse
 import os
+import random
+import sys
 
 # Load environment variables
 load_dotenv()
 
-# Neo4j connection details
-uri = os.getenv("NEO4J_URI")
-username = os.getenv("NEO4J_USERNAME")
-password = os.getenv("NEO4J_PASSWORD")
+# Products inspected by the data-quality checks
+VERIFY_SAMPLE_SIZE = int(os.getenv("VERIFY_SAMPLE_SIZE", "1000"))
+# Server-side timeout for each verification query, in seconds
+VERIFY_TIMEOUT = float(os.getenv("VERIFY_TIMEOUT", "10"))
+VERIFY_WORKERS = int(os.getenv("VERIFY_WORKERS", "4"))
+
+VECTOR_INDEX_NAME = "product_description_embeddings"
+
+# Constant-time counts: a single label or relationship type with no property
+# predicates is answered from the count store
+LABEL_COUNT_QUERY = "MATCH (n:`{label}`) RETURN count(n) AS count"
+RELATIONSHIP_COUNT_QUERY = "MATCH ()-[r:`{type}`]->() RETURN count(r) AS count"
+
+# Quality checks on a window of products at a random offset; the label scan
+# skips ahead without reading properties
+QUALITY_QUERY = """
+    MATCH (p:Product)
+    WITH p SKIP $offset LIMIT $sample_size
+    RETURN count(p) AS sampled,
+           sum(CASE WHEN p.description_embedding IS NULL THEN 1 ELSE 0 END) AS missing_embedding,
+           sum(CASE WHEN size(p.description_embedding) <> $dimensions THEN 1 ELSE 0 END) AS wrong_dimension,
+           sum(CASE WHEN NOT EXISTS { (p)<-[:SUPPLIES]-(:Supplier) }
+                     AND NOT EXISTS { (p)-[:STORED_AT]->(:Warehouse) } THEN 1 ELSE 0 END) AS orphaned,
+           collect(CASE WHEN p.description_embedding IS NULL THEN p.id END)[..5] AS examples
+"""
+
+# Exact, through the product_context_stale index
+STALE_SUMMARIES_QUERY = "MATCH (p:Product) WHERE p.context_stale = true RETURN count(p) AS count"
+
+INDEX_QUERY = """
+    SHOW INDEXES YIELD name, type, entityType, labelsOrTypes, properties, state, populationPercent, options
+    RETURN name, type, labelsOrTypes, properties, state, populationPercent,
+           options.indexConfig['vector.dimensions'] AS dimensions
+    ORDER BY name
+"""
+
+# Legacy full-graph scans, exact for multi-label nodes but slow on large graphs
+FULL_NODE_COUNT_QUERY = """
+    MATCH (n)
+    RETURN labels(n) as label, count(*) as count
+    ORDER BY label
+"""
+FULL_RELATIONSHIP_COUNT_QUERY = """
+    MATCH ()-[r]->()
+    RETURN type(r) as type, count(*) as count
+    ORDER BY type
+"""
+
+SAMPLE_PRODUCTS_QUERY = """
+    MATCH (p:Product)
+    RETURN p.name as name, p.description as description
+    LIMIT 5
+"""
+
+
+def _escape(name: str) -> str:
+    return name.replace("`", "``")
+
+
+@unit_of_work(timeout=VERIFY_TIMEOUT)
+def _read_records(tx, query: str, params: dict) -> list:
+    return [record.data() for record in tx.run(query, params)]
+
+
+def read(query: str, **params) -> list:
+    """Run one read query in its own READ session (routed to a reader in a cluster)."""
+    with read_session() as session:
+        return session.execute_read(_read_records, query, params)
+
+
+def count_store_statistics(executor) -> dict:
+    """Node counts per label and relationship counts per type, from the count store."""
+    labels = [row["label"] for row in read("CALL db.labels() YIELD label RETURN label ORDER BY label")]
+    types = [row["relationshipType"] for row in read(
+        "CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType ORDER BY relationshipType")]
+    node_counts = executor.map(lambda label: read(LABEL_COUNT_QUERY.format(label=_escape(label)))[0]["count"],
+                               labels)
+    relationship_counts = executor.map(
+        lambda rel_type: read(RELATIONSHIP_COUNT_QUERY.format(type=_escape(rel_type)))[0]["count"], types)
+    return {"nodes": dict(zip(labels, node_counts)), "relationships": dict(zip(types, relationship_counts))}
+
+
+def quality_checks(product_count: int, sample_size: int = None) -> dict:
+    """Sampled checks for missing or wrongly sized embeddings and orphaned products."""
+    sample_size = sample_size or VERIFY_SAMPLE_SIZE
+    offset = random.randint(0, max(product_count - sample_size, 0))
+    result = read(QUALITY_QUERY, offset=offset, sample_size=sample_size, dimensions=EMBEDDING_DIMENSIONS)[0]
+    return dict(result, offset=offset)
+
+
+def index_status() -> list:
+    return read(INDEX_QUERY)
+
+
+def index_problems(indexes: list) -> list:
+    """Indexes not ONLINE, and a missing or wrongly sized vector index."""
+    problems = [f"index {index['name']} is {index['state']} ({index['populationPercent']:.0f}% populated)"
+                for index in indexes if index["state"] != "ONLINE"]
+    vector = next((index for index in indexes if index["name"] == VECTOR_INDEX_NAME), None)
+    if vector is None:
+        problems.append(f"vector index {VECTOR_INDEX_NAME} does not exist")
+    elif vector["dimensions"] != EMBEDDING_DIMENSIONS:
+        problems.append(f"vector index {VECTOR_INDEX_NAME} has {vector['dimensions']} dimensions, "
+                        f"EMBEDDING_DIMENSIONS is {EMBEDDING_DIMENSIONS}")
+    return problems
+
+
+def verify_data(sample_size: int = None, workers: int = None) -> list:
+    """Print graph statistics and data-quality checks. Returns the problems found."""
+    with ThreadPoolExecutor(max_workers=workers or VERIFY_WORKERS) as executor:
+        # Independent lookups run concurrently, each in its own read session
+        indexes = executor.submit(index_status)
+        stale = executor.submit(read, STALE_SUMMARIES_QUERY)
+        samples = executor.submit(read, SAMPLE_PRODUCTS_QUERY)
+        statistics = count_store_statistics(executor)
+        quality = quality_checks(statistics["nodes"].get("Product", 0), sample_size)
+        indexes, stale, samples = indexes.result(), stale.result()[0]["count"], samples.result()
+
+    print("\nNode Counts:")
+    for label, count in statistics["nodes"].items():
+        print(f"{label}: {count}")
+
+    print("\nRelationship Counts:")
+    for rel_type, count in statistics["relationships"].items():
+        print(f"{rel_type}: {count}")
+
+    print(f"\nData Quality (sample of {quality['sampled']} products from offset {quality['offset']}):")
+    print(f"Missing embeddings: {quality['missing_embedding']}"
+          + (f" (e.g. {', '.join(map(str, quality['examples']))})" if quality["examples"] else ""))
+    print(f"Embeddings without {EMBEDDING_DIMENSIONS} dimensions: {quality['wrong_dimension']}")
+    print(f"Products with no supplier or warehouse: {quality['orphaned']}")
+    print(f"Stale context summaries (all products): {stale}")
+
+    print("\nIndexes:")
+    for index in indexes:
+        print(f"{index['name']} ({index['type']}): {index['state']}, {index['populationPercent']:.0f}% populated")
+
+    print("\nSample Products:")
+    for record in samples:
+        print(f"Name: {record['name']}")
+        print(f"Description: {record['description']}\n")
+
+    problems = index_problems(indexes)
+    for check, description in (("missing_embedding", "sampled products without an embedding"),
+                               ("wrong_dimension", "sampled embeddings with the wrong dimension"),
+                               ("orphaned", "sampled products with no supplier or warehouse")):
+        if quality[check]:
+            problems.append(f"{quality[check]} {description}")
+    if problems:
+        print("Problems:")
+        for problem in problems:
+            print(f"- {problem}")
+    else:
+        print("No problems found.")
+    return problems
+
+
+def verify_data_full_scan():
+    """Exact counts by scanning every node and relationship (slow on large graphs)."""
+    with read_session() as session:
+        print("\nNode Counts:")
+        for record in session.run(FULL_NODE_COUNT_QUERY):
+            print(f"{record['label']}: {record['count']}")
+
+        print("\nRelationship Counts:")
+        for record in session.run(FULL_RELATIONSHIP_COUNT_QUERY):
+            print(f"{record['type']}: {record['count']}")
+
+        print("\nSample Products:")
+        for record in session.run(SAMPLE_PRODUCTS_QUERY):
+            print(f"Name: {record['name']}")
+            print(f"Description: {record['description']}\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report graph statistics and data-quality problems.")
+    parser.add_argument("--sample-size", type=int, help="products inspected by the quality checks")
+    parser.add_argument("--full-scan", action="store_true",
+                        help="count by scanning the whole graph instead (slow on large graphs)")
+    args = parser.parse_args()
 
-def verify_data():
     try:
-        # Connect to Neo4j
-        driver = GraphDatabase.driver(uri, auth=(username, password))
-        
-        with driver.session() as session:
-            # Count nodes by label
-            result = session.run("""
-                MATCH (n)
-                RETURN labels(n) as label, count(*) as count
-                ORDER BY label
-            """)
-            
-            print("\nNode Counts:")
-            for record in result:
-                print(f"{record['label']}: {record['count']}")
-            
-            # Count relationships by type
-            result = session.run("""
-                MATCH ()-[r]->()
-                RETURN type(r) as type, count(*) as count
-                ORDER BY type
-            """)
-            
-            print("\nRelationship Counts:")
-            for record in result:
-                print(f"{record['type']}: {record['count']}")
-            
-            # Sample data verification
-            result = session.run("""
-                MATCH (p:Product)
-                RETURN p.name as name, p.description as description
-                LIMIT 5
-            """)
-            
-            print("\nSample Products:")
-            for record in result:
-                print(f"Name: {record['name']}")
-                print(f"Description: {record['description']}\n")
-            
+        if args.full_scan:
+            verify_data_full_scan()
+            problems = []
+        else:
+            problems = verify_data(args.sample_size)
     except Exception as e:
         print(f"Error verifying data: {e}")
+        problems = [str(e)]
     finally:
-        driver.close()
-
-if __name__ == "__main__":
-    verify_data() 
\ No newline at end of file
+        close_driver()
+    sys.exit(1 if problems else 0)